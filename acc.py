@@ -1,26 +1,108 @@
 import streamlit as st
 import pandas as pd
+import numpy as np
 import json
-from streamlit_folium import st_folium
-import folium
-import folium
-from folium import plugins
-import branca.colormap as cm
-import plotly.express as px
-import plotly.graph_objects as go
-from datetime import datetime
-import calendar
 from pathlib import Path
-import branca.element as be
+import aggregate
+import charts
+import datastore
+import forecast
+import hotspots
+import instrument
+import mapcache
+import materialize
+import query
+import refresher
+import sketch
+import temporal
+import uncertainty
+import validate
+
+def create_base_map():
+    import folium
+
+    return folium.Map(
+        location=[25.2867, 51.5333],
+        zoom_start=11,
+        tiles='CartoDB dark_matter',
+        prefer_canvas=True
+    )
+
+def session_base_map():
+    # One base map per session, so st_folium keeps it mounted and only swaps the zone layer.
+    # Not shared across sessions: st_folium adds to the map while rendering it
+    if 'accident_base_map' not in st.session_state:
+        st.session_state['accident_base_map'] = create_base_map()
+    return st.session_state['accident_base_map']
+
+def zone_labels(values):
+    # Zone IDs as integer strings, 'Unknown' when not a zone number
+    zone = pd.to_numeric(values.astype(str).str.strip(), errors='coerce')
+    zone = np.trunc(zone.where(np.isfinite(zone) & (zone >= 0)))
+    return zone.astype('Int64').astype(str).where(zone.notna(), 'Unknown')
+
+def clean_accidents(df):
+    # Normalize zone IDs and derive the hour of day (NaN for bad times), parsing each distinct value once
+    df['ZONE'] = validate.by_value(df['ZONE'], zone_labels, missing='Unknown')
+    df['HOUR'] = validate.by_value(df['ACCIDENT_TIME'], validate.parse_hour)
+    return df
+
+def ingest_accidents(df, zones_data=None):
+    """Quarantine invalid raw rows, then clean the rest; returns (df, validate.Report)"""
+    df, report = validate.accidents(df, zones_data)
+    return clean_accidents(df), report
+
+@st.cache_resource
+def build_temporal_cube(version, _df, accidents_file='facc.csv'):
+    # Prefer the cube built by `python materialize.py` for this file version
+    arrays = materialize.load_arrays('temporal_cube', (accidents_file,))
+    if arrays is not None:
+        return temporal.TemporalCube.from_arrays(arrays)
+    return temporal.TemporalCube.from_accidents(_df)
+
+@st.cache_resource
+def build_accident_sketches(version, _df, sources=materialize.ACCIDENT_SOURCES):
+    # Prefer the sketches `python materialize.py` streamed from the raw file
+    arrays = materialize.load_arrays('accident_sketches', sources)
+    if arrays is not None:
+        return sketch.AccidentSketches.from_arrays(arrays)
+    return sketch.AccidentSketches.from_frame(_df)
+
+@st.cache_resource
+def build_query_index(version, _df):
+    return query.AccidentIndex(_df)
+
+@st.cache_resource
+def build_severity_counts(version, category, _df):
+    # Severity mix per category value, grouped once per data version rather than on every rerun
+    return aggregate.groupby(_df, [category, 'ACCIDENT_SEVERITY'])['COUNT'].unstack().fillna(0)
+
+@st.cache_resource
+def build_zone_adjacency(version, _zones_data):
+    return hotspots.load_adjacency(_zones_data, version)
 
 class QatarAccidentsStreamlit:
     def __init__(self, accidents_file='facc.csv', polygons_file='qatar_zones_polygons.json'):
         self.accidents_file = accidents_file
         self.polygons_file = polygons_file
         self.df = None
+        self.quality = None
         self.zones_data = None
+        self.zone_geometry = None
         self.zone_names = self.initialize_zone_names()
         self.current_year = None
+        self.data_version = datastore.dataset_version(accidents_file, polygons_file, 'zone_names.json')
+        self.map_metrics = {'accidents': 'Accidents', 'deaths': 'Deaths'}
+        self.drill_labels = {
+            'ACCIDENT_YEAR': 'Years',
+            'ZONE': 'Zones',
+            'HOUR': 'Hour',
+            'ACCIDENT_SEVERITY': 'Severity',
+            'ACCIDENT_NATURE': 'Nature',
+            'ACCIDENT_REASON': 'Reason',
+            'NATIONALITY_GROUP_OF_ACCIDENT_': 'Nationality',
+            'AGE_BAND': 'Age Band'
+        }
         
         # Color scheme
         self.colors = {
@@ -46,91 +128,105 @@ class QatarAccidentsStreamlit:
             st.warning(f"Could not load zone names: {e}")
             return {}
 
+    @instrument.timed('load')
     def load_data(self):
         # Check if accidents file exists
         if not Path(self.accidents_file).is_file():
             st.error(f"Accidents file '{self.accidents_file}' not found. Please ensure the file is available.")
             return
         
-        # Load accidents data
-        self.df = pd.read_csv(self.accidents_file, skipinitialspace=True)
-        
-        # Clean data
-        self.df['ZONE'] = self.df['ZONE'].astype(str).str.strip()
-        self.df['ZONE'] = self.df['ZONE'].apply(lambda x: 
-            str(int(float(x))) if x.replace('.', '').isdigit() else 'Unknown')
-        
-        # Convert time to hour
-        self.df['HOUR'] = self.df['ACCIDENT_TIME'].str.extract('(\d+)').astype(float)
-        
-        # Set current year to the most recent year
-        self.current_year = self.df['ACCIDENT_YEAR'].max()
-        
-        # Check if polygons file exists
+        # Load polygon data first; rows are validated against its zone IDs
         if not Path(self.polygons_file).is_file():
             st.warning(f"Polygon file '{self.polygons_file}' not found. Please ensure the file is available.")
-            return
-        
-        # Load polygon data
-        try:
-            with open(self.polygons_file, 'r') as f:
-                self.zones_data = json.load(f)
-        except Exception as e:
-            st.warning(f"Could not load polygon data: {e}")
-
-    def create_map(self, year):
-        # Create base map
-        m = folium.Map(
-            location=[25.2867, 51.5333],
-            zoom_start=11,
-            tiles='CartoDB dark_matter',
-            prefer_canvas=True
-        )
-        
-        # Get accident counts for the selected year
-        year_data = self.df[self.df['ACCIDENT_YEAR'] == year]
-        zone_counts = year_data['ZONE'].value_counts().to_dict()
-        max_count = max(zone_counts.values()) if zone_counts else 1
-        
-        # Create color scale
-        colormap = cm.LinearColormap(
-            colors=['#ff00ff', '#00ffff', '#ff0000'],
-            vmin=0,
-            vmax=max_count
-        )
-        
-        # Add zones to map
-        for zone, count in zone_counts.items():
+        else:
             try:
-                if zone.lower() == 'unknown':
-                    continue
-                    
-                zone_int = str(int(float(zone)))
-                zone_data = self.zones_data.get(zone_int)
-                zone_name = self.zone_names.get(zone_int, f'Zone {zone_int}')
-                
-                if zone_data:
-                    coordinates = [[p['lat'], p['lng']] for p in zone_data['coordinates']]
-                    opacity = 0.2 + (count / max_count * 0.8)
-                    
-                    folium.Polygon(
-                        locations=coordinates,
-                        weight=0,
-                        fill=True,
-                        fill_color=colormap(count),
-                        fill_opacity=opacity,
-                        popup=f'{zone_name}<br>Accidents: {count}',
-                        tooltip=zone_name
-                    ).add_to(m)
-                    
+                with open(self.polygons_file, 'r') as f:
+                    self.zones_data = json.load(f)
             except Exception as e:
-                st.error(f"Error processing zone {zone}: {str(e)}")
-                
-        # Add the color scale
-        colormap.add_to(m)
+                st.warning(f"Could not load polygon data: {e}")
         
+        # Load the materialized table when one matches the files, else validate and clean the CSV
+        sources = (self.accidents_file, self.polygons_file)
+        version = datastore.dataset_version(*sources)
+        self.df = materialize.load_table('accidents_table', sources)
+        self.quality = validate.Report.load('accidents', version)
+        if self.df is None or self.quality is None:
+            try:
+                self.df, self.quality = ingest_accidents(
+                    pd.read_csv(self.accidents_file, skipinitialspace=True), self.zones_data
+                )
+            except validate.SchemaError as e:
+                st.error(str(e))
+                self.df = None
+                return
+            self.quality.save(version)
+        
+        # Set current year to the most recent year
+        self.current_year = self.df['ACCIDENT_YEAR'].max()
+
+    def mapped_zones(self, zones):
+        # Mask of the zones with a polygon; rows in other zones count towards the totals but not the zone views
+        zones = pd.Index(zones)
+        if self.zones_data:
+            return zones.isin([str(int(zone)) for zone in validate.zone_ids(self.zones_data)])
+        return zones != 'Unknown'
+
+    def zone_values(self, year, metric):
+        # Per-zone value of the selected metric for one year
+        year_data = self.df[(self.df['ACCIDENT_YEAR'] == year) & self.mapped_zones(self.df['ZONE'])]
+        if metric == 'deaths':
+            values = year_data.groupby('ZONE')['DEATH_COUNT'].sum()
+        else:
+            values = year_data['ZONE'].value_counts()
+        return {str(zone): int(value) for zone, value in values.items()}
+
+    def choropleth(self, year, metric='accidents'):
+        # Styled zone GeoJSON for (data version, year, metric), built once and cached on disk
+        def build():
+            if self.zone_geometry is None:
+                # Simplified rings from `python materialize.py` when they match the polygon file
+                self.zone_geometry = materialize.load_json('zone_geometry', (self.polygons_file,))
+            if self.zone_geometry is None:
+                self.zone_geometry = mapcache.zone_geometry(self.zones_data or {})
+            return mapcache.build_choropleth(
+                self.zone_values(year, metric),
+                self.zone_geometry,
+                self.zone_names,
+                self.map_metrics[metric]
+            )
+
+        return mapcache.cached_choropleth(self.data_version, year, metric, build)
+
+    @instrument.timed('render')
+    def create_zone_layer(self, year, metric='accidents'):
+        import folium
+
+        payload = self.choropleth(year, metric)
+        layer = folium.FeatureGroup(name=self.map_metrics[metric])
+        folium.GeoJson(
+            payload,
+            style_function=lambda feature: feature['properties']['style'],
+            tooltip=folium.GeoJsonTooltip(fields=['name'], labels=False),
+            popup=folium.GeoJsonPopup(fields=['popup'], labels=False)
+        ).add_to(layer)
+        return layer
+
+    @instrument.timed('render')
+    def create_map(self, year, metric='accidents'):
+        # Mapping libraries are imported on first use to keep cold starts fast
+        import branca.colormap as cm
+
+        # Standalone map with the zone layer and colour scale embedded
+        m = create_base_map()
+        self.create_zone_layer(year, metric).add_to(m)
+        cm.LinearColormap(
+            colors=mapcache.COLOR_STOPS,
+            vmin=0,
+            vmax=self.choropleth(year, metric)['vmax']
+        ).add_to(m)
         return m
 
+    @instrument.timed('aggregate')
     def calculate_metrics(self):
         # Calculate annual average accidents from 2020 onwards
         recent_data = self.df[self.df['ACCIDENT_YEAR'] >= 2020]
@@ -154,6 +250,87 @@ class QatarAccidentsStreamlit:
             'total_accidents': total_accidents
         }
 
+    @instrument.timed('aggregate')
+    def metric_intervals(self):
+        # 95% intervals for calculate_metrics, resampled from (recent, pedestrian, deaths) cell counts
+        def compute():
+            cells = pd.DataFrame({
+                'recent': self.df['ACCIDENT_YEAR'] >= 2020,
+                'pedestrian': self.df['ACCIDENT_NATURE'] == 'COLLISION WITH PEDESTRIANS',
+                'deaths': self.df['DEATH_COUNT'].fillna(0)
+            }).value_counts()
+            keys = cells.index.to_frame(index=False)
+            recent_years = max(self.df.loc[self.df['ACCIDENT_YEAR'] >= 2020, 'ACCIDENT_YEAR'].nunique(), 1)
+            # One column per metric, in calculate_metrics order
+            weights = np.column_stack([
+                keys['recent'] / recent_years,
+                keys['deaths'],
+                keys['deaths'] * keys['pedestrian'],
+                np.ones(len(keys))
+            ])
+            low, high = uncertainty.linear_intervals(cells.to_numpy(), weights)
+            names = ['annual_avg', 'total_deaths', 'pedestrian_deaths', 'total_accidents']
+            return {name: [float(l), float(h)] for name, l, h in zip(names, low, high)}
+
+        return uncertainty.cached('accident_metrics', self.data_version, {}, compute)
+
+    @instrument.timed('aggregate')
+    def zone_rank_intervals(self, year, top=8):
+        # Count intervals, rank ranges and the chance of being in the top zones, per zone for one year
+        def compute():
+            counts = self.df.loc[(self.df['ACCIDENT_YEAR'] == year) & self.mapped_zones(self.df['ZONE']), 'ZONE'].value_counts()
+            low, high = uncertainty.poisson_interval(counts.to_numpy())
+            ranks = uncertainty.rank_intervals(counts.to_numpy(), top)
+            return {
+                str(zone): {
+                    'low': float(low[i]), 'high': float(high[i]),
+                    'rank_low': int(ranks['rank_low'][i]), 'rank_high': int(ranks['rank_high'][i]),
+                    'p_top': float(ranks['p_top'][i])
+                }
+                for i, zone in enumerate(counts.index)
+            }
+
+        return uncertainty.cached('zone_ranks', self.data_version, {'year': int(year), 'top': top}, compute)
+
+    @instrument.timed('aggregate')
+    def temporal_cube(self):
+        # Year x zone x weekday x hour counts, built once per data version
+        return build_temporal_cube(self.data_version, self.df, self.accidents_file)
+
+    @instrument.timed('aggregate')
+    def sketches(self):
+        # Distinct perpetrators per (year, zone) and weekly top categories, in bounded memory
+        return build_accident_sketches(self.data_version, self.df, (self.accidents_file, self.polygons_file))
+
+    @instrument.timed('aggregate')
+    def query_index(self):
+        # Bitmap indexes over every drill-down dimension, built once per data version
+        return build_query_index(self.data_version, self.df)
+
+    @instrument.timed('aggregate')
+    def hotspot_table(self, year, hour=None):
+        # Getis-Ord Gi* and local Moran's I over zone adjacency for one year (and hour)
+        zones, weights = build_zone_adjacency(
+            datastore.dataset_version(self.polygons_file), self.zones_data or {}
+        )
+        cube = self.temporal_cube()
+        counts = cube.counts[cube.year_index[year]].sum(axis=1)
+        values = counts[:, hour] if hour is not None else counts.sum(axis=1)
+        x = hotspots.zone_matrix(dict(zip(cube.zones, values)), zones)
+        return hotspots.hotspot_table(zones, weights, x, self.zone_names)
+
+    def forecast_version(self):
+        # Forecasts depend on the accidents file only, matching `python forecast.py`
+        return datastore.dataset_version(self.accidents_file)
+
+    def forecast_store(self, build=False):
+        # Per-zone forecasts are fitted offline (python forecast.py) or on request
+        store = forecast.ForecastStore()
+        if build and not store.is_current(self.forecast_version()):
+            with instrument.stage('fit_forecasts', 'aggregate'):
+                store.update(self.df, self.forecast_version())
+        return store
+
     def format_number(self, num):
         if num >= 1_000_000:
             return f'{num/1_000_000:.1f}M+'
@@ -162,9 +339,10 @@ class QatarAccidentsStreamlit:
         else:
             return str(num)
 
-    def run_dashboard(self):
-        # Set page config
-        st.set_page_config(page_title="TraffiiQ", page_icon="🚗", layout="wide")
+    def run_dashboard(self, standalone=True):
+        # Page config and the home link belong to the standalone app; traffiq.py owns both when mounted as a page
+        if standalone:
+            st.set_page_config(page_title="TraffiiQ", page_icon="🚗", layout="wide")
 
         # Custom CSS
         st.markdown("""
@@ -197,29 +375,40 @@ class QatarAccidentsStreamlit:
         """, unsafe_allow_html=True)
 
         # Home button
-        st.markdown("""
-        <a href="https://traffiq.streamlit.app/" class="home-button">
-            <span class="home-button-icon">🏠</span>
-            <span>Home</span>
-        </a>
-        """, unsafe_allow_html=True)
+        if standalone:
+            st.markdown("""
+            <a href="https://traffiq.streamlit.app/" class="home-button">
+                <span class="home-button-icon">🏠</span>
+                <span>Home</span>
+            </a>
+            """, unsafe_allow_html=True)
 
         # Title
         st.markdown("<h1 style='text-align: center; color: #00FFFF;'>TraffiiQ</h1>", unsafe_allow_html=True)
         
+        # Rows left out at ingest and any polygon problems
+        validate.show(self.quality, 'accident')
+
+        # Plotting and map widgets are imported after the page shell has rendered
+        import plotly.express as px
+        from streamlit_folium import st_folium
+
         # Calculate metrics
         metrics = self.calculate_metrics()
+        intervals = self.metric_intervals()
         
-        # Metrics row
+        # Metrics row, each with its 95% interval
         col1, col2, col3, col4 = st.columns(4)
-        with col1:
-            st.metric("Annual Avg. Accidents (2020+)", self.format_number(metrics['annual_avg']))
-        with col2:
-            st.metric("Total Deaths", self.format_number(metrics['total_deaths']))
-        with col3:
-            st.metric("Pedestrian Collision Deaths", self.format_number(metrics['pedestrian_deaths']))
-        with col4:
-            st.metric("Total Accidents", self.format_number(metrics['total_accidents']))
+        for column, label, key in [
+            (col1, "Annual Avg. Accidents (2020+)", 'annual_avg'),
+            (col2, "Total Deaths", 'total_deaths'),
+            (col3, "Pedestrian Collision Deaths", 'pedestrian_deaths'),
+            (col4, "Total Accidents", 'total_accidents')
+        ]:
+            with column:
+                st.metric(label, self.format_number(metrics[key]))
+                low, high = intervals[key]
+                st.caption(f"95% CI {low:,.0f} – {high:,.0f}")
 
         # Main content
         col_map, col_stats = st.columns([2, 1])
@@ -232,19 +421,51 @@ class QatarAccidentsStreamlit:
                 index=len(self.df['ACCIDENT_YEAR'].unique()) - 1
             )
             
-            # Create and display map using streamlit-folium
-            st_map = self.create_map(year)
-            st_folium(st_map, width=900, height=500)
+            metric = st.radio(
+                'Map Metric:',
+                list(self.map_metrics),
+                format_func=self.map_metrics.get,
+                horizontal=True
+            )
+            
+            # Only the cached zone layer changes between years; the base map stays mounted
+            zone_layer = self.create_zone_layer(year, metric)
+            with instrument.stage('st_folium', 'render'):
+                st_folium(
+                    session_base_map(),
+                    key='accident_map',
+                    feature_group_to_add=zone_layer,
+                    returned_objects=[],
+                    width=900,
+                    height=500
+                )
+            
+            # Colour scale legend
+            vmax = self.choropleth(year, metric)['vmax']
+            st.markdown(f"""
+            <div style='display: flex; align-items: center; gap: 8px; font-size: 0.8em;'>
+                <span>0</span>
+                <div style='flex: 1; height: 8px; border-radius: 4px;
+                    background: linear-gradient(to right, {', '.join(mapcache.COLOR_STOPS)});'></div>
+                <span>{vmax:,} {self.map_metrics[metric].lower()}</span>
+            </div>
+            """, unsafe_allow_html=True)
 
         with col_stats:
             st.markdown("<h3 style='color: #FF00FF;'>Zone Statistics</h3>", unsafe_allow_html=True)
             
             # Zone statistics
-            year_data = self.df[self.df['ACCIDENT_YEAR'] == year]
-            zone_counts = year_data['ZONE'].value_counts().sort_values(ascending=False).head(8)
+            with instrument.stage('zone_counts', 'aggregate'):
+                year_data = self.df[(self.df['ACCIDENT_YEAR'] == year) & self.mapped_zones(self.df['ZONE'])]
+                zone_counts = year_data['ZONE'].value_counts().sort_values(ascending=False).head(8)
+                perpetrators = self.sketches().distinct_by_zone({int(year)})
+                ranks = self.zone_rank_intervals(year)
             
             for zone, count in zone_counts.items():
                 zone_name = self.zone_names.get(str(zone), f'Zone {zone}')
+                distinct = perpetrators.get(str(zone))
+                rank = ranks[str(zone)]
+                rank_range = f"#{rank['rank_low']}" if rank['rank_low'] == rank['rank_high'] else f"#{rank['rank_low']}–{rank['rank_high']}"
                 st.markdown(f"""
                 <div style='
                     margin-bottom: 10px;
@@ -252,10 +473,12 @@ class QatarAccidentsStreamlit:
                     background-color: rgba(255, 0, 255, 0.1);
                     border-radius: 5px;
                 '>
-                    <div style='color: #00FFFF;'>{zone_name}</div>
-                    <div style='font-size: 0.9em;'>Accidents: {count}</div>
+                    <div style='color: #00FFFF;'>{zone_name} <span style='opacity: 0.7;'>{rank_range}</span></div>
+                    <div style='font-size: 0.9em;'>Accidents: {count} ({rank['low']:,.0f}–{rank['high']:,.0f}){f' · ~{distinct:,.0f} perpetrators' if distinct else ''}</div>
                 </div>
                 """, unsafe_allow_html=True)
+            st.caption("Ranges are 95% intervals; a rank range shows how far a zone could move by chance. "
+                       "Perpetrators are distinct birth year and nationality pairs, estimated with HyperLogLog.")
 
         # Additional visualizations
         st.markdown("<h3 style='color: #FF00FF; margin-top: 20px;'>Additional Insights</h3>", unsafe_allow_html=True)
@@ -270,51 +493,296 @@ class QatarAccidentsStreamlit:
                 format_func=lambda x: x.replace('_', ' ').title()
             )
             
-            severity_counts = self.df.groupby([category, 'ACCIDENT_SEVERITY']).size().unstack().fillna(0)
-            fig_severity = px.bar(
-                severity_counts, 
-                barmode='stack',
-                title='Accident Severity by ' + category.replace('_', ' ').title()
+            with instrument.stage('severity_counts', 'aggregate'):
+                severity_counts = build_severity_counts(self.data_version, category, self.df)
+            with instrument.stage('severity_chart', 'render') as stage:
+                fig_severity = px.bar(
+                    severity_counts, 
+                    barmode='stack',
+                    title='Accident Severity by ' + category.replace('_', ' ').title()
+                )
+                fig_severity.update_layout(
+                    plot_bgcolor=self.colors['background'],
+                    paper_bgcolor=self.colors['background'],
+                    font_color=self.colors['text']
+                )
+                stage.payload = fig_severity
+            st.plotly_chart(fig_severity, use_container_width=True)
+
+        with viz_col2:
+            # Age scatter plot, built once per year and data version
+            def build_age_chart():
+                with instrument.stage('age_counts', 'aggregate'):
+                    year_data = self.df[self.df['ACCIDENT_YEAR'] == year]
+                    year_data['AGE'] = year_data['BIRTH_YEAR_OF_ACCIDENT_PERPETR'].apply(
+                        lambda x: year - x if pd.notnull(x) else None
+                    )
+                    year_data = year_data[(year_data['AGE'] >= 0) & (year_data['AGE'] <= 90)]
+                    age_counts = year_data.groupby('AGE').size().reset_index(name='ACCIDENT_COUNT')
+                    mean_age = year_data['AGE'].mean()
+            
+                with instrument.stage('age_chart', 'render') as stage:
+                    fig_age = px.scatter(
+                        age_counts,
+                        x='AGE',
+                        y='ACCIDENT_COUNT',
+                        size='ACCIDENT_COUNT',
+                        title='Age vs Number of Accidents'
+                    )
+                    fig_age.add_annotation(
+                        xref="paper", yref="paper",
+                        x=0.95, y=1.05,
+                        text=f"Mean Age: {mean_age:.1f}",
+                        showarrow=False,
+                        font=dict(size=12, color=self.colors['text']),
+                        align="right"
+                    )
+                    fig_age.update_layout(
+                        plot_bgcolor=self.colors['background'],
+                        paper_bgcolor=self.colors['background'],
+                        font_color=self.colors['text']
+                    )
+                    stage.payload = fig_age
+                return charts.optimize(fig_age)
+
+            fig_age = charts.cached_figure('accident_ages', {'year': year}, self.data_version, build_age_chart)
+            st.plotly_chart(fig_age, use_container_width=True)
+
+        # Drill-down over any combination of accident dimensions
+        st.markdown("<h3 style='color: #FF00FF; margin-top: 20px;'>Drill Down</h3>", unsafe_allow_html=True)
+
+        index = self.query_index()
+        filters = {}
+        drill_cols = st.columns(3)
+        multiselect_dimensions = [d for d in index.dimensions if d != 'HOUR']
+        for i, dimension in enumerate(multiselect_dimensions):
+            with drill_cols[i % 3]:
+                selection = st.multiselect(
+                    f'{self.drill_labels[dimension]}:',
+                    index.levels[dimension],
+                    default=[year] if dimension == 'ACCIDENT_YEAR' else [],
+                    format_func=(lambda z: self.zone_names.get(z, f'Zone {z}')) if dimension == 'ZONE' else str,
+                    key=f'drill_{dimension}'
+                )
+                if selection:
+                    filters[dimension] = selection
+        with drill_cols[len(multiselect_dimensions) % 3]:
+            hours = st.slider('Hour Range:', 0, 23, (0, 23), key='drill_hours')
+            if hours != (0, 23) and 'HOUR' in index.levels:
+                filters['HOUR'] = hours
+
+        group_by = st.selectbox(
+            'Group By:',
+            [d for d in index.dimensions if d not in filters or len(filters[d]) > 1],
+            index=0,
+            format_func=self.drill_labels.get,
+            key='drill_group_by'
+        )
+
+        with instrument.stage('drill_down', 'aggregate'):
+            matched = index.count(filters)
+            grouped = index.groupby(group_by, filters)
+
+        drill_metric1, drill_metric2, drill_metric3 = st.columns(3)
+        with drill_metric1:
+            st.metric("Matching Accidents", self.format_number(matched))
+        with drill_metric2:
+            st.metric("Deaths", self.format_number(int(grouped['DEATH_COUNT'].sum())) if 'DEATH_COUNT' in grouped else '-')
+        with drill_metric3:
+            st.metric("Share of All Accidents", f"{100 * matched / max(index.rows, 1):.1f}%")
+
+        if not grouped.empty:
+            labels = [
+                self.zone_names.get(level, f'Zone {level}') if group_by == 'ZONE' else str(level)
+                for level in grouped.index
+            ]
+            fig_drill = px.bar(
+                x=labels,
+                y=grouped['COUNT'].to_numpy(),
+                title=f'Matching Accidents by {self.drill_labels[group_by]}',
+                color_discrete_sequence=[self.colors['neon_cyan']]
             )
-            fig_severity.update_layout(
+            fig_drill.update_layout(
+                xaxis_title=self.drill_labels[group_by],
+                yaxis_title='Accidents',
                 plot_bgcolor=self.colors['background'],
                 paper_bgcolor=self.colors['background'],
                 font_color=self.colors['text']
             )
-            st.plotly_chart(fig_severity, use_container_width=True)
+            st.plotly_chart(fig_drill, use_container_width=True)
+        else:
+            st.info("No accidents match the selected filters.")
 
-        with viz_col2:
-            # Age scatter plot
-            year_data = self.df[self.df['ACCIDENT_YEAR'] == year]
-            year_data['AGE'] = year_data['BIRTH_YEAR_OF_ACCIDENT_PERPETR'].apply(
-                lambda x: year - x if pd.notnull(x) else None
+        # Temporal patterns
+        st.markdown("<h3 style='color: #FF00FF; margin-top: 20px;'>When Accidents Happen</h3>", unsafe_allow_html=True)
+        
+        cube = self.temporal_cube()
+        time_col1, time_col2 = st.columns([2, 1])
+        
+        with time_col1:
+            zone_options = [None] + sorted(np.asarray(cube.zones)[self.mapped_zones(cube.zones)], key=lambda z: self.zone_names.get(z, f'Zone {z}'))
+            heatmap_zone = st.selectbox(
+                'Select Zone:',
+                zone_options,
+                format_func=lambda z: 'All Zones' if z is None else self.zone_names.get(z, f'Zone {z}')
             )
-            year_data = year_data[(year_data['AGE'] >= 0) & (year_data['AGE'] <= 90)]
-            age_counts = year_data.groupby('AGE').size().reset_index(name='ACCIDENT_COUNT')
-            mean_age = year_data['AGE'].mean()
             
-            fig_age = px.scatter(
-                age_counts,
-                x='AGE',
-                y='ACCIDENT_COUNT',
-                size='ACCIDENT_COUNT',
-                title='Age vs Number of Accidents'
-            )
-            fig_age.add_annotation(
-                xref="paper", yref="paper",
-                x=0.95, y=1.05,
-                text=f"Mean Age: {mean_age:.1f}",
-                showarrow=False,
-                font=dict(size=12, color=self.colors['text']),
-                align="right"
+            with instrument.stage('temporal_heatmap', 'render') as stage:
+                fig_heatmap = px.imshow(
+                    cube.heatmap(year, heatmap_zone),
+                    x=[f'{h:02d}:00' for h in temporal.HOURS],
+                    y=cube.weekdays,
+                    color_continuous_scale=['#111111', self.colors['neon_pink'], self.colors['neon_cyan']],
+                    aspect='auto',
+                    title=f'Accidents by Hour of Day ({year})'
+                )
+                fig_heatmap.update_layout(
+                    xaxis_title='Hour',
+                    yaxis_title='',
+                    plot_bgcolor=self.colors['background'],
+                    paper_bgcolor=self.colors['background'],
+                    font_color=self.colors['text']
+                )
+                stage.payload = fig_heatmap
+            st.plotly_chart(fig_heatmap, use_container_width=True)
+
+        with time_col2:
+            st.markdown("<h4 style='color: #00FFFF;'>Peak Hours by Zone</h4>", unsafe_allow_html=True)
+            
+            ranking = cube.zone_peak_ranking(year).head(8)
+            for _, row in ranking.iterrows():
+                zone_name = self.zone_names.get(str(row['ZONE']), f"Zone {row['ZONE']}")
+                st.markdown(f"""
+                <div style='
+                    margin-bottom: 10px;
+                    padding: 8px;
+                    background-color: rgba(0, 255, 255, 0.1);
+                    border-radius: 5px;
+                '>
+                    <div style='color: #00FFFF;'>{zone_name}</div>
+                    <div style='font-size: 0.9em;'>Peak: {row['PEAK_HOUR']:02d}:00 ({row['PEAK_SHARE']:.0%} of accidents)</div>
+                </div>
+                """, unsafe_allow_html=True)
+
+        # Hotspot analysis
+        if self.zones_data:
+            st.markdown("<h3 style='color: #FF00FF; margin-top: 20px;'>Hotspot Analysis (Getis-Ord Gi*)</h3>", unsafe_allow_html=True)
+            
+            hotspot_hour = st.select_slider(
+                'Hour of Day:',
+                options=[None] + temporal.HOURS,
+                format_func=lambda h: 'All Day' if h is None else f'{h:02d}:00'
             )
-            fig_age.update_layout(
-                plot_bgcolor=self.colors['background'],
-                paper_bgcolor=self.colors['background'],
-                font_color=self.colors['text']
+            table = self.hotspot_table(year, hotspot_hour)
+            
+            hot_col, cold_col = st.columns(2)
+            for column, label, color, spots in [
+                (hot_col, 'Hot Spots', '#FF0000', table[table['CLASS'] == 'hot']),
+                (cold_col, 'Cold Spots', '#00FFFF', table[table['CLASS'] == 'cold'].iloc[::-1])
+            ]:
+                with column:
+                    st.markdown(f"<h4 style='color: {color};'>{label} ({len(spots)})</h4>", unsafe_allow_html=True)
+                    if spots.empty:
+                        st.caption("No zones significant at 95% confidence.")
+                    for _, row in spots.head(8).iterrows():
+                        st.markdown(f"""
+                        <div style='
+                            margin-bottom: 10px;
+                            padding: 8px;
+                            background-color: rgba(255, 0, 255, 0.1);
+                            border-radius: 5px;
+                        '>
+                            <div style='color: {color};'>{row['NAME']}</div>
+                            <div style='font-size: 0.9em;'>Gi* z = {row['GI_STAR']:.2f} · Accidents: {int(row['VALUE'])}</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+
+        # Weekly top categories from the heavy-hitter sketches
+        sketches = self.sketches()
+        if sketches.weeks:
+            st.markdown("<h3 style='color: #FF00FF; margin-top: 20px;'>Top Causes by Week</h3>", unsafe_allow_html=True)
+
+            week = st.selectbox(
+                'Select Week:',
+                sketches.weeks[::-1],
+                format_func=lambda w: f"Week of {pd.Timestamp(w):%d %b %Y}"
             )
-            st.plotly_chart(fig_age, use_container_width=True)
+
+            reason_col, nature_col = st.columns(2)
+            for column, label, field in [
+                (reason_col, 'Top Reasons', 'ACCIDENT_REASON'),
+                (nature_col, 'Top Accident Types', 'ACCIDENT_NATURE')
+            ]:
+                with column:
+                    st.markdown(f"<h4 style='color: #00FFFF;'>{label}</h4>", unsafe_allow_html=True)
+                    for _, row in sketches.top(field, {week}, k=5).iterrows():
+                        bound = f" (±{row['ERROR']})" if row['ERROR'] else ''
+                        st.markdown(f"""
+                        <div style='
+                            margin-bottom: 10px;
+                            padding: 8px;
+                            background-color: rgba(255, 0, 255, 0.1);
+                            border-radius: 5px;
+                        '>
+                            <div style='color: #00FFFF;'>{str(row['ITEM']).title()}</div>
+                            <div style='font-size: 0.9em;'>Accidents: {row['COUNT']}{bound}</div>
+                        </div>
+                        """, unsafe_allow_html=True)
+
+        # Forecast
+        if 'ACCIDENT_DATE' in self.df.columns:
+            st.markdown("<h3 style='color: #FF00FF; margin-top: 20px;'>Weekly Forecast</h3>", unsafe_allow_html=True)
+            
+            store = self.forecast_store()
+            if not store.is_current(self.forecast_version()):
+                st.caption("Forecasts are out of date for this data. Run `python forecast.py` or build them here.")
+                if st.button('Build Forecasts'):
+                    with st.spinner('Fitting zone models...'):
+                        store = self.forecast_store(build=True)
+            
+            forecast_zone = heatmap_zone or forecast.NATIONAL
+            predicted = store.forecast(forecast_zone)
+            if predicted is not None:
+                history = store.history(forecast_zone)
+                with instrument.stage('forecast_chart', 'render') as stage:
+                    import plotly.graph_objects as go
+                    
+                    fig_forecast = go.Figure()
+                    fig_forecast.add_trace(go.Scatter(
+                        x=list(predicted['WEEK']) + list(predicted['WEEK'][::-1]),
+                        y=list(predicted['UPPER']) + list(predicted['LOWER'][::-1]),
+                        fill='toself',
+                        fillcolor='rgba(0, 255, 255, 0.15)',
+                        line=dict(width=0),
+                        name='90% interval'
+                    ))
+                    fig_forecast.add_trace(go.Scatter(
+                        x=history['WEEK'], y=history['COUNT'],
+                        line=dict(color=self.colors['neon_pink'], width=2), name='Observed'
+                    ))
+                    fig_forecast.add_trace(go.Scatter(
+                        x=predicted['WEEK'], y=predicted['EXPECTED'],
+                        line=dict(color=self.colors['neon_cyan'], width=3, dash='dash'), name='Forecast'
+                    ))
+                    zone_label = 'All Zones' if forecast_zone == forecast.NATIONAL else self.zone_names.get(forecast_zone, f'Zone {forecast_zone}')
+                    fig_forecast.update_layout(
+                        title=f'Weekly Accidents Forecast: {zone_label}',
+                        xaxis_title='Week',
+                        yaxis_title='Accidents',
+                        plot_bgcolor=self.colors['background'],
+                        paper_bgcolor=self.colors['background'],
+                        font_color=self.colors['text']
+                    )
+                    stage.payload = fig_forecast
+                st.plotly_chart(fig_forecast, use_container_width=True)
+
+        instrument.render_debug_panel()
+
+def shared_dashboard():
+    # Latest loaded dashboard, shared by every session and page; reloads happen in the background
+    return refresher.current('accidents')
 
 if __name__ == "__main__":
-    dashboard = QatarAccidentsStreamlit()
+    instrument.start_run('accidents')
+    dashboard = shared_dashboard()
     dashboard.run_dashboard()
\ No newline at end of file
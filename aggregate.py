@@ -0,0 +1,210 @@
+"""Parallel group-by aggregation over shared-memory columns.
+
+Group keys are factorized once into integer codes and, together with the
+value columns, copied into shared memory. Worker processes each reduce a
+row range to dense partial counts/sums with np.bincount, and the parent
+merges the partials by addition. Small frames take the serial pandas path.
+
+    python aggregate.py facc.csv --workers 8 --check
+"""
+import argparse
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+# Below this many rows process start-up costs more than it saves
+PARALLEL_MIN_ROWS = 2_000_000
+# Dense partial aggregates larger than this many cells are refused
+MAX_CELLS = 50_000_000
+
+# The year x zone x category summaries the accident dashboard draws from
+ACCIDENT_SUMMARIES = [
+    ['ACCIDENT_YEAR', 'ZONE', 'ACCIDENT_SEVERITY'],
+    ['ACCIDENT_YEAR', 'ZONE', 'ACCIDENT_NATURE'],
+    ['ACCIDENT_YEAR', 'ZONE', 'ACCIDENT_REASON'],
+    ['ACCIDENT_YEAR', 'ZONE', 'NATIONALITY_GROUP_OF_ACCIDENT_'],
+    ['NATIONALITY_GROUP_OF_ACCIDENT_', 'ACCIDENT_SEVERITY'],
+    ['ACCIDENT_NATURE', 'ACCIDENT_SEVERITY'],
+    ['ACCIDENT_REASON', 'ACCIDENT_SEVERITY'],
+]
+
+def _share(array):
+    """Copy an array into a new shared memory block; returns (block, descriptor)"""
+    block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[:] = array
+    return block, (block.name, array.dtype.str, array.shape)
+
+def _attach(descriptor):
+    name, dtype, shape = descriptor
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+
+def _partial(task):
+    """Dense counts and sums for one row range of the shared columns"""
+    code_descriptors, strides, value_descriptors, n_cells, start, stop = task
+    blocks = []
+    try:
+        flat = np.zeros(stop - start, dtype=np.int64)
+        valid = np.ones(stop - start, dtype=bool)
+        for descriptor, stride in zip(code_descriptors, strides):
+            block, codes = _attach(descriptor)
+            blocks.append(block)
+            part = codes[start:stop]
+            valid &= part >= 0
+            flat += part.astype(np.int64) * stride
+        flat = flat[valid]
+
+        counts = np.bincount(flat, minlength=n_cells)
+        sums = []
+        for descriptor in value_descriptors:
+            block, values = _attach(descriptor)
+            blocks.append(block)
+            weights = np.nan_to_num(values[start:stop][valid])
+            sums.append(np.bincount(flat, weights=weights, minlength=n_cells))
+        return counts, sums
+    finally:
+        for block in blocks:
+            block.close()
+
+def _encode(df, by, encodings=None):
+    """Integer codes and sorted levels per column, reusing `encodings` across calls"""
+    encodings = {} if encodings is None else encodings
+    for column in by:
+        if column not in encodings:
+            column_codes, uniques = pd.factorize(df[column], sort=True)
+            encodings[column] = (column_codes.astype(np.int32), uniques)
+    return [encodings[column][0] for column in by], [encodings[column][1] for column in by]
+
+def _to_frame(counts, sums, levels, by, values):
+    shape = [len(level) for level in levels]
+    present = np.flatnonzero(counts)
+    keys = [level[positions] for level, positions in zip(levels, np.unravel_index(present, shape))]
+    # Match pandas: a plain Index for a single key, a MultiIndex otherwise
+    index = pd.Index(keys[0], name=by[0]) if len(by) == 1 else pd.MultiIndex.from_arrays(keys, names=by)
+    frame = pd.DataFrame({'COUNT': counts[present]}, index=index)
+    for column, total in zip(values, sums):
+        frame[column] = total[present]
+    return frame
+
+def serial_groupby(df, by, values=()):
+    """Reference pandas path: row count and column sums per group"""
+    grouped = df.groupby(list(by), observed=True, sort=True)
+    frame = grouped.size().to_frame('COUNT')
+    for column in values:
+        frame[column] = grouped[column].sum().astype(float)
+    return frame
+
+def parallel_groupby(df, by, values=(), workers=None, partitions=None, encodings=None):
+    """Row count and column sums per group, computed across worker processes"""
+    by, values = list(by), list(values)
+    codes, levels = _encode(df, by, encodings)
+    shape = [len(level) for level in levels]
+    n_cells = int(np.prod(shape)) if shape else 1
+    if n_cells > MAX_CELLS:
+        raise ValueError(f"Group-by over {by} needs {n_cells:,} cells (limit {MAX_CELLS:,})")
+    strides = [int(np.prod(shape[i + 1:])) for i in range(len(shape))]
+
+    workers = workers or 1
+    partitions = partitions or workers * 2
+    rows = len(df)
+    bounds = np.linspace(0, rows, partitions + 1, dtype=np.int64)
+
+    blocks = []
+    try:
+        code_descriptors = []
+        for column_codes in codes:
+            block, descriptor = _share(column_codes)
+            blocks.append(block)
+            code_descriptors.append(descriptor)
+        value_descriptors = []
+        for column in values:
+            block, descriptor = _share(pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float64))
+            blocks.append(block)
+            value_descriptors.append(descriptor)
+
+        tasks = [
+            (code_descriptors, strides, value_descriptors, n_cells, int(start), int(stop))
+            for start, stop in zip(bounds[:-1], bounds[1:]) if stop > start
+        ]
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                partials = list(pool.map(_partial, tasks))
+        else:
+            partials = [_partial(task) for task in tasks]
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    counts = np.zeros(n_cells, dtype=np.int64)
+    sums = [np.zeros(n_cells) for _ in values]
+    for partial_counts, partial_sums in partials:
+        counts += partial_counts
+        for total, partial_sum in zip(sums, partial_sums):
+            total += partial_sum
+    return _to_frame(counts, sums, levels, by, values)
+
+def groupby(df, by, values=(), workers=None, encodings=None):
+    """Parallel path for large frames, pandas for small ones"""
+    import os
+
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(df) >= PARALLEL_MIN_ROWS:
+        return parallel_groupby(df, by, values, workers=workers, encodings=encodings)
+    return serial_groupby(df, by, values)
+
+def build_summaries(df, summaries=ACCIDENT_SUMMARIES, values=('DEATH_COUNT',), workers=None):
+    """Every configured summary table as {tuple(by): frame}"""
+    values = [column for column in values if column in df.columns]
+    # Each key column is factorized once and shared by every summary
+    encodings = {}
+    return {
+        tuple(by): groupby(df, by, values, workers=workers, encodings=encodings)
+        for by in summaries
+        if all(column in df.columns for column in by)
+    }
+
+def check_parity(df, by, values=(), workers=2):
+    """Whether the parallel path matches the serial pandas path exactly"""
+    expected = serial_groupby(df, by, values)
+    actual = parallel_groupby(df, by, values, workers=workers)
+    try:
+        pd.testing.assert_frame_equal(actual, expected, check_dtype=False, check_index_type=False)
+        return True
+    except AssertionError:
+        return False
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('accidents_file', nargs='?', default='facc.csv')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--check', action='store_true', help='verify parity with the serial path')
+    args = parser.parse_args(argv)
+
+    if args.accidents_file.endswith('.parquet'):
+        df = pd.read_parquet(args.accidents_file)
+    else:
+        df = pd.read_csv(args.accidents_file, skipinitialspace=True)
+    print(f"{len(df):,} rows")
+
+    for by in ACCIDENT_SUMMARIES:
+        if args.check:
+            ok = check_parity(df, by, ['DEATH_COUNT'], workers=args.workers or 2)
+            print(f"{' x '.join(by):<70} parity {'OK' if ok else 'MISMATCH'}")
+            if not ok:
+                return 1
+        for label, run in [('serial', serial_groupby), ('parallel', parallel_groupby)]:
+            start = time.perf_counter()
+            if run is serial_groupby:
+                run(df, by, ['DEATH_COUNT'])
+            else:
+                run(df, by, ['DEATH_COUNT'], workers=args.workers)
+            print(f"  {label:<9} {time.perf_counter() - start:8.3f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
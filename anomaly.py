@@ -0,0 +1,135 @@
+"""Rolling-baseline anomaly scoring for monthly violation fingerprints.
+
+Each month is compared with its seasonal neighbours (the same calendar month
+in recent years) and the months just before it. Scoring a month touches only
+those k neighbours, so new months are scored without recomputing the full
+similarity matrix.
+
+    python anomaly.py viola.json --output anomalies.csv
+"""
+import argparse
+import math
+import sys
+from collections import defaultdict, deque
+
+import numpy as np
+import pandas as pd
+
+TOTAL_COLUMN = 'mjmw_lmkhlft_lmrwry_total_traffic_violations'
+
+SEASONAL_YEARS = 3
+RECENT_MONTHS = 3
+# Neighbours needed before a month is scored at all
+MIN_NEIGHBORS = 3
+# Distances seen before the pattern z-score is trusted
+MIN_HISTORY = 6
+Z_THRESHOLD = 3.0
+# Smallest log-volume spread used, so a flat history doesn't flag tiny changes
+MIN_VOLUME_STD = 0.05
+
+class RunningStats:
+    """Welford mean / variance"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def z(self, value):
+        return (value - self.mean) / self.std if self.std > 0 else 0.0
+
+class RollingBaseline:
+    def __init__(self, seasonal_years=SEASONAL_YEARS, recent_months=RECENT_MONTHS):
+        self.seasonal = defaultdict(lambda: deque(maxlen=seasonal_years))
+        self.recent = deque(maxlen=recent_months)
+        self.distances = RunningStats()
+
+    def score(self, month, fingerprint, total):
+        """Pattern distance, its z-score and the volume z-score against the baseline"""
+        neighbors = list(self.seasonal[month.month]) + list(self.recent)
+        if len(neighbors) < MIN_NEIGHBORS:
+            return None
+
+        fingerprints = np.array([n[0] for n in neighbors])
+        log_totals = np.array([n[1] for n in neighbors])
+
+        centroid = fingerprints.mean(axis=0)
+        norms = np.linalg.norm(fingerprint) * np.linalg.norm(centroid)
+        distance = 1.0 - float(fingerprint @ centroid / norms) if norms > 0 else 1.0
+
+        volume_z = (math.log1p(total) - log_totals.mean()) / max(log_totals.std(), MIN_VOLUME_STD)
+        pattern_z = self.distances.z(distance) if self.distances.count >= MIN_HISTORY else 0.0
+        return {'distance': distance, 'pattern_z': pattern_z, 'volume_z': volume_z}
+
+    def update(self, month, fingerprint, total):
+        """Score a month, then fold it into the baseline"""
+        fingerprint = np.asarray(fingerprint, dtype=float)
+        scores = self.score(month, fingerprint, total)
+        if scores is not None:
+            self.distances.add(scores['distance'])
+
+        entry = (fingerprint, math.log1p(total))
+        self.seasonal[month.month].append(entry)
+        self.recent.append(entry)
+        return scores
+
+def score_months(df, fingerprints, z_threshold=Z_THRESHOLD):
+    """Anomaly scores for every month of a month-sorted viola frame"""
+    baseline = RollingBaseline()
+    rows = []
+    for month, fingerprint, total in zip(df['month'], fingerprints.to_numpy(), df[TOTAL_COLUMN].to_numpy()):
+        scores = baseline.update(month, fingerprint, total)
+        if scores is None:
+            rows.append({'month': month, 'total': total, 'distance': np.nan,
+                         'pattern_z': np.nan, 'volume_z': np.nan, 'anomaly': False, 'reason': ''})
+            continue
+
+        reasons = []
+        if scores['pattern_z'] >= z_threshold:
+            reasons.append('unusual violation mix')
+        if scores['volume_z'] >= z_threshold:
+            reasons.append('volume spike')
+        elif scores['volume_z'] <= -z_threshold:
+            reasons.append('volume drop')
+        rows.append({'month': month, 'total': total, **scores,
+                     'anomaly': bool(reasons), 'reason': ', '.join(reasons)})
+
+    return pd.DataFrame(rows, index=fingerprints.index)
+
+def anomaly_report(scores):
+    """Flagged months as an exportable CSV string"""
+    flagged = scores[scores['anomaly']].copy()
+    flagged['month'] = pd.to_datetime(flagged['month']).dt.strftime('%Y-%m')
+    return flagged.round({'distance': 4, 'pattern_z': 2, 'volume_z': 2}).to_csv(index=False)
+
+def main(argv=None):
+    from viola import load_json_data, create_fingerprint
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('violations_file', nargs='?', default='viola.json')
+    parser.add_argument('--output', default='anomalies.csv')
+    parser.add_argument('--z', type=float, default=Z_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    df = load_json_data(args.violations_file)
+    df['month'] = pd.to_datetime(df['month'])
+    df = df.sort_values('month')
+    scores = score_months(df, create_fingerprint(df), args.z)
+
+    with open(args.output, 'w') as f:
+        f.write(anomaly_report(scores))
+    print(f"{int(scores['anomaly'].sum())} anomalous months of {len(scores)} written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,24 @@
 import streamlit as st
-import pandas as pd
-from groq import Groq
-
-# Initialize Groq client
-GROQ_API_KEY = st.secrets["GROQ_API_KEY"]
-groq_client = Groq(api_key=GROQ_API_KEY)
-
-# Configure page
-st.set_page_config(
-    page_title="TraffiQ",
-    page_icon="🚦",
-    layout="wide"
-)
-
-# Modern UI styling
-st.markdown("""
+import re
+import instrument
+
+# Standalone dashboard deployments; the unified app (traffiq.py) links to its own pages instead
+DASHBOARD_URLS = {
+    'accidents': "https://accidents.streamlit.app/",
+    'violations': "https://violations.streamlit.app/",
+    'licenses': "https://license.streamlit.app/"
+}
+
+def configure_page():
+    st.set_page_config(
+        page_title="TraffiQ",
+        page_icon="🚦",
+        layout="wide"
+    )
+
+def apply_styles():
+    # Modern UI styling
+    st.markdown("""
 <style>
 @import url('https://fonts.googleapis.com/css2?family=Inter:wght@400;500;600;700&display=swap');
 
@@ -352,50 +356,50 @@ section[data-testid="stChatInputContainer"] {
 </div>
 """, unsafe_allow_html=True)
 
-# Initialize session state
-if 'chat_history' not in st.session_state:
-    st.session_state.chat_history = []
+@st.cache_resource
+def get_groq_client():
+    # The Groq SDK is imported on the first chat query, not at page load
+    from groq import Groq
+    return Groq(api_key=st.secrets["GROQ_API_KEY"])
 
 @st.cache_data
 def load_knowledge_base():
-    data = {
-        'message': [
-            "Qatar recorded a 15% decrease in traffic accidents in urban areas after implementing smart traffic systems.",
-            "Recent policy changes require mandatory defensive driving courses for new license applicants in Qatar.",
-            "Traffic safety indicators show peak accident times between 7-9 AM and 4-6 PM in major Qatar cities.",
-            "New traffic policy focuses on reducing accidents through AI-powered traffic management and stricter enforcement.",
-            "Qatar's road safety campaign resulted in 25% reduction in pedestrian accidents in residential areas.",
-            "Annual Average Accidents (2020+): 197,800+ incidents/year",
-            "Total Recorded Deaths: 976 fatalities",
-            "Pedestrian Collision Deaths: 227 fatalities",
-            "Total Accidents: 988,800+ incidents",
-            "Annual Average: 197.8K+",
-            "Fatality Statistics: 976 total deaths (227 pedestrian)",
-            "Total Incident Volume: 988.8K+",
-            "Accident Distribution by Nationality Groups",
-            "Nationality Group Distribution: AFRIC: ~25,000 accidents, ARABI: ~225,000 accidents, ASIA: ~375,000 accidents, QATAR: ~150,000 accidents",
-            "Severity Types Recorded: Death Injury, Heavy Injury, Light Injury, Simple, Non-Traffic Accident (Death/Heavy Injury)",
-            "Types of Accidents: Collision Types: Animal: ~100,000 cases, Fixed object: ~10,000 cases, Vehicles: ~5,000 cases, Pedestrians: Present in data",
-            "Other Incident Types: Fall from car, Inversion, Non-collision, Claim converted to accident",
-            "Accident Reasons: Categories by Severity: Death: ~1,000 cases, Drunk: ~1,500 cases, Other: ~12,000 cases (Simple: ~7,000, Light injury: ~4,000, Heavy injury: ~1,000), Cost: Minimal cases",
-            "Severity Distribution: Simple incidents: Majority, Light injuries: Second most common, Death and heavy injury: Less frequent but significant",
-            "Age Distribution of Accidents: Mean Age: 37.4 years, Age Range: 20-80 years",
-            "Age Group Distribution: Peak Frequency: Ages 35-40 (~6,000 accidents), Secondary Peak: Ages 30-35 (~5,500 accidents), Pattern: Low below 20, sharp increase 20-30, highest 35-40, decline 40-60, drop after 60, minimal after 80",
-            "Geographical Distribution of Accidents (2020-2023): Zone Statistics by Year: 2024: Al Rayyan - Bu Hamour, Ain Khaled: 20,380 accidents, Al Rayyan - Fereej Al Soudan, Al Waab: 14,848 accidents, Umm Slal - Al Froosh, Al Khartiyat: 10,148 accidents, Doha - Industrial Area: 9,833 accidents, Al Wakra: 8,070 accidents",
-            "2020-2023: Consistent high accidents in Al Rayyan - Bu Hamour, Ain Khaled; Al Rayyan - Fereej Al Soudan, Al Waab; Doha - Industrial Area; Al Rayyan - New Al Rayyan, Muaither; Umm Slal - Al Froosh, Al Khartiyat",
-            "Key Areas: High accidents in major urban and industrial zones, dense population areas, and Al Rayyan district."
-        ]
-    }
-    return pd.DataFrame(data)
+    return [
+        "Qatar recorded a 15% decrease in traffic accidents in urban areas after implementing smart traffic systems.",
+        "Recent policy changes require mandatory defensive driving courses for new license applicants in Qatar.",
+        "Traffic safety indicators show peak accident times between 7-9 AM and 4-6 PM in major Qatar cities.",
+        "New traffic policy focuses on reducing accidents through AI-powered traffic management and stricter enforcement.",
+        "Qatar's road safety campaign resulted in 25% reduction in pedestrian accidents in residential areas.",
+        "Annual Average Accidents (2020+): 197,800+ incidents/year",
+        "Total Recorded Deaths: 976 fatalities",
+        "Pedestrian Collision Deaths: 227 fatalities",
+        "Total Accidents: 988,800+ incidents",
+        "Annual Average: 197.8K+",
+        "Fatality Statistics: 976 total deaths (227 pedestrian)",
+        "Total Incident Volume: 988.8K+",
+        "Accident Distribution by Nationality Groups",
+        "Nationality Group Distribution: AFRIC: ~25,000 accidents, ARABI: ~225,000 accidents, ASIA: ~375,000 accidents, QATAR: ~150,000 accidents",
+        "Severity Types Recorded: Death Injury, Heavy Injury, Light Injury, Simple, Non-Traffic Accident (Death/Heavy Injury)",
+        "Types of Accidents: Collision Types: Animal: ~100,000 cases, Fixed object: ~10,000 cases, Vehicles: ~5,000 cases, Pedestrians: Present in data",
+        "Other Incident Types: Fall from car, Inversion, Non-collision, Claim converted to accident",
+        "Accident Reasons: Categories by Severity: Death: ~1,000 cases, Drunk: ~1,500 cases, Other: ~12,000 cases (Simple: ~7,000, Light injury: ~4,000, Heavy injury: ~1,000), Cost: Minimal cases",
+        "Severity Distribution: Simple incidents: Majority, Light injuries: Second most common, Death and heavy injury: Less frequent but significant",
+        "Age Distribution of Accidents: Mean Age: 37.4 years, Age Range: 20-80 years",
+        "Age Group Distribution: Peak Frequency: Ages 35-40 (~6,000 accidents), Secondary Peak: Ages 30-35 (~5,500 accidents), Pattern: Low below 20, sharp increase 20-30, highest 35-40, decline 40-60, drop after 60, minimal after 80",
+        "Geographical Distribution of Accidents (2020-2023): Zone Statistics by Year: 2024: Al Rayyan - Bu Hamour, Ain Khaled: 20,380 accidents, Al Rayyan - Fereej Al Soudan, Al Waab: 14,848 accidents, Umm Slal - Al Froosh, Al Khartiyat: 10,148 accidents, Doha - Industrial Area: 9,833 accidents, Al Wakra: 8,070 accidents",
+        "2020-2023: Consistent high accidents in Al Rayyan - Bu Hamour, Ain Khaled; Al Rayyan - Fereej Al Soudan, Al Waab; Doha - Industrial Area; Al Rayyan - New Al Rayyan, Muaither; Umm Slal - Al Froosh, Al Khartiyat",
+        "Key Areas: High accidents in major urban and industrial zones, dense population areas, and Al Rayyan district."
+    ]
 
 def process_query_with_rag(query):
     try:
-        social_updates_df = load_knowledge_base()
-        relevant_updates = social_updates_df[
-            social_updates_df['message'].str.contains('|'.join(query.split()), case=False, na=False)
-        ]
-        
-        context = "\n".join(relevant_updates['message'].tolist())
+        with instrument.stage('retrieval', 'aggregate') as stage:
+            social_updates = load_knowledge_base()
+            pattern = re.compile('|'.join(re.escape(word) for word in query.split()), re.IGNORECASE)
+            relevant_updates = [message for message in social_updates if pattern.search(message)]
+            
+            context = "\n".join(relevant_updates)
+            stage.payload = context
         
         messages = [
             {"role": "system", "content": """You are TraffiQ, an AI traffic expert and statistician for Qatar. 
@@ -410,13 +414,15 @@ def process_query_with_rag(query):
         ]
         
         try:
-            response = groq_client.chat.completions.create(
-                messages=messages,
-                model="mixtral-8x7b-32768",
-                temperature=0.7,
-                max_tokens=6000,
-                top_p=0.9
-            )
+            with instrument.stage('groq_completion', 'llm') as stage:
+                response = get_groq_client().chat.completions.create(
+                    messages=messages,
+                    model="mixtral-8x7b-32768",
+                    temperature=0.7,
+                    max_tokens=6000,
+                    top_p=0.9
+                )
+                stage.payload = response.choices[0].message.content
             return response.choices[0].message.content
         except Exception as e:
             return "I apologize, but I'm having trouble connecting to the AI service. Please try again in a moment."
@@ -424,7 +430,14 @@ def process_query_with_rag(query):
     except Exception as e:
         return "I apologize, but I encountered an error processing your query. Please try again."
 
-def main():
+def main(dashboard_urls=DASHBOARD_URLS, link_target="_blank"):
+    instrument.start_run('home')
+    apply_styles()
+
+    # Initialize session state
+    if 'chat_history' not in st.session_state:
+        st.session_state.chat_history = []
+
     # Header
     st.markdown('<h1 class="logo">TraffiQ</h1>', unsafe_allow_html=True)
     
@@ -436,19 +449,19 @@ def main():
             "icon": "🚑",
             "title": "Accident Analytics",
             "description": "Real-time accident data analysis with interactive visualizations and predictive insights for better emergency response.",
-            "url": "https://accidents.streamlit.app/"
+            "url": dashboard_urls["accidents"]
         },
         {
             "icon": "🚔",
             "title": "Traffic Analytics",
             "description": "Comprehensive tracking and analysis of traffic violations to improve enforcement and reduce infractions.",
-            "url": "https://violations.streamlit.app/"
+            "url": dashboard_urls["violations"]
         },
         {
             "icon": "📇",
             "title": "License Analytics",
             "description": "Streamlined license processing system with verification tools and renewal tracking capabilities.",
-            "url": "https://license.streamlit.app/"
+            "url": dashboard_urls["licenses"]
         },
         {
             "icon": "🚗",
@@ -467,7 +480,7 @@ def main():
                     <div class="feature-icon">{feature["icon"]}</div>
                     <div class="feature-title">{feature["title"]}</div>
                     <div class="feature-description">{feature["description"]}</div>
-                    <a href="{feature["url"]}" target="_blank" class="view-link">View Dashboard</a>
+                    <a href="{feature["url"]}" target="{link_target}" class="view-link">View Dashboard</a>
                 </div>
             ''', unsafe_allow_html=True)
     
@@ -501,5 +514,8 @@ def main():
     
     st.markdown('</div>', unsafe_allow_html=True)
 
+    instrument.render_debug_panel()
+
 if __name__ == "__main__":
+    configure_page()
     main()
\ No newline at end of file
@@ -0,0 +1,159 @@
+"""Headless benchmarks for the dashboard data paths.
+
+Generates synthetic facc.csv / liz.csv / viola.json datasets of the
+requested sizes, runs each dashboard stage outside Streamlit and records
+wall time and peak traced memory per stage as JSON.
+
+    python bench.py --rows 10000 100000 1000000
+    python bench.py --rows 100000 --compare bench_results.json
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import synth
+
+ROOT = Path(__file__).resolve().parent
+
+# The similarity step is N x N, so violation periods are capped separately
+MAX_VIOLATION_ROWS = 5000
+
+def measure(results, dataset, rows, stage, func, *args):
+    """Run func(*args) and append its wall time and peak memory to results"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = func(*args)
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results.append({
+        'dataset': dataset,
+        'rows': rows,
+        'stage': stage,
+        'seconds': round(seconds, 6),
+        'peak_mb': round(peak / 1024 ** 2, 3)
+    })
+    print(f"{dataset:<10} {rows:>10,} {stage:<28} {seconds:9.3f}s {peak / 1024 ** 2:10.1f} MB")
+    return value
+
+def bench_accidents(results, rows, workdir, seed):
+    import pandas as pd
+    import validate
+    from acc import QatarAccidentsStreamlit
+
+    path = workdir / 'facc.csv'
+    synth.write_dataset('accidents', rows, path, seed=seed)
+
+    # Validation alone, on the frame as read from the CSV
+    with open(ROOT / 'qatar_zones_polygons.json', 'r') as f:
+        zones_data = json.load(f)
+    raw = pd.read_csv(path, skipinitialspace=True)
+    measure(results, 'accidents', rows, 'validate', validate.accidents, raw, zones_data)
+    del raw
+
+    dashboard = measure(results, 'accidents', rows, 'load_data', QatarAccidentsStreamlit,
+                        str(path), str(ROOT / 'qatar_zones_polygons.json'))
+    measure(results, 'accidents', rows, 'calculate_metrics', dashboard.calculate_metrics)
+    measure(results, 'accidents', rows, 'create_map', dashboard.create_map, dashboard.current_year)
+
+def bench_licenses(results, rows, workdir, seed):
+    import pandas as pd
+    import validate
+    from liz import LicenseDashboard
+
+    path = workdir / 'liz.csv'
+    synth.write_dataset('licenses', rows, path, seed=seed)
+
+    raw = pd.read_csv(path, skipinitialspace=True)
+    measure(results, 'licenses', rows, 'validate', validate.licenses, raw)
+    del raw
+
+    dashboard = measure(results, 'licenses', rows, 'load_data', LicenseDashboard, str(path))
+    year = dashboard.license_df['YEAR'].max()
+    measure(results, 'licenses', rows, 'create_license_line_chart',
+            dashboard.create_license_line_chart, 'NATIONALITY_GROUP', year)
+    measure(results, 'licenses', rows, 'create_age_bubble_chart', dashboard.create_age_bubble_chart)
+    measure(results, 'licenses', rows, 'create_annual_license_chart', dashboard.create_annual_license_chart)
+
+def bench_violations(results, rows, workdir, seed):
+    import pandas as pd
+    from viola import load_json_data, create_fingerprint, cosine_similarity
+
+    rows = min(rows, MAX_VIOLATION_ROWS)
+    path = workdir / 'viola.json'
+    synth.write_dataset('violations', rows, path, seed=seed)
+
+    df = measure(results, 'violations', rows, 'load_json_data', load_json_data, str(path))
+    df['month'] = pd.to_datetime(df['month'])
+    df = df.sort_values('month')
+    fingerprints = measure(results, 'violations', rows, 'create_fingerprint', create_fingerprint, df)
+    measure(results, 'violations', rows, 'cosine_similarity', cosine_similarity, fingerprints)
+
+BENCHMARKS = {
+    'accidents': bench_accidents,
+    'licenses': bench_licenses,
+    'violations': bench_violations,
+}
+
+def compare(results, baseline_file):
+    """Print the per-stage change against a previous results file"""
+    with open(baseline_file, 'r') as f:
+        baseline = {
+            (r['dataset'], r['rows'], r['stage']): r
+            for r in json.load(f)['results']
+        }
+
+    print(f"\nCompared with {baseline_file}:")
+    for r in results:
+        previous = baseline.get((r['dataset'], r['rows'], r['stage']))
+        if not previous or not previous['seconds']:
+            continue
+        ratio = r['seconds'] / previous['seconds']
+        print(f"{r['dataset']:<10} {r['rows']:>10,} {r['stage']:<28} {ratio:6.2f}x time  "
+              f"{r['peak_mb'] - previous['peak_mb']:+9.1f} MB")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000])
+    parser.add_argument('--datasets', nargs='+', choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='bench_results.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    args = parser.parse_args(argv)
+
+    # Streamlit warns about the missing runtime on every st.* call
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    # Load the lazily imported plotting and mapping stacks so stage timings exclude them
+    import folium, branca.colormap, plotly.express  # noqa: F401
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for rows in args.rows:
+            for dataset in args.datasets:
+                BENCHMARKS[dataset](results, rows, Path(tmp), args.seed)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'seed': args.seed,
+            'results': results
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
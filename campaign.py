@@ -0,0 +1,425 @@
+"""Batch rendering of campaign graphics from the accident data.
+
+A campaign spec (JSON) names the zones, periods, metrics and chart kinds to
+produce and the brand palette to draw them in. Every combination becomes one
+figure built from the precomputed aggregates (zone x year totals and the
+temporal cube) on a plotly template made once from the palette. Figures are
+rendered to PNG/SVG/PDF (kaleido) or standalone HTML in a process pool and
+kept in a content-addressed cache: a figure whose spec, format and size were
+rendered before is copied out instead of rendered again.
+
+Image formats need kaleido (in requirements.txt) and a Chrome it can drive;
+`plotly_get_chrome` installs one. HTML files embed plotly.js and need neither.
+
+    python campaign.py --example > campaign.json
+    python campaign.py campaign.json --output campaign/ --workers 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import datastore
+
+# Bump to re-render every cached image after a change to how figures are drawn
+RENDER_VERSION = 2
+# Figures per render call; each call pays for one headless browser start
+BATCH_SIZE = 64
+
+FORMATS = ('png', 'svg', 'pdf', 'html')
+METRICS = {'accidents': 'Accidents', 'deaths': 'Deaths'}
+
+# The dashboards' neon palettes: acc.py on near-black, liz.py on black
+PALETTES = {
+    'neon': {'background': '#111111', 'text': '#FFFFFF',
+             'accents': ['#FF00FF', '#00FFFF', '#39FF14', '#800000']},
+    'neon_black': {'background': '#000000', 'text': '#FFFFFF',
+                   'accents': ['#FF00FF', '#00FFFF', '#39FF14', '#0000FF', '#800000']},
+}
+
+EXAMPLE_SPEC = {
+    'name': 'road-safety',
+    'palette': 'neon',
+    'tagline': 'Slow down. Arrive alive.',
+    'zones': 'top:5',
+    'national': True,
+    'periods': 'latest:2',
+    'metrics': ['accidents', 'deaths'],
+    'charts': ['headline', 'map', 'hourly', 'trend'],
+    'formats': ['png'],
+    'width': 1080,
+    'height': 1080,
+    'scale': 1,
+}
+
+# One figure to render; zone is None for Qatar-wide charts, period None for all years
+Job = namedtuple('Job', ['chart', 'zone', 'period', 'metric'])
+
+def palette(spec):
+    """Brand colours from a palette name or a {background, text, accents} mapping"""
+    value = spec.get('palette', 'neon')
+    if isinstance(value, str):
+        if value not in PALETTES:
+            raise ValueError(f"Unknown palette '{value}'; choose from {', '.join(PALETTES)}")
+        return PALETTES[value]
+    missing = {'background', 'text', 'accents'} - set(value)
+    if missing:
+        raise ValueError(f"Palette is missing {', '.join(sorted(missing))}")
+    if len(value['accents']) < 2:
+        raise ValueError("Palette needs at least two accent colours")
+    return value
+
+def build_template(colors, width, height):
+    """Plotly template shared by every figure of a campaign"""
+    import plotly.graph_objects as go
+
+    return go.layout.Template(layout=dict(
+        width=width,
+        height=height,
+        paper_bgcolor=colors['background'],
+        plot_bgcolor=colors['background'],
+        font=dict(color=colors['text'], size=22),
+        title=dict(font=dict(size=36, color=colors['accents'][1]), x=0.5, xanchor='center'),
+        colorway=colors['accents'],
+        margin=dict(l=80, r=60, t=140, b=90),
+        xaxis=dict(showgrid=False, zeroline=False, linecolor=colors['text']),
+        yaxis=dict(gridcolor='#333333', zeroline=False),
+        showlegend=False,
+    ))
+
+def clockwise(ring):
+    # Plotly's geo projection fills the outside of counter-clockwise rings
+    x, y = np.asarray(ring, dtype=float).T
+    area = np.sum(x[:-1] * y[1:] - x[1:] * y[:-1])
+    return ring[::-1] if area > 0 else ring
+
+class CampaignData:
+    """The aggregates campaign figures are drawn from"""
+
+    def __init__(self, totals, cube, geometry, zone_names):
+        # (year, zone) -> accidents / deaths
+        self.totals = totals
+        self.cube = cube
+        self.geometry = geometry
+        self.zone_names = zone_names
+        self.years = sorted(totals.index.get_level_values(0).unique())
+
+    @classmethod
+    def load(cls, accidents_file='facc.csv', polygons_file='qatar_zones_polygons.json',
+             names_file='zone_names.json'):
+        """Aggregates from the materialized artifacts, or the raw files when there are none"""
+        import aggregate
+        import materialize
+        import mapcache
+        import temporal
+
+        with open(polygons_file, 'r') as f:
+            zones_data = json.load(f)
+        with open(names_file, 'r') as f:
+            zone_names = json.load(f)
+
+        df = materialize.load_table('accidents_table', (accidents_file, polygons_file))
+        if df is None:
+            import acc
+            df, _ = acc.ingest_accidents(pd.read_csv(accidents_file, skipinitialspace=True), zones_data)
+
+        arrays = materialize.load_arrays('temporal_cube', (accidents_file,))
+        cube = temporal.TemporalCube.from_arrays(arrays) if arrays is not None else temporal.TemporalCube.from_accidents(df)
+
+        totals = aggregate.groupby(df, ['ACCIDENT_YEAR', 'ZONE'], ['DEATH_COUNT'])
+        totals = totals.rename(columns={'COUNT': 'accidents', 'DEATH_COUNT': 'deaths'})
+        totals.index = totals.index.set_levels(totals.index.levels[0].astype(int), level=0)
+        rings = materialize.load_json('zone_geometry', (polygons_file,)) or mapcache.zone_geometry(zones_data)
+        geometry = {zone: clockwise(ring) for zone, ring in rings.items()}
+        return cls(totals, cube, geometry, zone_names)
+
+    def zone_name(self, zone):
+        return 'Qatar' if zone is None else self.zone_names.get(zone, f'Zone {zone}')
+
+    def value(self, metric, period, zone=None):
+        if period not in self.years:
+            return 0
+        year = self.totals.loc[period]
+        if zone is None:
+            return int(year[metric].sum())
+        return int(year[metric].get(zone, 0))
+
+    def by_zone(self, metric, period):
+        if period not in self.years:
+            return pd.Series(dtype=int)
+        year = self.totals.loc[period, metric]
+        return year[year.index != 'Unknown']
+
+    def by_year(self, metric, zone=None):
+        table = self.totals[metric]
+        if zone is not None:
+            table = table[table.index.get_level_values(1) == zone]
+        return table.groupby(level=0).sum().reindex(self.years, fill_value=0)
+
+    def resolve_periods(self, value):
+        if value == 'all':
+            return list(self.years)
+        if isinstance(value, str) and value.startswith('latest:'):
+            return list(self.years[-int(value.split(':', 1)[1]):])
+        periods = [int(period) for period in value]
+        unknown = sorted(set(periods) - set(self.years))
+        if unknown:
+            raise ValueError(f"No accident data for {', '.join(map(str, unknown))}")
+        return periods
+
+    def resolve_zones(self, value, periods):
+        zones = self.totals.loc[self.totals.index.get_level_values(0).isin(periods), 'accidents']
+        zones = zones.groupby(level=1).sum().drop('Unknown', errors='ignore').sort_values(ascending=False)
+        if value == 'all':
+            return list(zones.index)
+        if isinstance(value, str) and value.startswith('top:'):
+            return list(zones.index[:int(value.split(':', 1)[1])])
+        return [str(zone) for zone in value]
+
+# Figure builders: (data, job, colors, spec) -> plotly Figure
+
+def headline_figure(data, job, colors, spec):
+    import plotly.graph_objects as go
+
+    value = data.value(job.metric, job.period, job.zone)
+    previous = data.value(job.metric, job.period - 1, job.zone)
+    fig = go.Figure()
+    annotations = [
+        dict(text=data.zone_name(job.zone), y=0.9, font=dict(size=40, color=colors['accents'][1])),
+        dict(text=f'{value:,}', y=0.6, font=dict(size=200, color=colors['accents'][0])),
+        dict(text=f'{METRICS[job.metric].lower()} in {job.period}', y=0.4, font=dict(size=44)),
+    ]
+    if previous:
+        change = (value - previous) / previous
+        # Falling numbers are the good news in a safety campaign
+        color = colors['accents'][2 if change < 0 and len(colors['accents']) > 2 else 0]
+        arrow = '▼' if change < 0 else '▲'
+        annotations.append(dict(text=f'{arrow} {abs(change):.0%} vs {job.period - 1}', y=0.28,
+                                font=dict(size=40, color=color)))
+    if spec.get('tagline'):
+        annotations.append(dict(text=spec['tagline'], y=0.08, font=dict(size=36, color=colors['accents'][1])))
+    for annotation in annotations:
+        annotation.update(x=0.5, xref='paper', yref='paper', showarrow=False)
+    fig.update_layout(annotations=annotations, xaxis_visible=False, yaxis_visible=False)
+    return fig
+
+def map_figure(data, job, colors, spec):
+    import plotly.graph_objects as go
+
+    values = data.by_zone(job.metric, job.period)
+    zones = [zone for zone in values.index if zone in data.geometry]
+    geojson = {'type': 'FeatureCollection', 'features': [
+        {'type': 'Feature', 'id': zone, 'geometry': {'type': 'Polygon', 'coordinates': [data.geometry[zone]]}}
+        for zone in zones
+    ]}
+    accents = colors['accents'][:3]
+    fig = go.Figure(go.Choropleth(
+        geojson=geojson,
+        locations=zones,
+        z=values[zones].to_numpy(),
+        text=[data.zone_name(zone) for zone in zones],
+        colorscale=[[i / (len(accents) - 1), color] for i, color in enumerate(accents)],
+        marker_line_width=0,
+        colorbar=dict(title=METRICS[job.metric], thickness=20, len=0.6),
+    ))
+    fig.update_geos(fitbounds='locations', visible=False, bgcolor=colors['background'])
+    fig.update_layout(title=f'{METRICS[job.metric]} by zone, {job.period}')
+    return fig
+
+def hourly_figure(data, job, colors, spec):
+    import plotly.graph_objects as go
+
+    profile = data.cube.hourly_profile(job.period, job.zone)
+    peak = int(np.argmax(profile)) if profile.sum() else None
+    bars = [colors['accents'][0] if hour == peak else colors['accents'][1] for hour in range(len(profile))]
+    fig = go.Figure(go.Bar(x=list(range(len(profile))), y=profile, marker_color=bars))
+    fig.update_layout(
+        title=f'When accidents happen<br><sup>{data.zone_name(job.zone)}, {job.period}</sup>',
+        xaxis=dict(title='Hour of day', tickmode='array', tickvals=list(range(0, 24, 3))),
+        yaxis_title='Accidents'
+    )
+    return fig
+
+def trend_figure(data, job, colors, spec):
+    import plotly.graph_objects as go
+
+    series = data.by_year(job.metric, job.zone)
+    fig = go.Figure(go.Scatter(
+        x=series.index, y=series.to_numpy(), mode='lines+markers',
+        line=dict(color=colors['accents'][0], width=5), marker=dict(size=14, color=colors['accents'][1])
+    ))
+    fig.update_layout(
+        title=f'{METRICS[job.metric]} per year<br><sup>{data.zone_name(job.zone)}</sup>',
+        xaxis=dict(dtick=1), yaxis_title=METRICS[job.metric]
+    )
+    return fig
+
+# chart -> (builder, axes it varies over)
+CHARTS = {
+    'headline': (headline_figure, ('zone', 'period', 'metric')),
+    'map': (map_figure, ('period', 'metric')),
+    'hourly': (hourly_figure, ('zone', 'period')),
+    'trend': (trend_figure, ('zone', 'metric')),
+}
+
+def plan_jobs(data, spec):
+    """Every (chart, zone, period, metric) the spec asks for"""
+    unknown = set(spec['charts']) - set(CHARTS)
+    if unknown:
+        raise ValueError(f"Unknown charts: {', '.join(sorted(unknown))}")
+    unknown = set(spec['metrics']) - set(METRICS)
+    if unknown:
+        raise ValueError(f"Unknown metrics: {', '.join(sorted(unknown))}")
+
+    periods = data.resolve_periods(spec['periods'])
+    zones = data.resolve_zones(spec['zones'], periods)
+    if spec.get('national', True):
+        zones = [None] + zones
+
+    jobs = []
+    for chart in spec['charts']:
+        axes = CHARTS[chart][1]
+        for zone in zones if 'zone' in axes else [None]:
+            for period in periods if 'period' in axes else [None]:
+                # The temporal cube counts accidents only
+                for metric in spec['metrics'] if 'metric' in axes else ['accidents']:
+                    jobs.append(Job(chart, zone, period, metric))
+    return jobs
+
+def job_name(job):
+    parts = [job.chart, 'qatar' if job.zone is None else f'zone{job.zone}']
+    if job.period is not None:
+        parts.append(str(job.period))
+    if 'metric' in CHARTS[job.chart][1]:
+        parts.append(job.metric)
+    return '-'.join(parts)
+
+def content_key(figure_json, fmt, width, height, scale):
+    header = f'{RENDER_VERSION}:{fmt}:{width}x{height}@{scale}:'
+    return hashlib.sha1(header.encode() + figure_json.encode()).hexdigest()
+
+def render_batch(batch):
+    """Worker entry point: render [(figure json, format, width, height, scale, path)]; returns seconds"""
+    import plotly.io as pio
+
+    started = time.perf_counter()
+    images = []
+    for figure_json, fmt, width, height, scale, path in batch:
+        if fmt == 'html':
+            figure = pio.from_json(figure_json)
+            datastore.write_atomic(path, pio.to_html(figure, include_plotlyjs=True, full_html=True))
+        else:
+            images.append((json.loads(figure_json), fmt, width, height, scale, Path(path)))
+
+    if images:
+        figures, formats, widths, heights, scales, paths = zip(*images)
+        temporary = [path.with_name(f'.{path.name}.{os.getpid()}.tmp') for path in paths]
+        # One browser session renders the whole batch
+        pio.write_images(list(figures), temporary, format=list(formats), width=list(widths),
+                         height=list(heights), scale=list(scales))
+        for tmp, path in zip(temporary, paths):
+            os.replace(tmp, path)
+    return time.perf_counter() - started
+
+def link_or_copy(source, target):
+    target.unlink(missing_ok=True)
+    try:
+        os.link(source, target)
+    except OSError:
+        shutil.copyfile(source, target)
+
+class Campaign:
+    def __init__(self, spec, data=None, workers=None):
+        self.spec = {**EXAMPLE_SPEC, **spec}
+        unknown = set(self.spec['formats']) - set(FORMATS)
+        if unknown:
+            raise ValueError(f"Unknown formats: {', '.join(sorted(unknown))}")
+        self.colors = palette(self.spec)
+        self.data = data or CampaignData.load()
+        self.workers = workers or os.cpu_count() or 1
+
+    def figures(self):
+        """(job, figure JSON) for every chart of the campaign, all on one template"""
+        template = build_template(self.colors, self.spec['width'], self.spec['height'])
+        for job in plan_jobs(self.data, self.spec):
+            fig = CHARTS[job.chart][0](self.data, job, self.colors, self.spec)
+            fig.update_layout(template=template)
+            yield job, fig.to_json()
+
+    def render(self, output):
+        """Render into `output`; returns {'rendered', 'cached', 'files', 'seconds'}"""
+        started = time.perf_counter()
+        width, height, scale = self.spec['width'], self.spec['height'], self.spec['scale']
+        output = Path(output)
+        output.mkdir(parents=True, exist_ok=True)
+
+        files, pending, queued = [], [], set()
+        for job, figure_json in self.figures():
+            for fmt in self.spec['formats']:
+                key = content_key(figure_json, fmt, width, height, scale)
+                path = datastore.cache_path('campaign', f'{key}.{fmt}')
+                files.append({'file': f'{job_name(job)}.{fmt}', 'key': key, 'cache': str(path), **job._asdict()})
+                if not path.is_file() and key not in queued:
+                    queued.add(key)
+                    pending.append((figure_json, fmt, width, height, scale, str(path)))
+
+        if any(item[1] != 'html' for item in pending):
+            try:
+                import kaleido  # noqa: F401
+            except ImportError:
+                raise RuntimeError("PNG, SVG and PDF export need kaleido>=1 and Chrome "
+                                   "(pip install -r requirements.txt; plotly_get_chrome); 'html' works without them") from None
+
+        batches = [pending[i:i + BATCH_SIZE] for i in range(0, len(pending), BATCH_SIZE)]
+        if len(batches) > 1 and self.workers > 1:
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(batches))) as pool:
+                list(pool.map(render_batch, batches))
+        else:
+            for batch in batches:
+                render_batch(batch)
+
+        for entry in files:
+            link_or_copy(Path(entry.pop('cache')), output / entry['file'])
+        manifest = {'name': self.spec['name'], 'spec': self.spec, 'files': files}
+        datastore.write_atomic(output / 'manifest.json', json.dumps(manifest, indent=1))
+        return {'rendered': len(pending), 'cached': len(files) - len(pending), 'files': len(files),
+                'seconds': time.perf_counter() - started}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('spec', nargs='?', help='campaign spec (JSON)')
+    parser.add_argument('--output', default=None, help='directory for the graphics (default: campaign/<name>)')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--example', action='store_true', help='print an example spec and exit')
+    args = parser.parse_args(argv)
+
+    if args.example:
+        print(json.dumps(EXAMPLE_SPEC, indent=2))
+        return 0
+    if args.spec is None:
+        parser.error('a campaign spec is required (see --example)')
+
+    with open(args.spec, 'r') as f:
+        spec = json.load(f)
+    campaign = Campaign(spec, workers=args.workers)
+    output = args.output or os.path.join('campaign', campaign.spec['name'])
+    try:
+        result = campaign.render(output)
+    except RuntimeError as e:
+        print(e, file=sys.stderr)
+        return 1
+    print(f"{result['files']} files in {output}: {result['rendered']} rendered, "
+          f"{result['cached']} from cache, {result['seconds']:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
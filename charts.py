@@ -0,0 +1,147 @@
+"""Plotly helpers for large series: server-side decimation, WebGL and a figure cache.
+
+Line traces longer than the chart's pixel width are decimated with LTTB
+(largest-triangle-three-buckets) or min/max bucketing before they are sent to
+the browser, and figures with many points switch to WebGL (scattergl)
+traces. Built figures are cached as serialized JSON per (chart, filters,
+data version, FIGURE_VERSION) in memory and under .traffiq_cache/figures.
+"""
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+import datastore
+
+# Rough plot width in pixels; a line never needs more points than this
+PIXEL_WIDTH = 1000
+# Figures with more points than this render as WebGL instead of SVG
+WEBGL_THRESHOLD = 2000
+# Serialized figures kept in memory
+CACHE_SIZE = 128
+# Bump when figure code or styling changes so cached figures are rebuilt
+FIGURE_VERSION = 1
+
+def lttb_indices(x, y, n):
+    """Indices of the n points LTTB keeps from an x-sorted series"""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    # n - 2 middle buckets between the fixed first and last points
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+
+    a = 0
+    for i in range(n - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else size
+        avg_x = x[end:next_end].mean()
+        avg_y = y[end:next_end].mean()
+        # The point forming the largest triangle with the last kept point and the next bucket's mean
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.nanargmax(area)) if not np.isnan(area).all() else start
+        keep[i + 1] = a
+    return keep
+
+def minmax_indices(y, n):
+    """Indices of the minimum and maximum of n // 2 equal buckets, plus both ends"""
+    size = len(y)
+    if n >= size:
+        return np.arange(size)
+
+    buckets = max(n // 2, 1)
+    edges = np.linspace(0, size, buckets + 1).astype(np.int64)
+    bucket = np.repeat(np.arange(buckets), np.diff(edges))
+    # Sorting by (bucket, y) puts each bucket's min first and max last
+    order = np.lexsort((np.nan_to_num(np.asarray(y, dtype=float), nan=-np.inf), bucket))
+    lows = order[edges[:-1]]
+    highs = order[edges[1:] - 1]
+    return np.unique(np.concatenate([[0], lows, highs, [size - 1]]))
+
+def _numeric(values):
+    values = np.asarray(values)
+    if values.dtype.kind == 'M':
+        return values.astype('datetime64[ns]').astype(np.int64).astype(float)
+    if values.dtype.kind == 'O':
+        try:
+            return np.asarray(values, dtype='datetime64[ns]').astype(np.int64).astype(float)
+        except (TypeError, ValueError):
+            return np.arange(len(values), dtype=float)
+    return values.astype(float)
+
+def decimate(x, y, n=PIXEL_WIDTH, method='lttb'):
+    """(x, y) reduced to about n points"""
+    x, y = np.asarray(x), np.asarray(y)
+    if method == 'minmax':
+        keep = minmax_indices(y, n)
+    else:
+        keep = lttb_indices(_numeric(x), y, n)
+    return x[keep], y[keep]
+
+def _is_line(trace):
+    return 'lines' in (trace.mode or 'lines') and not np.ndim(getattr(trace.marker, 'size', None))
+
+def optimize(fig, width=PIXEL_WIDTH, method='lttb'):
+    """Decimate long line traces and switch to WebGL when the figure is still large"""
+    import plotly.graph_objects as go
+
+    total = 0
+    for trace in fig.data:
+        # px already picks scattergl for large frames; those still need decimating
+        if trace.type not in ('scatter', 'scattergl') or trace.x is None or trace.y is None:
+            continue
+        if _is_line(trace) and len(trace.x) > width:
+            x, y = decimate(trace.x, trace.y, width, method)
+            trace.update(x=x, y=y)
+        total += len(trace.x)
+
+    if total <= WEBGL_THRESHOLD:
+        return fig
+
+    traces = []
+    for trace in fig.data:
+        if trace.type != 'scatter':
+            traces.append(trace)
+            continue
+        spec = trace.to_plotly_json()
+        spec.pop('type', None)
+        # Drops what WebGL can't draw (e.g. spline lines, orientation) instead of failing
+        traces.append(go.Scattergl(spec, skip_invalid=True))
+    return go.Figure(data=traces, layout=fig.layout)
+
+_figures = OrderedDict()
+_figures_lock = threading.Lock()
+
+def figure_key(chart, filters, version):
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    return f'{version}-{chart}-v{FIGURE_VERSION}-{digest}'
+
+def cached_figure(chart, filters, version, build):
+    """Figure dict for (chart, filters, data version); `build` returns a plotly Figure or None"""
+    key = figure_key(chart, filters, version)
+    with _figures_lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return json.loads(_figures[key])
+
+    path = datastore.cache_path('figures', f'{key}.json')
+    if path.is_file():
+        payload = path.read_text()
+    else:
+        fig = build()
+        if fig is None:
+            return None
+        payload = fig.to_json()
+        datastore.write_atomic(path, payload)
+
+    with _figures_lock:
+        _figures[key] = payload
+        if len(_figures) > CACHE_SIZE:
+            _figures.popitem(last=False)
+    return json.loads(payload)
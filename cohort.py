@@ -0,0 +1,178 @@
+"""Cohort join layer across the license, accident and violation datasets.
+
+Each dataset is first reduced to a small table keyed on dimension values
+(nationality group, birth year, year), cached on disk per data version.
+Cohort questions such as accidents per licensed driver by nationality group
+and age band are answered by joining those tables, never the raw rows.
+
+    python cohort.py --year 2023
+"""
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+import aggregate
+import datastore
+import materialize
+
+# Bump when a table definition changes so cached tables are rebuilt
+TABLE_VERSION = 1
+
+LICENSES_FILE = 'liz.csv'
+ACCIDENTS_FILE = 'facc.csv'
+VIOLATIONS_FILE = 'viola.json'
+# Accident tables are materialized against the zone polygons
+POLYGONS_FILE = 'qatar_zones_polygons.json'
+
+AGE_BINS = [0, 25, 35, 45, 55, 65, 200]
+AGE_BANDS = ['<25', '25-34', '35-44', '45-54', '55-64', '65+']
+
+def nationality_group(values):
+    """Nationality group labels normalized the same way for every dataset"""
+    return values.astype('string').str.strip().str.upper().fillna('UNKNOWN')
+
+def age_band(ages):
+    return pd.cut(ages, bins=AGE_BINS, labels=AGE_BANDS, right=False)
+
+def license_table(df):
+    """Licenses issued per (nationality group, birth year, issue year)"""
+    keys = pd.DataFrame({
+        'NATIONALITY_GROUP': nationality_group(df['NATIONALITY_GROUP']),
+        'BIRTH_YEAR': pd.to_numeric(df['BIRTHYEAR'], errors='coerce'),
+        'YEAR': pd.to_datetime(df['FIRST_ISSUEDATE'], errors='coerce').dt.year,
+    }).dropna()
+    return aggregate.groupby(keys, ['NATIONALITY_GROUP', 'BIRTH_YEAR', 'YEAR'])['COUNT'].reset_index()
+
+def accident_table(df):
+    """Accidents and deaths per (nationality group, perpetrator birth year, accident year)"""
+    keys = pd.DataFrame({
+        'NATIONALITY_GROUP': nationality_group(df['NATIONALITY_GROUP_OF_ACCIDENT_']),
+        'BIRTH_YEAR': pd.to_numeric(df['BIRTH_YEAR_OF_ACCIDENT_PERPETR'], errors='coerce'),
+        'YEAR': pd.to_numeric(df['ACCIDENT_YEAR'], errors='coerce'),
+        'DEATH_COUNT': pd.to_numeric(df['DEATH_COUNT'], errors='coerce'),
+    }).dropna(subset=['BIRTH_YEAR', 'YEAR'])
+    table = aggregate.groupby(keys, ['NATIONALITY_GROUP', 'BIRTH_YEAR', 'YEAR'], ['DEATH_COUNT']).reset_index()
+    return table.rename(columns={'COUNT': 'ACCIDENTS', 'DEATH_COUNT': 'DEATHS'})
+
+def violation_table(records):
+    """Total traffic violations per year"""
+    df = pd.DataFrame(records)
+    totals = pd.to_numeric(df['mjmw_lmkhlft_lmrwry_total_traffic_violations'], errors='coerce').fillna(0)
+    years = pd.to_datetime(df['month']).dt.year
+    return totals.groupby(years).sum().rename_axis('YEAR').reset_index(name='VIOLATIONS')
+
+def load_json(path):
+    with open(path, 'r') as f:
+        return json.load(f)
+
+class CohortTables:
+    """The per-dataset dimension tables for one version of the source files"""
+
+    def __init__(self, licenses, accidents, violations, version=None):
+        self.licenses = licenses
+        self.accidents = accidents
+        self.violations = violations
+        self.version = version
+
+    @classmethod
+    def load(cls, licenses_file=LICENSES_FILE, accidents_file=ACCIDENTS_FILE, violations_file=VIOLATIONS_FILE,
+             frames=None):
+        """Tables for the current source files, rebuilt only for files that changed
+
+        `frames` may hold already-loaded 'licenses' / 'accidents' frames to build from;
+        otherwise the materialized tables are used when present, and the CSVs last.
+        """
+        frames = {name: frame for name, frame in (frames or {}).items() if frame is not None}
+
+        def source(name, artifact, sources, read):
+            if name in frames:
+                return frames[name]
+            # Validated table from `python materialize.py`, memory-mapped, when it matches the files
+            table = materialize.load_table(artifact, sources)
+            return table if table is not None else read()
+
+        builders = {
+            'licenses': (licenses_file, lambda: license_table(source(
+                'licenses', 'licenses_table', (licenses_file,),
+                lambda: pd.read_csv(licenses_file, skipinitialspace=True,
+                                    usecols=['FIRST_ISSUEDATE', 'BIRTHYEAR', 'NATIONALITY_GROUP'])))),
+            'accidents': (accidents_file, lambda: accident_table(source(
+                'accidents', 'accidents_table', (accidents_file, POLYGONS_FILE),
+                lambda: pd.read_csv(accidents_file, skipinitialspace=True,
+                                    usecols=['ACCIDENT_YEAR', 'NATIONALITY_GROUP_OF_ACCIDENT_',
+                                             'BIRTH_YEAR_OF_ACCIDENT_PERPETR', 'DEATH_COUNT'])))),
+            'violations': (violations_file, lambda: violation_table(load_json(violations_file))),
+        }
+
+        tables = {}
+        for name, (path, build) in builders.items():
+            version = datastore.dataset_version(path)
+            cache_file = datastore.cache_path('cohort', f'{name}-{TABLE_VERSION}-{version}.csv')
+            if cache_file.is_file():
+                tables[name] = pd.read_csv(cache_file, keep_default_na=False, na_values=[''])
+            else:
+                tables[name] = build()
+                datastore.write_atomic(cache_file, tables[name].to_csv(index=False))
+
+        version = datastore.dataset_version(licenses_file, accidents_file, violations_file)
+        return cls(tables['licenses'], tables['accidents'], tables['violations'], version)
+
+    def licensed_drivers(self, year):
+        """Drivers first licensed in or before `year`, by nationality group and birth year"""
+        issued = self.licenses[self.licenses['YEAR'] <= year]
+        return issued.groupby(['NATIONALITY_GROUP', 'BIRTH_YEAR'])['COUNT'].sum().rename('LICENSED')
+
+    def cohort_rates(self, year, by=('NATIONALITY_GROUP', 'AGE_BAND')):
+        """Licensed drivers, accidents, deaths and rates per 1,000 drivers for one year"""
+        by = list(by)
+        accidents = self.accidents[self.accidents['YEAR'] == year]
+        accidents = accidents.groupby(['NATIONALITY_GROUP', 'BIRTH_YEAR'])[['ACCIDENTS', 'DEATHS']].sum()
+
+        joined = pd.concat([self.licensed_drivers(year), accidents], axis=1).fillna(0).reset_index()
+        joined['AGE_BAND'] = age_band(year - joined['BIRTH_YEAR'])
+        rates = joined.groupby(by, observed=True)[['LICENSED', 'ACCIDENTS', 'DEATHS']].sum().reset_index()
+
+        licensed = rates['LICENSED'].to_numpy(dtype=float)
+        for column in ['ACCIDENTS', 'DEATHS']:
+            rates[f'{column}_PER_1000'] = np.divide(
+                1000 * rates[column].to_numpy(dtype=float), licensed,
+                out=np.full(len(rates), np.nan), where=licensed > 0
+            )
+        return rates
+
+    def yearly_overview(self):
+        """National licensed-driver stock alongside accidents and violations per year"""
+        issued = self.licenses.groupby('YEAR')['COUNT'].sum()
+        accidents = self.accidents.groupby('YEAR')[['ACCIDENTS', 'DEATHS']].sum()
+        violations = self.violations.set_index('YEAR')['VIOLATIONS']
+        years = accidents.index.union(violations.index)
+
+        overview = pd.DataFrame(index=pd.Index(years, name='YEAR'))
+        overview['LICENSED'] = issued.reindex(issued.index.union(years), fill_value=0).cumsum().reindex(years)
+        overview = overview.join(accidents).join(violations).fillna(0)
+        licensed = overview['LICENSED'].where(overview['LICENSED'] > 0)
+        overview['ACCIDENTS_PER_1000'] = 1000 * overview['ACCIDENTS'] / licensed
+        overview['VIOLATIONS_PER_DRIVER'] = overview['VIOLATIONS'] / licensed
+        return overview.reset_index()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--licenses', default=LICENSES_FILE)
+    parser.add_argument('--accidents', default=ACCIDENTS_FILE)
+    parser.add_argument('--violations', default=VIOLATIONS_FILE)
+    parser.add_argument('--year', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    tables = CohortTables.load(args.licenses, args.accidents, args.violations)
+    year = args.year or int(tables.accidents['YEAR'].max())
+    pd.set_option('display.width', 140)
+    print(tables.yearly_overview().to_string(index=False))
+    print()
+    print(tables.cohort_rates(year).to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+import hashlib
+import os
+import threading
+from pathlib import Path
+
+# Derived artifacts (map payloads, model files, ...) live under this directory
+CACHE_DIR = Path(os.environ.get('TRAFFIQ_CACHE_DIR', '.traffiq_cache'))
+
+def dataset_version(*paths):
+    """Short version key that changes whenever any of the source files change"""
+    digest = hashlib.sha1()
+    for path in paths:
+        try:
+            stat = Path(path).stat()
+            digest.update(f'{path}:{stat.st_size}:{stat.st_mtime_ns};'.encode())
+        except OSError:
+            digest.update(f'{path}:missing;'.encode())
+    return digest.hexdigest()[:12]
+
+def cache_path(*parts):
+    """Path inside the artifact cache, creating parent directories as needed"""
+    path = CACHE_DIR.joinpath(*parts)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return path
+
+def write_atomic(path, data):
+    """Write bytes or text so readers never see a half-written file"""
+    path = Path(path)
+    # One temp file per writer; sessions and export requests write from their own threads
+    tmp = path.with_name(f'.{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+    mode = 'wb' if isinstance(data, bytes) else 'w'
+    try:
+        with open(tmp, mode) as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
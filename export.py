@@ -0,0 +1,300 @@
+"""Headless export of the dashboard aggregates as JSON or CSV.
+
+Serves the same numbers the dashboards compute, from the refresher's
+published snapshots, over a small local HTTP server or the command line.
+Every response carries an ETag derived from the snapshot's data version,
+so a conditional request with If-None-Match costs a lookup and a 304.
+
+    python export.py serve --port 8600
+    python export.py get accidents/zones --year 2023 --format csv
+    python export.py dump exports/ --format csv
+
+    curl -H 'If-None-Match: "<etag>"' localhost:8600/violations/anomalies.csv
+    curl -o traffiq.zip 'localhost:8600/bulk?format=csv'
+"""
+import argparse
+import hashlib
+import io
+import json
+import logging
+import sys
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+import datastore
+import refresher
+
+FORMATS = {
+    'json': 'application/json',
+    'csv': 'text/csv; charset=utf-8',
+}
+
+def _year(params, required=False):
+    if 'year' not in params:
+        if required:
+            raise ValueError("'year' is required")
+        return None
+    try:
+        return int(params['year'])
+    except ValueError:
+        raise ValueError(f"Invalid year '{params['year']}'")
+
+def accident_metrics(dashboard, params):
+    return dashboard.calculate_metrics()
+
+def accident_zones(dashboard, params):
+    import aggregate
+
+    year = _year(params)
+    df = dashboard.df[dashboard.mapped_zones(dashboard.df['ZONE'])]
+    df = df if year is None else df[df['ACCIDENT_YEAR'] == year]
+    table = aggregate.groupby(df, ['ACCIDENT_YEAR', 'ZONE'], ['DEATH_COUNT']).reset_index()
+    table.insert(2, 'NAME', [dashboard.zone_names.get(zone, f'Zone {zone}') for zone in table['ZONE']])
+    return table.rename(columns={'COUNT': 'ACCIDENTS', 'DEATH_COUNT': 'DEATHS'})
+
+def accident_severity(dashboard, params):
+    import aggregate
+
+    return aggregate.groupby(dashboard.df, ['ACCIDENT_YEAR', 'ACCIDENT_SEVERITY'], ['DEATH_COUNT']).reset_index()
+
+def accident_hotspots(dashboard, params):
+    year = _year(params)
+    year = year if year is not None else dashboard.current_year
+    # Checked here so an out-of-range year is a bad request, not an unknown export
+    years = dashboard.temporal_cube().years
+    if year not in years:
+        raise ValueError(f"No accident data for year {year}; valid years: {', '.join(str(y) for y in years)}")
+    return dashboard.hotspot_table(year)
+
+def license_yearly(dashboard, params):
+    import aggregate
+
+    return aggregate.groupby(dashboard.license_df, ['YEAR', 'GENDER', 'NATIONALITY_GROUP']).reset_index()
+
+def license_ages(dashboard, params):
+    import aggregate
+
+    return aggregate.groupby(dashboard.license_df, ['AGE']).reset_index()
+
+def violation_fingerprints(data, params):
+    from viola import violation_names
+
+    df, fingerprints = data[0], data[1]
+    frame = fingerprints.rename(columns=violation_names)
+    frame.insert(0, 'month', df['month'].dt.strftime('%Y-%m'))
+    return frame
+
+def violation_similarity(data, params):
+    df, similarity_matrix = data[0], data[2]
+    months = df['month'].dt.strftime('%Y-%m')
+    return pd.DataFrame(similarity_matrix, index=pd.Index(months, name='month'), columns=months).reset_index()
+
+def violation_anomalies(data, params):
+    scores = data[3].copy()
+    scores['month'] = scores['month'].dt.strftime('%Y-%m')
+    return scores
+
+def cohort_overview(tables, params):
+    return tables.yearly_overview()
+
+def cohort_rates(tables, params):
+    return tables.cohort_rates(_year(params, required=True))
+
+# name -> (dataset, builder, parameters it accepts)
+EXPORTS = {
+    'accidents/metrics': ('accidents', accident_metrics, ()),
+    'accidents/zones': ('accidents', accident_zones, ('year',)),
+    'accidents/severity': ('accidents', accident_severity, ()),
+    'accidents/hotspots': ('accidents', accident_hotspots, ('year',)),
+    'licenses/yearly': ('licenses', license_yearly, ()),
+    'licenses/ages': ('licenses', license_ages, ()),
+    'violations/fingerprints': ('violations', violation_fingerprints, ()),
+    'violations/similarity': ('violations', violation_similarity, ()),
+    'violations/anomalies': ('violations', violation_anomalies, ()),
+    'cohort/overview': ('cohort', cohort_overview, ()),
+    'cohort/rates': ('cohort', cohort_rates, ('year',)),
+}
+
+def serialize(result, fmt):
+    if fmt == 'csv':
+        frame = pd.DataFrame([result]) if isinstance(result, dict) else result
+        return frame.to_csv(index=False).encode()
+    if isinstance(result, pd.DataFrame):
+        return result.to_json(orient='records', date_format='iso').encode()
+    return json.dumps(result, default=str).encode()
+
+class Exporter:
+    """Builds exports from the current snapshot of each dataset"""
+
+    def __init__(self, source=None):
+        self.source = source or refresher.get()
+
+    def version(self, dataset):
+        return self.source.current(dataset).version
+
+    def etag(self, name, params, snapshot=None):
+        """Strong validator for (export, parameters) at the current data version"""
+        if name not in EXPORTS:
+            raise KeyError(name)
+        dataset, _, accepted = EXPORTS[name]
+        unknown = set(params) - set(accepted)
+        if unknown:
+            raise ValueError(f"Unsupported parameters for {name}: {', '.join(sorted(unknown))}")
+        key = name + '?' + '&'.join(f'{k}={params[k]}' for k in sorted(params))
+        version = snapshot.version if snapshot is not None else self.version(dataset)
+        return f'{version}-{hashlib.sha1(key.encode()).hexdigest()[:10]}'
+
+    def export(self, name, params=None, fmt='json'):
+        """(etag, body bytes), reusing the serialized payload kept on disk for that etag"""
+        params = params or {}
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown format '{fmt}'")
+        # ETag and body both come from this one snapshot, even if a swap happens meanwhile
+        snapshot = self.source.current(EXPORTS[name][0]) if name in EXPORTS else None
+        etag = self.etag(name, params, snapshot)
+        path = datastore.cache_path('export', f'{etag}.{fmt}')
+        if path.is_file():
+            return etag, path.read_bytes()
+
+        body = serialize(EXPORTS[name][1](snapshot.value, params), fmt)
+        datastore.write_atomic(path, body)
+        return etag, body
+
+    def bulk_etag(self, fmt):
+        versions = ','.join(self.version(dataset) for dataset in sorted(refresher.DATASETS))
+        return hashlib.sha1(f'{versions}:{fmt}'.encode()).hexdigest()[:16]
+
+    def bulk(self, fmt='json'):
+        """(etag, zip bytes) with every export that needs no parameters"""
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, (_, _, accepted) in EXPORTS.items():
+                if name == 'cohort/rates':
+                    continue
+                _, body = self.export(name, {}, fmt)
+                archive.writestr(f"{name.replace('/', '-')}.{fmt}", body)
+        return self.bulk_etag(fmt), buffer.getvalue()
+
+def make_handler(exporter):
+    class ExportHandler(BaseHTTPRequestHandler):
+        def do_HEAD(self):
+            self.respond(send_body=False)
+
+        def do_GET(self):
+            self.respond(send_body=True)
+
+        def respond(self, send_body):
+            url = urlsplit(self.path)
+            params = dict(parse_qsl(url.query))
+            name = url.path.strip('/')
+            fmt = params.pop('format', 'json')
+            if name.endswith(('.json', '.csv')):
+                name, fmt = name.rsplit('.', 1)
+
+            try:
+                if name == '':
+                    body = json.dumps({
+                        'exports': {key: list(spec[2]) for key, spec in EXPORTS.items()},
+                        'versions': {dataset: exporter.version(dataset) for dataset in refresher.DATASETS},
+                    }).encode()
+                    return self.send(200, body, 'application/json', send_body=send_body)
+
+                if fmt not in FORMATS:
+                    raise ValueError(f"Unknown format '{fmt}'")
+                if name == 'bulk':
+                    etag = exporter.bulk_etag(fmt)
+                    if self.not_modified(etag):
+                        return self.send(304, b'', None, etag=etag, send_body=False)
+                    etag, body = exporter.bulk(fmt)
+                    return self.send(200, body, 'application/zip', etag=etag, send_body=send_body,
+                                     filename=f'traffiq-{etag}.zip')
+
+                etag = exporter.etag(name, params)
+                if self.not_modified(etag):
+                    return self.send(304, b'', None, etag=etag, send_body=False)
+                etag, body = exporter.export(name, params, fmt)
+                return self.send(200, body, FORMATS[fmt], etag=etag, send_body=send_body)
+            except KeyError:
+                return self.send(404, json.dumps({'error': f"Unknown export '{name}'"}).encode(),
+                                 'application/json', send_body=send_body)
+            except ValueError as e:
+                return self.send(400, json.dumps({'error': str(e)}).encode(), 'application/json',
+                                 send_body=send_body)
+
+        def not_modified(self, etag):
+            candidates = [tag.strip() for tag in self.headers.get('If-None-Match', '').split(',')]
+            return f'"{etag}"' in candidates or '*' in candidates
+
+        def send(self, status, body, content_type, etag=None, send_body=True, filename=None):
+            self.send_response(status)
+            if etag:
+                self.send_header('ETag', f'"{etag}"')
+                # Clients may keep the payload but must revalidate; a match costs a 304
+                self.send_header('Cache-Control', 'no-cache')
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            if filename:
+                self.send_header('Content-Disposition', f'attachment; filename="{filename}"')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if send_body and body:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.getLogger('traffiq.export').info(format, *args)
+
+    return ExportHandler
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    serve = commands.add_parser('serve', help='run the HTTP export server')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=8600)
+
+    get = commands.add_parser('get', help='print one export')
+    get.add_argument('name', choices=sorted(EXPORTS))
+    get.add_argument('--year', default=None)
+    get.add_argument('--format', choices=sorted(FORMATS), default='json')
+
+    dump = commands.add_parser('dump', help='write every export to a directory')
+    dump.add_argument('output')
+    dump.add_argument('--format', choices=sorted(FORMATS), default='json')
+    args = parser.parse_args(argv)
+
+    exporter = Exporter()
+    if args.command == 'serve':
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(exporter))
+        print(f"Serving exports on http://{args.host}:{args.port}/")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.command == 'get':
+        params = {'year': args.year} if args.year is not None else {}
+        try:
+            _, body = exporter.export(args.name, params, args.format)
+        except ValueError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        sys.stdout.write(body.decode())
+        return 0
+
+    output = Path(args.output)
+    output.mkdir(parents=True, exist_ok=True)
+    _, archive = exporter.bulk(args.format)
+    with zipfile.ZipFile(io.BytesIO(archive)) as bundle:
+        bundle.extractall(output)
+        print(f"Wrote {len(bundle.namelist())} exports to {output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,227 @@
+"""Per-zone weekly accident forecasts with cached model artifacts.
+
+Fits one lightweight model per zone on weekly accident counts, in parallel
+across zones, and stores the fitted models plus precomputed forecasts under
+.traffiq_cache/forecast. Refits only touch zones whose weekly series changed.
+
+    python forecast.py facc.csv --polygons-file qatar_zones_polygons.json --workers 4
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import datastore
+
+# Bump when the features or model setup change so old artifacts are refit
+MODEL_VERSION = 1
+
+HORIZON_WEEKS = 12
+# Weeks of history kept alongside each forecast for charting
+HISTORY_WEEKS = 52
+# Zones with fewer weeks or accidents than this get the seasonal baseline
+MIN_WEEKS = 26
+MIN_ACCIDENTS = 30
+# Key used for the national series alongside the zone IDs
+NATIONAL = 'ALL'
+
+def weekly_counts(df):
+    """(zones, week starts, zones x weeks count matrix) from ACCIDENT_DATE"""
+    dates = pd.to_datetime(df['ACCIDENT_DATE'], errors='coerce')
+    known = dates.notna().to_numpy()
+    week_start = (dates[known] - pd.to_timedelta(dates[known].dt.dayofweek, unit='D')).dt.normalize()
+
+    weeks = pd.date_range(week_start.min(), week_start.max(), freq='W-MON')
+    week_codes = ((week_start - weeks[0]).dt.days // 7).to_numpy()
+    zone_codes, zones = pd.factorize(df['ZONE'].astype(str).to_numpy()[known], sort=True)
+
+    counts = np.bincount(
+        zone_codes * len(weeks) + week_codes,
+        minlength=len(zones) * len(weeks)
+    ).reshape(len(zones), len(weeks))
+    # Accidents without a zone number count towards the national series only
+    mapped = zones != 'Unknown'
+    return list(zones[mapped]) + [NATIONAL], weeks, np.vstack([counts[mapped], counts.sum(axis=0)])
+
+def features(week_index, week_of_year):
+    """Trend and two Fourier harmonics of the week of year"""
+    angle = 2 * np.pi * np.asarray(week_of_year) / 52.18
+    return np.column_stack([
+        np.asarray(week_index) / 52.0,
+        np.sin(angle), np.cos(angle),
+        np.sin(2 * angle), np.cos(2 * angle)
+    ])
+
+def series_hash(weeks, counts):
+    digest = hashlib.sha1(f'{MODEL_VERSION}:{weeks[0].date()}:{len(weeks)}'.encode())
+    digest.update(np.ascontiguousarray(counts, dtype=np.int64).tobytes())
+    return digest.hexdigest()[:16]
+
+def fit_zone(task):
+    """Fit one zone's model and forecast the next HORIZON_WEEKS weeks"""
+    from scipy.stats import poisson
+
+    zone, weeks, counts, previous_model = task
+    history = len(counts)
+    future = pd.date_range(weeks[-1] + pd.Timedelta(weeks=1), periods=HORIZON_WEEKS, freq='W-MON')
+
+    if history >= MIN_WEEKS and counts.sum() >= MIN_ACCIDENTS:
+        from sklearn.linear_model import PoissonRegressor
+
+        model = previous_model
+        if model is None:
+            model = PoissonRegressor(alpha=1e-4, max_iter=300, warm_start=True)
+        X = features(np.arange(history), weeks.isocalendar().week.to_numpy())
+        model.fit(X, counts)
+        expected = model.predict(features(
+            np.arange(history, history + HORIZON_WEEKS),
+            future.isocalendar().week.to_numpy()
+        ))
+        kind = 'poisson_glm'
+    else:
+        # Seasonal-naive baseline: the same weeks a year earlier, or the recent mean
+        model = None
+        if history >= 52:
+            expected = counts[history - 52:history - 52 + HORIZON_WEEKS].astype(float)
+        else:
+            expected = np.full(HORIZON_WEEKS, counts[-8:].mean() if history else 0.0)
+        kind = 'baseline'
+
+    return {
+        'zone': zone,
+        'kind': kind,
+        'model': pickle.dumps(model) if model is not None else None,
+        'weeks': [week.strftime('%Y-%m-%d') for week in future],
+        'expected': np.round(expected, 3).tolist(),
+        'lower': poisson.ppf(0.05, expected).tolist(),
+        'upper': poisson.ppf(0.95, expected).tolist(),
+        'history_weeks': [week.strftime('%Y-%m-%d') for week in weeks[-HISTORY_WEEKS:]],
+        'history': counts[-HISTORY_WEEKS:].tolist(),
+    }
+
+class ForecastStore:
+    def __init__(self, root=None):
+        self.root = root or datastore.cache_path('forecast', 'manifest.json').parent
+        self.manifest_path = self.root / 'manifest.json'
+        self.manifest = self.load_manifest()
+
+    def load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if manifest.get('model_version') == MODEL_VERSION:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'model_version': MODEL_VERSION, 'data_version': None, 'zones': {}}
+
+    def model_path(self, zone):
+        return self.root / f'zone-{zone}.pkl'
+
+    def load_model(self, zone):
+        try:
+            with open(self.model_path(zone), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.PickleError, EOFError):
+            return None
+
+    def update(self, df, data_version=None, workers=None):
+        """Refit zones whose weekly series changed and persist the artifacts"""
+        zones, weeks, counts = weekly_counts(df)
+        stored = self.manifest['zones']
+
+        tasks, hashes = [], {}
+        for zone, row in zip(zones, counts):
+            hashes[zone] = series_hash(weeks, row)
+            if stored.get(zone, {}).get('hash') != hashes[zone]:
+                # Warm-start from the previous fit when the zone has one
+                tasks.append((zone, weeks, row, self.load_model(zone)))
+
+        if tasks:
+            workers = workers or os.cpu_count() or 1
+            if workers > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    results = list(pool.map(fit_zone, tasks, chunksize=max(1, len(tasks) // (workers * 4))))
+            else:
+                results = [fit_zone(task) for task in tasks]
+
+            for result in results:
+                zone = result.pop('zone')
+                model = result.pop('model')
+                if model is not None:
+                    datastore.write_atomic(self.model_path(zone), model)
+                stored[zone] = {'hash': hashes[zone], 'fitted_at': time.time(), **result}
+
+        self.manifest.update({
+            'data_version': data_version,
+            'history_end': weeks[-1].strftime('%Y-%m-%d'),
+            'zones': {zone: stored[zone] for zone in zones}
+        })
+        datastore.write_atomic(self.manifest_path, json.dumps(self.manifest))
+        return len(tasks)
+
+    def is_current(self, data_version):
+        return bool(self.manifest['zones']) and self.manifest.get('data_version') == data_version
+
+    def forecast(self, zone=NATIONAL):
+        """Precomputed forecast for a zone as a frame, or None if it was never fitted"""
+        entry = self.manifest['zones'].get(str(zone))
+        if entry is None:
+            return None
+        return pd.DataFrame({
+            'WEEK': pd.to_datetime(entry['weeks']),
+            'EXPECTED': entry['expected'],
+            'LOWER': entry['lower'],
+            'UPPER': entry['upper'],
+        })
+
+    def history(self, zone=NATIONAL):
+        """Recent weekly counts stored with the zone's forecast"""
+        entry = self.manifest['zones'].get(str(zone))
+        if entry is None:
+            return None
+        return pd.DataFrame({'WEEK': pd.to_datetime(entry['history_weeks']), 'COUNT': entry['history']})
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('accidents_file', nargs='?', default='facc.csv')
+    parser.add_argument('--polygons-file', default='qatar_zones_polygons.json')
+    parser.add_argument('--workers', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    import materialize
+    import validate
+
+    # The validated, cleaned rows the dashboard fits on, so both write the same forecasts
+    df = materialize.load_table('accidents_table', (args.accidents_file, args.polygons_file))
+    if df is None:
+        import acc
+
+        zones_data = None
+        if os.path.isfile(args.polygons_file):
+            with open(args.polygons_file, 'r') as f:
+                zones_data = json.load(f)
+        try:
+            df, _ = acc.ingest_accidents(pd.read_csv(args.accidents_file, skipinitialspace=True), zones_data)
+        except validate.SchemaError as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+    if 'ACCIDENT_DATE' not in df.columns:
+        print(f"Error: {args.accidents_file} has no ACCIDENT_DATE column to forecast from", file=sys.stderr)
+        return 1
+
+    store = ForecastStore()
+    start = time.perf_counter()
+    refit = store.update(df, datastore.dataset_version(args.accidents_file), workers=args.workers)
+    print(f"Refit {refit} of {len(store.manifest['zones'])} series in {time.perf_counter() - start:.1f}s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+import datastore
+
+# Boundaries closer than this (degrees, about 100 m) count as shared
+CONTIGUITY_TOLERANCE = 0.001
+# Edges are resampled at this spacing so long straight edges still meet
+DENSIFY_STEP = 0.0005
+# Zones with no contiguous neighbour are linked to their nearest zones instead
+FALLBACK_NEIGHBORS = 3
+
+# Two-sided z thresholds for hot / cold spot classification
+SIGNIFICANCE = {0.99: 2.576, 0.95: 1.960, 0.90: 1.645}
+
+def densify(ring, step=DENSIFY_STEP):
+    """Points along a closed ring at no more than `step` spacing"""
+    segments = np.diff(ring, axis=0)
+    pieces = np.maximum(np.ceil(np.hypot(segments[:, 0], segments[:, 1]) / step).astype(int), 1)
+    index = np.repeat(np.arange(len(segments)), pieces)
+    fraction = np.concatenate([np.arange(n) / n for n in pieces])
+    return ring[index] + segments[index] * fraction[:, None]
+
+def build_adjacency(zones_data):
+    """Binary, symmetric zone adjacency from polygon geometry as (zones, CSR matrix)"""
+    from scipy import sparse
+    from scipy.spatial import cKDTree
+
+    zones = sorted(zones_data, key=lambda z: int(z) if str(z).isdigit() else str(z))
+    points, labels, centroids = [], [], []
+    for i, zone in enumerate(zones):
+        ring = np.array([[p['lng'], p['lat']] for p in zones_data[zone]['coordinates']], dtype=float)
+        centroids.append(ring.mean(axis=0))
+        ring = np.vstack([ring, ring[:1]])
+        dense = densify(ring)
+        points.append(dense)
+        labels.append(np.full(len(dense), i))
+    points = np.vstack(points)
+    labels = np.concatenate(labels)
+
+    # Contiguity: any two boundary points of different zones within tolerance
+    pairs = cKDTree(points).query_pairs(CONTIGUITY_TOLERANCE, output_type='ndarray')
+    a, b = labels[pairs[:, 0]], labels[pairs[:, 1]]
+    different = a != b
+    rows, cols = a[different], b[different]
+
+    # Nearest-centroid fallback for zones that touch nothing
+    n = len(zones)
+    degree = np.bincount(np.concatenate([rows, cols]), minlength=n)
+    isolated = np.flatnonzero(degree == 0)
+    if len(isolated):
+        centroids = np.array(centroids)
+        _, nearest = cKDTree(centroids).query(centroids[isolated], k=FALLBACK_NEIGHBORS + 1)
+        rows = np.concatenate([rows, np.repeat(isolated, FALLBACK_NEIGHBORS)])
+        cols = np.concatenate([cols, nearest[:, 1:].ravel()])
+
+    weights = sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(n, n)).tocsr()
+    weights = ((weights + weights.T) > 0).astype(np.float64)
+    weights.setdiag(0)
+    weights.eliminate_zeros()
+    return [str(zone) for zone in zones], weights
+
+def load_adjacency(zones_data, version):
+    """Adjacency for a polygon file version, computed once and kept on disk"""
+    from scipy import sparse
+
+    matrix_path = datastore.cache_path('adjacency', f'{version}.npz')
+    zones_path = datastore.cache_path('adjacency', f'{version}.json')
+    if matrix_path.is_file() and zones_path.is_file():
+        with open(zones_path, 'r') as f:
+            return json.load(f), sparse.load_npz(matrix_path)
+
+    zones, weights = build_adjacency(zones_data)
+    # Write beside the target and swap in, so readers never load a partial file
+    tmp = matrix_path.with_name(f'.{version}.tmp.npz')
+    sparse.save_npz(tmp, weights)
+    tmp.replace(matrix_path)
+    datastore.write_atomic(zones_path, json.dumps(zones))
+    return zones, weights
+
+def zone_matrix(values, zones):
+    """Align a {zone: count} mapping, Series or zone-indexed frame to the adjacency order"""
+    frame = pd.Series(values).to_frame() if isinstance(values, dict) else pd.DataFrame(values)
+    frame.index = frame.index.astype(str)
+    return frame.reindex(zones).fillna(0).to_numpy(dtype=float)
+
+def zone_period_counts(df, zones, period='year'):
+    """(zones, periods) accident counts per year, month or hour in one bincount pass"""
+    if period == 'year':
+        keys = df['ACCIDENT_YEAR'].to_numpy()
+    elif period == 'month':
+        keys = pd.to_datetime(df['ACCIDENT_DATE']).dt.to_period('M').astype(str).to_numpy()
+    elif period == 'hour':
+        keys = pd.to_numeric(df['HOUR'], errors='coerce').fillna(-1).astype(int).to_numpy()
+    else:
+        raise ValueError(f"Unknown period '{period}'")
+
+    zone_codes = pd.Index(zones).get_indexer(df['ZONE'].astype(str))
+    period_codes, periods = pd.factorize(keys, sort=True)
+    known = zone_codes >= 0
+    flat = zone_codes[known] * len(periods) + period_codes[known]
+    counts = np.bincount(flat, minlength=len(zones) * len(periods)).reshape(len(zones), len(periods))
+    return counts.astype(float), list(periods)
+
+def getis_ord_gi_star(weights, x):
+    """Gi* z-scores for every zone and period; x is (zones, periods)"""
+    from scipy import sparse
+
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    n = x.shape[0]
+
+    # Gi* includes each zone in its own neighbourhood
+    w = weights + sparse.identity(n, format='csr')
+    w_sum = np.asarray(w.sum(axis=1)).ravel()[:, None]
+    w_sq_sum = np.asarray(w.multiply(w).sum(axis=1)).ravel()[:, None]
+
+    mean = x.mean(axis=0)
+    s = np.sqrt(np.maximum((x ** 2).mean(axis=0) - mean ** 2, 0))
+    numerator = w @ x - mean * w_sum
+    denominator = s * np.sqrt(np.maximum(n * w_sq_sum - w_sum ** 2, 0) / (n - 1))
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+def local_morans_i(weights, x):
+    """Local Moran's I for every zone and period with row-standardized weights"""
+    from scipy import sparse
+
+    x = np.asarray(x, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+
+    row_sums = np.asarray(weights.sum(axis=1)).ravel()
+    w = sparse.diags(np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)) @ weights
+
+    z = x - x.mean(axis=0)
+    m2 = (z ** 2).mean(axis=0)
+    return np.divide(z * (w @ z), m2, out=np.zeros_like(z), where=m2 > 0)
+
+def classify(gi_star, confidence=0.95):
+    """'hot', 'cold' or '' per entry of a Gi* z-score array"""
+    threshold = SIGNIFICANCE[confidence]
+    return np.where(gi_star >= threshold, 'hot', np.where(gi_star <= -threshold, 'cold', ''))
+
+def hotspot_table(zones, weights, x, zone_names=None, confidence=0.95):
+    """Gi*, local Moran's I and classification for one period as a frame"""
+    gi = getis_ord_gi_star(weights, x)[:, 0]
+    moran = local_morans_i(weights, x)[:, 0]
+    zone_names = zone_names or {}
+    return pd.DataFrame({
+        'ZONE': zones,
+        'NAME': [zone_names.get(zone, f'Zone {zone}') for zone in zones],
+        'VALUE': np.asarray(x, dtype=float).reshape(len(zones), -1)[:, 0],
+        'GI_STAR': gi,
+        'LOCAL_MORAN_I': moran,
+        'CLASS': classify(gi, confidence)
+    }).sort_values('GI_STAR', ascending=False, ignore_index=True)
@@ -0,0 +1,92 @@
+"""Import-time budget check for the dashboards.
+
+Runs each dashboard module under ``python -X importtime`` in a fresh
+interpreter and fails if it pulls in a deferred dependency (beyond what
+Streamlit itself loads) or goes over its time budget.
+
+    python importtime.py            # check every module
+    python importtime.py acc liz    # check selected modules
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+# Cumulative import time allowed per module, in milliseconds
+BUDGETS_MS = {
+    'acc': 2500,
+    'liz': 2500,
+    'viola': 2500,
+    'app': 2000,
+}
+
+# Heavy dependencies that must only be imported at the point of first use
+DEFERRED_MODULES = [
+    'folium',
+    'branca',
+    'streamlit_folium',
+    'plotly',
+    'sklearn',
+    'groq',
+]
+
+def measure_imports(module):
+    """Import a module in a fresh interpreter and return {module: cumulative_us}"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=Path(__file__).resolve().parent,
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        errors = [line for line in result.stderr.splitlines() if not line.startswith('import time:')]
+        raise RuntimeError(f"Importing '{module}' failed:\n" + "\n".join(errors))
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or '|' not in line:
+            continue
+        _, cumulative, name = [part.strip() for part in line[len('import time:'):].split('|')]
+        if cumulative.isdigit():
+            timings[name] = int(cumulative)
+    return timings
+
+def check_module(module, budget_ms, baseline):
+    """Return a list of budget violations for one module"""
+    timings = measure_imports(module)
+    problems = []
+
+    loaded = [
+        name for name in timings
+        if name.split('.')[0] in DEFERRED_MODULES and name not in baseline
+    ]
+    roots = sorted({name.split('.')[0] for name in loaded})
+    if roots:
+        problems.append(f"{module}: imports deferred dependencies at load time: {', '.join(roots)}")
+
+    total_ms = timings.get(module, 0) / 1000
+    if total_ms > budget_ms:
+        problems.append(f"{module}: import took {total_ms:.0f} ms (budget {budget_ms} ms)")
+
+    print(f"{module:<8} {total_ms:8.0f} ms  (budget {budget_ms} ms)")
+    return problems
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('modules', nargs='*', default=list(BUDGETS_MS))
+    args = parser.parse_args(argv)
+
+    # Streamlit loads parts of plotly itself; only flag imports beyond that
+    baseline = set(measure_imports('streamlit'))
+
+    problems = []
+    for module in args.modules:
+        budget_ms = BUDGETS_MS.get(module, min(BUDGETS_MS.values()))
+        problems.extend(check_module(module, budget_ms, baseline))
+
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Per-rerun stage timings for the dashboard pages.
+
+Each page calls start_run() at the top of a rerun and wraps its load,
+aggregate and render steps in stage() or @timed, which record wall and CPU
+time into the session's Profiler and into process-wide totals exported in
+the Prometheus text format. Adding ?debug=1 to a page URL shows the
+session's records in a Performance panel along with payload sizes.
+
+Allocation tracking uses tracemalloc, which traces the whole process and
+slows every allocation, so it only runs when the server is started with
+TRAFFIQ_DEBUG=1. Its figures are process-wide: with several sessions
+rerunning at once, a stage's alloc_bytes and peak_bytes include the other
+sessions' allocations, so profile memory with a single session.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+import streamlit as st
+
+logger = logging.getLogger('traffiq.instrument')
+
+class Profiler:
+    def __init__(self, page, previous=None):
+        self.page = page
+        self.records = []
+        self.started = time.time()
+        # Stages of the rerun before this one, e.g. the LLM call that ended in st.rerun()
+        self.previous_records = previous.records if previous else []
+
+    def to_json(self):
+        return json.dumps({'page': self.page, 'started': self.started, 'stages': self.records})
+
+# Process-wide totals per (page, kind, stage) for the Prometheus export
+_totals = {}
+_totals_lock = threading.Lock()
+
+# Profiler used when running outside Streamlit (benchmarks, CLI tools)
+_fallback = Profiler('headless')
+
+def tracing():
+    """Whether allocations are traced; a server-wide switch, never turned on from a URL"""
+    return os.environ.get('TRAFFIQ_DEBUG') == '1'
+
+def enabled():
+    """Whether detailed profiling (payload sizes, debug panel) is on"""
+    if tracing():
+        return True
+    try:
+        return st.runtime.exists() and st.query_params.get('debug') == '1'
+    except Exception:
+        return False
+
+def start_run(page):
+    """Start a fresh set of stage records for this rerun of a page"""
+    if st.runtime.exists():
+        profiler = Profiler(page, st.session_state.get('_traffiq_profiler'))
+        st.session_state['_traffiq_profiler'] = profiler
+    else:
+        global _fallback
+        profiler = Profiler(page, _fallback)
+        _fallback = profiler
+    if tracing() and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    return profiler
+
+def current():
+    """The profiler for the current rerun"""
+    if st.runtime.exists():
+        if '_traffiq_profiler' not in st.session_state:
+            st.session_state['_traffiq_profiler'] = Profiler('unknown')
+        return st.session_state['_traffiq_profiler']
+    return _fallback
+
+def payload_size(obj):
+    """Approximate serialized size in bytes of what is sent to the browser"""
+    if obj is None:
+        return None
+    if isinstance(obj, (bytes, str)):
+        return len(obj)
+    if hasattr(obj, 'get_root'):
+        # Folium map: the HTML document st_folium ships to the client
+        return len(obj.get_root().render())
+    if hasattr(obj, 'to_plotly_json'):
+        return len(obj.to_json())
+    if hasattr(obj, 'memory_usage'):
+        return int(obj.memory_usage(deep=True).sum())
+    return len(json.dumps(obj, default=str))
+
+class Stage:
+    def __init__(self, name, kind):
+        self.name = name
+        self.kind = kind
+        self.payload = None
+
+@contextmanager
+def stage(name, kind):
+    """Record wall time, CPU time, allocations and payload size of a block"""
+    record = Stage(name, kind)
+    detailed = enabled()
+    traced = tracing() and tracemalloc.is_tracing()
+    if traced:
+        alloc_start = tracemalloc.get_traced_memory()[0]
+        # Peaks are per stage; a nested stage resets its parent's peak
+        tracemalloc.reset_peak()
+    wall_start = time.perf_counter()
+    cpu_start = time.process_time()
+    try:
+        yield record
+    finally:
+        entry = {
+            'stage': name,
+            'kind': kind,
+            'wall_s': round(time.perf_counter() - wall_start, 6),
+            'cpu_s': round(time.process_time() - cpu_start, 6),
+        }
+        if traced:
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            entry['alloc_bytes'] = current_bytes - alloc_start
+            entry['peak_bytes'] = peak_bytes - alloc_start
+        if detailed:
+            try:
+                entry['payload_bytes'] = payload_size(record.payload)
+            except Exception:
+                entry['payload_bytes'] = None
+        _record(entry)
+
+def timed(kind, name=None):
+    """Decorator form of stage() for dashboard methods"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage(name or func.__name__, kind) as record:
+                result = func(*args, **kwargs)
+                record.payload = result if kind == 'render' else None
+                return result
+        return wrapper
+    return decorator
+
+def _record(entry):
+    profiler = current()
+    profiler.records.append(entry)
+    logger.debug(json.dumps({'page': profiler.page, **entry}))
+
+    key = (profiler.page, entry['kind'], entry['stage'])
+    with _totals_lock:
+        total = _totals.setdefault(key, {'count': 0, 'wall_s': 0.0, 'cpu_s': 0.0})
+        total['count'] += 1
+        total['wall_s'] += entry['wall_s']
+        total['cpu_s'] += entry['cpu_s']
+
+def prometheus_text():
+    """Process-wide stage totals in the Prometheus text exposition format"""
+    lines = [
+        '# HELP traffiq_stage_runs_total Number of times a dashboard stage ran.',
+        '# TYPE traffiq_stage_runs_total counter',
+        '# HELP traffiq_stage_wall_seconds_total Wall time spent in a dashboard stage.',
+        '# TYPE traffiq_stage_wall_seconds_total counter',
+        '# HELP traffiq_stage_cpu_seconds_total CPU time spent in a dashboard stage.',
+        '# TYPE traffiq_stage_cpu_seconds_total counter',
+    ]
+    with _totals_lock:
+        totals = sorted(_totals.items())
+    for (page, kind, name), total in totals:
+        labels = f'page="{page}",kind="{kind}",stage="{name}"'
+        lines.append(f'traffiq_stage_runs_total{{{labels}}} {total["count"]}')
+        lines.append(f'traffiq_stage_wall_seconds_total{{{labels}}} {total["wall_s"]:.6f}')
+        lines.append(f'traffiq_stage_cpu_seconds_total{{{labels}}} {total["cpu_s"]:.6f}')
+    return '\n'.join(lines) + '\n'
+
+def render_debug_panel():
+    """Show this rerun's stage timings when profiling is enabled"""
+    if not enabled():
+        return
+
+    profiler = current()
+    with st.expander(f"Performance ({profiler.page})", expanded=False):
+        if profiler.records:
+            st.dataframe(profiler.records, use_container_width=True)
+            total_wall = sum(r['wall_s'] for r in profiler.records)
+            st.caption(f"{len(profiler.records)} stages, {total_wall:.3f}s wall time")
+        else:
+            st.caption("No stages recorded in this rerun.")
+        if profiler.previous_records:
+            st.caption("Previous rerun")
+            st.dataframe(profiler.previous_records, use_container_width=True)
+
+        col1, col2 = st.columns(2)
+        with col1:
+            st.download_button("Download JSON", profiler.to_json(),
+                               file_name=f'{profiler.page}-stages.json', mime='application/json')
+        with col2:
+            st.download_button("Download Prometheus metrics", prometheus_text(),
+                               file_name='traffiq-metrics.txt', mime='text/plain')
@@ -1,14 +1,32 @@
 import streamlit as st
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
-import logging
-from datetime import datetime
+import aggregate
+import charts
+import cohort
+import datastore
+import instrument
+import materialize
+import refresher
+import validate
+
+def clean_licenses(df):
+    df['FIRST_ISSUEDATE'] = pd.to_datetime(df['FIRST_ISSUEDATE'])
+    df['AGE'] = df['FIRST_ISSUEDATE'].dt.year - df['BIRTHYEAR']
+    df['MONTH'] = df['FIRST_ISSUEDATE'].dt.month
+    df['YEAR'] = df['FIRST_ISSUEDATE'].dt.year
+    return df
+
+def ingest_licenses(df):
+    """Quarantine invalid raw rows, then clean the rest; returns (df, validate.Report)"""
+    df, report = validate.licenses(df)
+    return clean_licenses(df), report
 
 class LicenseDashboard:
     def __init__(self, license_file='liz.csv'):
         self.license_file = license_file
         self.license_df = None
+        self.quality = None
+        self.data_version = datastore.dataset_version(license_file)
         self.colors = {
             'background': '#000000',
             'text': '#FFFFFF',
@@ -20,19 +38,33 @@ class LicenseDashboard:
         }
         self.load_data()
     
+    @instrument.timed('load')
     def load_data(self):
         try:
-            self.license_df = pd.read_csv(self.license_file, skipinitialspace=True)
-            self.license_df['FIRST_ISSUEDATE'] = pd.to_datetime(self.license_df['FIRST_ISSUEDATE'])
-            self.license_df['AGE'] = self.license_df['FIRST_ISSUEDATE'].dt.year - self.license_df['BIRTHYEAR']
-            self.license_df['MONTH'] = self.license_df['FIRST_ISSUEDATE'].dt.month
-            self.license_df['YEAR'] = self.license_df['FIRST_ISSUEDATE'].dt.year
+            # Materialized table when one matches the file, else validate and clean the CSV
+            self.license_df = materialize.load_table('licenses_table', (self.license_file,))
+            self.quality = validate.Report.load('licenses', self.data_version)
+            if self.license_df is None or self.quality is None:
+                self.license_df, self.quality = ingest_licenses(pd.read_csv(self.license_file, skipinitialspace=True))
+                self.quality.save(self.data_version)
+        except FileNotFoundError:
+            st.error(f"License file '{self.license_file}' not found. Please ensure the file is available.")
+        except validate.SchemaError as e:
+            st.error(str(e))
         except Exception as e:
-            st.error("Error loading data. Please check the log file for details.")
+            st.error(f"Could not load license data from '{self.license_file}': {e}")
     
+    @instrument.timed('render')
     def create_license_line_chart(self, selected_category, selected_year):
         if selected_category not in self.license_df.columns:
             return None
+        return charts.cached_figure(
+            'license_line', {'category': selected_category, 'year': selected_year}, self.data_version,
+            lambda: self.build_license_line_chart(selected_category, selected_year)
+        )
+
+    def build_license_line_chart(self, selected_category, selected_year):
+        import plotly.express as px
 
         try:
             license_counts = self.license_df[self.license_df['YEAR'] == selected_year].groupby(
@@ -54,13 +86,19 @@ class LicenseDashboard:
                 paper_bgcolor=self.colors['background'],
                 font_color=self.colors['text']
             )
-            return fig
+            return charts.optimize(fig)
         except Exception as e:
             return None
 
+    @instrument.timed('render')
     def create_age_bubble_chart(self):
+        return charts.cached_figure('license_ages', {}, self.data_version, self.build_age_bubble_chart)
+
+    def build_age_bubble_chart(self):
+        import plotly.express as px
+
         try:
-            age_counts = self.license_df.groupby('AGE').size().reset_index(name='COUNT')
+            age_counts = aggregate.groupby(self.license_df, ['AGE'])['COUNT'].reset_index()
             mean_age = self.license_df['AGE'].mean()
 
             fig = px.scatter(
@@ -85,13 +123,19 @@ class LicenseDashboard:
                 paper_bgcolor=self.colors['background'],
                 font_color=self.colors['text']
             )
-            return fig
+            return charts.optimize(fig)
         except Exception as e:
             return None
 
+    @instrument.timed('render')
     def create_annual_license_chart(self):
+        return charts.cached_figure('license_annual', {}, self.data_version, self.build_annual_license_chart)
+
+    def build_annual_license_chart(self):
+        import plotly.express as px
+
         try:
-            monthly_counts = self.license_df.groupby(['YEAR', 'MONTH']).size().reset_index(name='COUNT')
+            monthly_counts = aggregate.groupby(self.license_df, ['YEAR', 'MONTH'])['COUNT'].reset_index()
             
             fig = px.line(
                 monthly_counts, 
@@ -113,17 +157,51 @@ class LicenseDashboard:
                 paper_bgcolor=self.colors['background'],
                 font_color=self.colors['text']
             )
-            return fig
+            return charts.optimize(fig)
         except Exception as e:
             return None
 
-    def run_dashboard(self):
-        # Set page config
-        st.set_page_config(
-            page_title="TraffiQ",
-            page_icon="🚗",
-            layout="wide"
+    def load_cohort_tables(self):
+        try:
+            return refresher.current('cohort')
+        except (OSError, KeyError, ValueError):
+            st.warning("Accident or violation data is unavailable for the cohort view.")
+            return None
+
+    @instrument.timed('render')
+    def create_cohort_chart(self, tables, year):
+        import plotly.express as px
+
+        rates = tables.cohort_rates(year).dropna(subset=['ACCIDENTS_PER_1000'])
+        fig = px.bar(
+            rates,
+            x='NATIONALITY_GROUP',
+            y='ACCIDENTS_PER_1000',
+            color='AGE_BAND',
+            barmode='group',
+            category_orders={'AGE_BAND': cohort.AGE_BANDS},
+            hover_data=['LICENSED', 'ACCIDENTS', 'DEATHS'],
+            color_discrete_sequence=[self.colors['neon_pink'], self.colors['neon_cyan'], self.colors['neon_green'],
+                                     self.colors['neon_blue'], self.colors['maroon'], '#FFFF00'],
+            title=f"Accidents per 1,000 Licensed Drivers ({year})"
+        )
+        fig.update_layout(
+            xaxis_title="Nationality Group",
+            yaxis_title="Accidents per 1,000 Drivers",
+            plot_bgcolor=self.colors['background'],
+            paper_bgcolor=self.colors['background'],
+            font_color=self.colors['text']
         )
+        return fig
+
+    def run_dashboard(self, standalone=True):
+        # Page config and the home link belong to the standalone app; traffiq.py owns both when mounted as a page
+        if standalone:
+            st.set_page_config(
+                page_title="TraffiQ",
+                page_icon="🚗",
+                layout="wide"
+            )
 
         # Custom CSS
         st.markdown("""
@@ -157,16 +235,18 @@ class LicenseDashboard:
         """, unsafe_allow_html=True)
 
         # Home button
-        st.markdown("""
-        <a href="https://traffiq.streamlit.app/" class="home-button">
-            <span class="home-button-icon">🏠</span>
-            <span>Home</span>
-        </a>
-        """, unsafe_allow_html=True)
+        if standalone:
+            st.markdown("""
+            <a href="https://traffiq.streamlit.app/" class="home-button">
+                <span class="home-button-icon">🏠</span>
+                <span>Home</span>
+            </a>
+            """, unsafe_allow_html=True)
 
         # Title
         st.title("TraffiQ")
         st.markdown("### License Dashboard")
+        validate.show(self.quality, 'license')
 
         # Create columns for filters
         col1, col2 = st.columns(2)
@@ -206,6 +286,25 @@ class LicenseDashboard:
         if category_chart:
             st.plotly_chart(category_chart, use_container_width=True)
 
+        # Accident risk per licensed driver, joined across datasets
+        st.markdown("### Accident Risk by Cohort")
+        tables = self.load_cohort_tables()
+        if tables is not None:
+            years = sorted(set(tables.accidents['YEAR'].astype(int)) & set(tables.licenses['YEAR'].astype(int)))
+            if years:
+                cohort_year = st.selectbox("Select Cohort Year", options=years, index=len(years) - 1, key='cohort_year')
+                st.plotly_chart(self.create_cohort_chart(tables, cohort_year), use_container_width=True)
+                st.caption("Licensed drivers are those first licensed in or before the selected year within the license data.")
+            else:
+                st.warning("The license and accident data do not share any year.")
+
+        instrument.render_debug_panel()
+
+def shared_dashboard():
+    # Latest loaded dashboard, shared by every session and page; reloads happen in the background
+    return refresher.current('licenses')
+
 if __name__ == "__main__":
-    dashboard = LicenseDashboard()
+    instrument.start_run('licenses')
+    dashboard = shared_dashboard()
     dashboard.run_dashboard()
\ No newline at end of file
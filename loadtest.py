@@ -0,0 +1,395 @@
+"""Concurrent-session load test for the TraffiQ pages.
+
+Runs N headless Streamlit sessions (streamlit.testing AppTest) on parallel
+threads of one process, as a server does. Each session follows a randomized
+interaction script on one page: it switches years, categories, zones and
+months, and on the home page it sends chat questions. The chat goes through
+the real Groq SDK to an in-process stub of the API (via GROQ_BASE_URL) with
+configurable latency. The test reports p50/p95/p99 rerun latency per page
+and action, throughput, and resident memory per session.
+
+    python loadtest.py --sessions 8 --steps 20
+    python loadtest.py --sessions 32 --pages acc viola --llm-latency 2.5 --compare load_results.json
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import numpy as np
+
+ROOT = Path(__file__).resolve().parent
+
+# Widgets each page's sessions change, as (element kind, label, values to pick from).
+# Selectboxes pick one of their displayed options; other widgets need the underlying values.
+SCRIPTS = {
+    'acc': [
+        ('selectbox', 'Select Year:', None),
+        ('selectbox', 'Select Category:', None),
+        ('selectbox', 'Select Zone:', None),
+        ('select_slider', 'Hour of Day:', [None] + list(range(24))),
+        ('selectbox', 'Group By:', None),
+        ('selectbox', 'Select Week:', None),
+    ],
+    'liz': [
+        ('selectbox', 'Select Category', None),
+        ('selectbox', 'Select Year', None),
+        ('selectbox', 'Select Cohort Year', None),
+    ],
+    'viola': [
+        ('selectbox', 'Select Violation Type for Line Chart:', None),
+        ('selectbox', 'Select Month for Pattern Analysis:', None),
+    ],
+    'app': [
+        ('chat_input', None, None),
+    ],
+}
+
+QUESTIONS = [
+    "Which zones have the most accidents?",
+    "When are the peak accident times in Doha?",
+    "How many pedestrian deaths were recorded?",
+    "What policies reduced accidents in urban areas?",
+    "Which nationality groups are involved in most accidents?",
+    "What is the average age of drivers in accidents?",
+]
+
+PERCENTILES = (50, 95, 99)
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Set on the server: (latency seconds, jitter seconds)
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        latency, jitter = self.server.latency
+        time.sleep(max(0.0, latency + random.uniform(-jitter, jitter)))
+        with self.server.lock:
+            self.server.requests += 1
+
+        body = json.dumps({
+            'id': f'stub-{self.server.requests}',
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': 'stub',
+            'choices': [{
+                'index': 0,
+                'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': 'Stub answer about Qatar traffic.'},
+            }],
+            'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class StubLLM:
+    """Local stand-in for the Groq chat completions API"""
+
+    def __init__(self, latency=1.0, jitter=0.2):
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+        self.server.latency = (latency, jitter)
+        self.server.requests = 0
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever, name='stub-llm', daemon=True)
+
+    @property
+    def url(self):
+        host, port = self.server.server_address
+        return f'http://{host}:{port}'
+
+    @property
+    def requests(self):
+        return self.server.requests
+
+    def __enter__(self):
+        self.thread.start()
+        # The Groq client falls back to this when no base_url is passed
+        os.environ['GROQ_BASE_URL'] = self.url
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+def rss_mb():
+    """Resident memory of this process in MB"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 1024 ** 2
+    except OSError:
+        import resource
+
+        # Peak rather than current RSS where /proc is unavailable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def find(at, kind, label):
+    for widget in getattr(at, kind):
+        if label is None or widget.label == label:
+            return widget
+    return None
+
+def select_label(widget, option):
+    """Choose a selectbox option by its displayed text, which is what the browser sends
+
+    AppTest's own select_index stores the text as the value and then looks it up
+    through format_func, which fails for selectboxes whose options are formatted.
+    """
+    from streamlit.proto.WidgetStates_pb2 import WidgetState
+    from streamlit.testing.v1.element_tree import Selectbox
+
+    class DisplayedSelectbox(Selectbox):
+        @property
+        def _widget_state(self):
+            state = WidgetState()
+            state.id = self.id
+            state.string_value = option
+            return state
+
+    widget.set_value(option)
+    widget.__class__ = DisplayedSelectbox
+
+def interact(at, kind, label, values, rng):
+    """Change one widget the way a user would; returns False if the page doesn't show it"""
+    widget = find(at, kind, label)
+    if widget is None:
+        return False
+    if kind == 'chat_input':
+        widget.set_value(QUESTIONS[rng.integers(len(QUESTIONS))])
+    elif values is not None:
+        widget.set_value(values[rng.integers(len(values))])
+    else:
+        select_label(widget, widget.options[rng.integers(len(widget.options))])
+    return True
+
+def shared_runtime(secrets):
+    """Make AppTest sessions share one runtime, script cache, config and set of secrets, as a server's do
+
+    AppTest installs a fresh mock runtime for every run and removes it afterwards, which
+    breaks any other session running at that moment. Its per-run bookkeeping is pointed at
+    a detached subclass instead, and one runtime stays installed for the whole test.
+    Returns a function that undoes this.
+    """
+    from unittest.mock import MagicMock
+
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1 import app_test, util
+
+    class DetachedRuntime(Runtime):
+        _instance = None
+
+    # The same pieces AppTest puts on its per-run runtime
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage('/mock/media'))
+    runtime.dataframe_source_mgr = app_test.DataframeSourceManager()
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    components = app_test.BidiComponentManager()
+    components.discover_and_register_components(start_file_watching=False)
+    runtime.bidi_component_registry = components
+
+    # A server compiles each page once; per-run caches would also parse concurrently,
+    # which CPython's parser does not tolerate on every version
+    script_cache = app_test.ScriptCache()
+
+    saved = (app_test.Runtime, app_test.ScriptCache, app_test.patch_config_options, config.get_option,
+             Runtime._instance, st.secrets)
+    app_test.Runtime = DetachedRuntime
+    app_test.ScriptCache = lambda: script_cache
+    # Each run patches the global config and restores it on exit, undoing it for runs still going
+    app_test.patch_config_options = lambda overrides: contextlib.nullcontext()
+    config.get_option = util.build_mock_config_get_option({'global.appTest': True})
+    Runtime._instance = runtime
+    st.secrets = Secrets()
+    st.secrets._secrets = dict(secrets)
+
+    def restore():
+        (app_test.Runtime, app_test.ScriptCache, app_test.patch_config_options, config.get_option,
+         Runtime._instance, st.secrets) = saved
+
+    return restore
+
+def run_session(page, steps, seed, think_time, timeout):
+    """One simulated analyst; returns (samples, error messages)"""
+    from streamlit.testing.v1 import AppTest
+
+    rng = np.random.default_rng(seed)
+    at = AppTest.from_file(str(ROOT / f'{page}.py'), default_timeout=timeout)
+    samples, errors = [], []
+
+    def rerun(action):
+        started = time.perf_counter()
+        try:
+            at.run()
+            failed = [str(e.value) for e in at.exception]
+        except Exception as e:
+            failed = [f'{type(e).__name__}: {e}']
+        samples.append({'page': page, 'action': action, 'seconds': time.perf_counter() - started,
+                        'ok': not failed})
+        errors.extend(failed)
+
+    rerun('load')
+    for _ in range(steps):
+        time.sleep(rng.exponential(think_time) if think_time else 0)
+        kind, label, values = SCRIPTS[page][rng.integers(len(SCRIPTS[page]))]
+        if interact(at, kind, label, values, rng):
+            rerun(label or kind)
+    return samples, errors
+
+def percentiles(seconds):
+    values = np.percentile(seconds, PERCENTILES) if len(seconds) else [float('nan')] * len(PERCENTILES)
+    return {f'p{p}': round(float(v), 4) for p, v in zip(PERCENTILES, values)}
+
+def summarize(samples, group):
+    summary = {}
+    for key in sorted({tuple(s[g] for g in group) for s in samples}):
+        matching = [s for s in samples if tuple(s[g] for g in group) == key]
+        summary['/'.join(key)] = {
+            'reruns': len(matching),
+            'errors': sum(not s['ok'] for s in matching),
+            **percentiles([s['seconds'] for s in matching]),
+        }
+    return summary
+
+def run_sessions(pages, sessions, steps, think_time, seed, timeout):
+    """Run every session concurrently; returns (samples, errors, wall seconds, baseline MB, peak MB)"""
+    baseline = rss_mb()
+    peak = baseline
+    done = threading.Event()
+
+    def watch_memory():
+        nonlocal peak
+        while not done.wait(0.25):
+            peak = max(peak, rss_mb())
+
+    watcher = threading.Thread(target=watch_memory, daemon=True)
+    watcher.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as pool:
+        futures = [
+            pool.submit(run_session, pages[i % len(pages)], steps, seed + i + 1, think_time, timeout)
+            for i in range(sessions)
+        ]
+        results = [future.result() for future in futures]
+    wall = time.perf_counter() - started
+    done.set()
+    watcher.join()
+
+    samples = [sample for session, _ in results for sample in session]
+    errors = [error for _, session in results for error in session]
+    return samples, errors, wall, baseline, peak
+
+def run(pages, sessions, steps, think_time, llm_latency, seed=0, warmup=True, timeout=300):
+    restore = shared_runtime({'GROQ_API_KEY': 'stub'})
+    try:
+        with StubLLM(llm_latency) as llm:
+            if warmup:
+                # Build the shared datasets and caches once, as an instance does for its first visitor
+                for page in pages:
+                    run_session(page, 0, seed, 0, timeout)
+            samples, errors, wall, baseline, peak = run_sessions(pages, sessions, steps, think_time, seed, timeout)
+            llm_requests = llm.requests
+    finally:
+        restore()
+
+    interactions = [s for s in samples if s['action'] != 'load']
+    return {
+        'sessions': sessions,
+        'steps': steps,
+        'think_time': think_time,
+        'llm_latency': llm_latency,
+        'llm_requests': llm_requests,
+        'wall_seconds': round(wall, 3),
+        'reruns': len(samples),
+        'throughput_per_second': round(len(samples) / wall, 3) if wall else None,
+        'rerun': {**percentiles([s['seconds'] for s in interactions]),
+                  'errors': sum(not s['ok'] for s in interactions)},
+        'rss_mb_baseline': round(baseline, 1),
+        'rss_mb_peak': round(peak, 1),
+        'mb_per_session': round((peak - baseline) / sessions, 2),
+        'pages': summarize(samples, ['page']),
+        'actions': summarize(samples, ['page', 'action']),
+        'errors': sorted(set(errors))[:20],
+    }
+
+def report(result):
+    print(f"\n{result['sessions']} sessions, {result['reruns']} reruns in {result['wall_seconds']:.1f}s "
+          f"({result['throughput_per_second']:.2f} reruns/s), LLM stub {result['llm_latency']}s "
+          f"x {result['llm_requests']} requests")
+    rerun = result['rerun']
+    print(f"interaction reruns  p50 {rerun['p50']:.3f}s  p95 {rerun['p95']:.3f}s  p99 {rerun['p99']:.3f}s  "
+          f"errors {rerun['errors']}")
+    print(f"memory  baseline {result['rss_mb_baseline']:.0f} MB  peak {result['rss_mb_peak']:.0f} MB  "
+          f"{result['mb_per_session']:.1f} MB/session\n")
+    for name, stats in result['actions'].items():
+        print(f"{name:<52} {stats['reruns']:>5} {stats['p50']:8.3f}s {stats['p95']:8.3f}s "
+              f"{stats['p99']:8.3f}s  {stats['errors']} errors")
+    for error in result['errors']:
+        print(f"  ! {error}")
+
+def compare(result, baseline_file):
+    """Print the per-action p95 change against a previous results file"""
+    with open(baseline_file, 'r') as f:
+        baseline = json.load(f)['result']['actions']
+
+    print(f"\nCompared with {baseline_file}:")
+    for name, stats in result['actions'].items():
+        previous = baseline.get(name)
+        if previous and previous['p95']:
+            print(f"{name:<52} {stats['p95'] / previous['p95']:6.2f}x p95")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=8)
+    parser.add_argument('--steps', type=int, default=10, help='interactions per session')
+    parser.add_argument('--pages', nargs='+', choices=list(SCRIPTS), default=list(SCRIPTS))
+    parser.add_argument('--think-time', type=float, default=0.5, help='mean seconds between interactions')
+    parser.add_argument('--llm-latency', type=float, default=1.5, help='seconds per stub chat completion')
+    parser.add_argument('--no-warmup', action='store_true', help='count the first builds of each dataset')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='load_results.json')
+    parser.add_argument('--compare', help='previous results file to compare against')
+    args = parser.parse_args(argv)
+
+    # Streamlit warns about deprecated arguments and the missing runtime on every rerun
+    logging.getLogger('streamlit').setLevel(logging.ERROR)
+
+    result = run(args.pages, args.sessions, args.steps, args.think_time, args.llm_latency,
+                 seed=args.seed, warmup=not args.no_warmup)
+    report(result)
+
+    with open(args.output, 'w') as f:
+        json.dump({
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'seed': args.seed,
+            'result': result
+        }, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        compare(result, args.compare)
+    return 1 if result['rerun']['errors'] else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
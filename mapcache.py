@@ -0,0 +1,104 @@
+import json
+
+import numpy as np
+
+import datastore
+
+# Simplification tolerance in degrees (about 10 m) and coordinate precision
+SIMPLIFY_TOLERANCE = 0.0001
+COORD_DECIMALS = 5
+
+# Choropleth colour ramp shared with the legend
+COLOR_STOPS = ['#ff00ff', '#00ffff', '#ff0000']
+
+def simplify(points, tolerance=SIMPLIFY_TOLERANCE):
+    """Douglas-Peucker simplification of an (n, 2) ring"""
+    if len(points) <= 4:
+        return points
+
+    keep = np.zeros(len(points), dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        start, end = stack.pop()
+        if end - start < 2:
+            continue
+        segment = points[end] - points[start]
+        offsets = points[start + 1:end] - points[start]
+        length = np.hypot(*segment)
+        if length == 0:
+            distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        else:
+            distances = np.abs(segment[0] * offsets[:, 1] - segment[1] * offsets[:, 0]) / length
+        index = int(np.argmax(distances))
+        if distances[index] > tolerance:
+            split = start + 1 + index
+            keep[split] = True
+            stack.append((start, split))
+            stack.append((split, end))
+
+    simplified = points[keep]
+    # A ring needs at least four points to stay a valid polygon
+    return simplified if len(simplified) >= 4 else points
+
+def zone_geometry(zones_data):
+    """Simplified GeoJSON rings ([lng, lat]) per zone ID"""
+    geometry = {}
+    for zone, zone_data in zones_data.items():
+        points = np.array([[p['lng'], p['lat']] for p in zone_data['coordinates']], dtype=float)
+        if len(points) < 3:
+            continue
+        if not np.array_equal(points[0], points[-1]):
+            points = np.vstack([points, points[:1]])
+        ring = np.round(simplify(points), COORD_DECIMALS)
+        geometry[str(zone)] = ring.tolist()
+    return geometry
+
+def color_scale(values, vmax):
+    """Hex colours along COLOR_STOPS for values in [0, vmax]"""
+    stops = np.array([[int(c[i:i + 2], 16) for i in (1, 3, 5)] for c in COLOR_STOPS], dtype=float)
+    position = np.clip(np.asarray(values, dtype=float) / (vmax or 1), 0, 1) * (len(stops) - 1)
+    lower = np.minimum(position.astype(int), len(stops) - 2)
+    fraction = (position - lower)[:, None]
+    rgb = np.round(stops[lower] * (1 - fraction) + stops[lower + 1] * fraction).astype(int)
+    return ['#{:02x}{:02x}{:02x}'.format(*color) for color in rgb]
+
+def build_choropleth(zone_values, geometry, zone_names, label):
+    """GeoJSON FeatureCollection with precomputed fill colour and opacity per zone"""
+    zones = [zone for zone in zone_values if zone in geometry]
+    values = [zone_values[zone] for zone in zones]
+    vmax = max(values, default=0) or 1
+
+    features = []
+    for zone, value, color in zip(zones, values, color_scale(values, vmax)):
+        name = zone_names.get(zone, f'Zone {zone}')
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Polygon', 'coordinates': [geometry[zone]]},
+            'properties': {
+                'zone': zone,
+                'name': name,
+                'value': value,
+                'popup': f'{name}<br>{label}: {value}',
+                'style': {
+                    'weight': 0,
+                    'fillColor': color,
+                    'fillOpacity': round(0.2 + (value / vmax * 0.8), 3),
+                }
+            }
+        })
+    return {'type': 'FeatureCollection', 'features': features, 'vmax': vmax}
+
+def cached_choropleth(version, year, metric, build):
+    """Choropleth payload for (dataset version, year, metric), built once and kept on disk"""
+    path = datastore.cache_path('choropleth', f'{version}-{year}-{metric}.json')
+    if path.is_file():
+        try:
+            with open(path, 'r') as f:
+                return json.load(f)
+        except ValueError:
+            pass
+
+    payload = build()
+    datastore.write_atomic(path, json.dumps(payload, separators=(',', ':')))
+    return payload
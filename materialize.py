@@ -0,0 +1,365 @@
+"""Build every dashboard artifact offline, in parallel, skipping unchanged ones.
+
+Reads each raw source once into a typed columnar table (Arrow IPC, memory
+mappable) and derives the rest from those tables in worker processes: zone
+geometry and adjacency, the temporal cube, per-year choropleths, and violation
+fingerprints and similarities.
+Accident sketches and the sparse zone-day violation cube are streamed from
+their raw files chunk by chunk instead.
+Each artifact is keyed on a content hash of its sources and upstream
+artifacts; unchanged inputs are skipped, and an output whose bytes did not
+change is not rewritten.
+
+The dashboards look artifacts up by data version (a file stat) and only
+fall back to parsing the raw files when none is present.
+
+    python materialize.py --workers 4
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import datastore
+
+# Bump to rebuild every artifact after a change to how they are built
+BUILD_VERSION = 3
+
+# Accident rows are validated against the zone polygons, so the table depends on both
+ACCIDENT_SOURCES = ('facc.csv', 'qatar_zones_polygons.json')
+
+def artifact_path(name, version, suffix):
+    return datastore.cache_path('materialized', f'{name}-{version}.{suffix}')
+
+def write_table(df):
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    buffer = io.BytesIO()
+    # Uncompressed so readers can memory-map the columns
+    feather.write_feather(pa.Table.from_pandas(df, preserve_index=False), buffer, compression='uncompressed')
+    return buffer.getvalue()
+
+def read_arrow(path):
+    import pyarrow.feather as feather
+
+    return feather.read_table(path, memory_map=True)
+
+def load_table(name, sources):
+    """A materialized table for the current version of `sources`, or None"""
+    table = load_arrow(name, sources)
+    return None if table is None else table.to_pandas()
+
+def load_arrow(name, sources):
+    """A materialized table as a memory-mapped Arrow table, or None"""
+    path = artifact_path(name, datastore.dataset_version(*sources), 'arrow')
+    if not path.is_file():
+        return None
+    try:
+        return read_arrow(path)
+    except Exception:
+        return None
+
+def load_arrays(name, sources):
+    """A materialized npz artifact for the current version of `sources`, or None"""
+    path = artifact_path(name, datastore.dataset_version(*sources), 'npz')
+    if not path.is_file():
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as arrays:
+            return {key: arrays[key] for key in arrays.files}
+    except Exception:
+        return None
+
+def load_json(name, sources):
+    """A materialized JSON artifact for the current version of `sources`, or None"""
+    path = artifact_path(name, datastore.dataset_version(*sources), 'json')
+    if not path.is_file():
+        return None
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def npz_bytes(**arrays):
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+# Builders: take the artifact's data version, return the artifact bytes
+
+# Raw tables are validated on the way in; the data-quality report is saved beside them
+
+def build_accidents_table(version):
+    import acc
+
+    with open('qatar_zones_polygons.json', 'r') as f:
+        zones_data = json.load(f)
+    df, report = acc.ingest_accidents(pd.read_csv('facc.csv', skipinitialspace=True), zones_data)
+    report.save(version)
+    return write_table(df)
+
+def build_licenses_table(version):
+    import liz
+
+    df, report = liz.ingest_licenses(pd.read_csv('liz.csv', skipinitialspace=True))
+    report.save(version)
+    return write_table(df)
+
+def build_violations_table(version):
+    import viola
+
+    df, report = viola.ingest_violations(viola.read_json_data('viola.json'))
+    report.save(version)
+    return write_table(df)
+
+def build_accident_sketches(version):
+    import sketch
+
+    # Streamed through ingest chunk by chunk, the way new partitions arrive
+    with open('qatar_zones_polygons.json', 'r') as f:
+        zones_data = json.load(f)
+    return npz_bytes(**sketch.AccidentSketches.from_csv('facc.csv', zones_data).to_arrays())
+
+def build_violation_cube(version):
+    import violcube
+
+    return npz_bytes(**violcube.ViolationCube.from_csv('viola_zones.csv').to_arrays())
+
+def build_zone_geometry(version):
+    import hotspots
+    import mapcache
+
+    with open('qatar_zones_polygons.json', 'r') as f:
+        zones_data = json.load(f)
+    # Adjacency is cached by polygon file version, the key the dashboard asks for
+    hotspots.load_adjacency(zones_data, version)
+    return json.dumps(mapcache.zone_geometry(zones_data), separators=(',', ':')).encode()
+
+def build_temporal_cube(version):
+    import temporal
+
+    df = load_table('accidents_table', ACCIDENT_SOURCES)
+    cube = temporal.TemporalCube.from_accidents(df)
+    return npz_bytes(**cube.to_arrays())
+
+def build_choropleths(version):
+    import mapcache
+
+    df = load_table('accidents_table', ACCIDENT_SOURCES)
+    geometry = load_json('zone_geometry', ('qatar_zones_polygons.json',))
+    with open('zone_names.json', 'r') as f:
+        zone_names = json.load(f)
+
+    built = []
+    for year, year_data in df.groupby('ACCIDENT_YEAR'):
+        for metric, label in [('accidents', 'Accidents'), ('deaths', 'Deaths')]:
+            values = year_data.groupby('ZONE')['DEATH_COUNT'].sum() if metric == 'deaths' else year_data['ZONE'].value_counts()
+            zone_values = {str(zone): int(value) for zone, value in values.items()}
+            mapcache.cached_choropleth(
+                version, int(year), metric,
+                lambda: mapcache.build_choropleth(zone_values, geometry, zone_names, label)
+            )
+            built.append(f'{year}-{metric}')
+    return json.dumps(built).encode()
+
+def build_violation_index(version):
+    import regimes
+    import viola
+
+    df = load_table('violations_table', ('viola.json',))
+    fingerprints = viola.create_fingerprint(df)
+    regimes.load_regimes(version, df['month'], fingerprints)
+    return npz_bytes(
+        months=df['month'].dt.strftime('%Y-%m').to_numpy(dtype=str),
+        columns=np.array(fingerprints.columns, dtype=str),
+        fingerprints=fingerprints.to_numpy(dtype=float),
+        similarity=viola.cosine_similarity(fingerprints)
+    )
+
+# name -> (source files, upstream artifacts, builder, suffix)
+ARTIFACTS = {
+    'accidents_table': (ACCIDENT_SOURCES, (), build_accidents_table, 'arrow'),
+    'licenses_table': (('liz.csv',), (), build_licenses_table, 'arrow'),
+    'violations_table': (('viola.json',), (), build_violations_table, 'arrow'),
+    'accident_sketches': (ACCIDENT_SOURCES, (), build_accident_sketches, 'npz'),
+    'violation_cube': (('viola_zones.csv', 'qatar_zones_polygons.json'), (), build_violation_cube, 'npz'),
+    'zone_geometry': (('qatar_zones_polygons.json',), (), build_zone_geometry, 'json'),
+    'temporal_cube': (('facc.csv',), ('accidents_table',), build_temporal_cube, 'npz'),
+    'choropleths': (('facc.csv', 'qatar_zones_polygons.json', 'zone_names.json'),
+                    ('accidents_table', 'zone_geometry'), build_choropleths, 'json'),
+    'violation_index': (('viola.json',), ('violations_table',), build_violation_index, 'npz'),
+}
+# Artifacts whose file is the whole output; the others also fill version-keyed
+# caches elsewhere (adjacency, choropleths, regimes) and are rebuilt
+SELF_CONTAINED = {'accidents_table', 'licenses_table', 'violations_table', 'accident_sketches', 'violation_cube',
+                  'temporal_cube'}
+# Artifacts of optional feeds, skipped quietly while their sources are absent
+OPTIONAL = {'violation_cube'}
+
+def missing_inputs(name, unavailable):
+    """Source files that don't exist and upstream artifacts that could not be built"""
+    sources, upstream, _, _ = ARTIFACTS[name]
+    return [path for path in sources if not os.path.isfile(path)] + [dependency for dependency in upstream
+                                                                   if dependency in unavailable]
+
+# Raw tables -> the dataset whose validation report is saved beside them
+REPORTS = {'accidents_table': 'accidents', 'licenses_table': 'licenses', 'violations_table': 'violations'}
+
+def relink_report(dataset, old_version, version):
+    """Carry a validation report (and its quarantined rows) over to a new version of the same content"""
+    import validate
+
+    for suffix in ('json', 'csv'):
+        old_path = validate.Report.path(dataset, old_version, suffix)
+        if old_path.is_file():
+            shutil.copyfile(old_path, validate.Report.path(dataset, version, suffix))
+
+def file_hash(path, known=None):
+    """Content hash of a source file, reusing `known` when its stat is unchanged"""
+    version = datastore.dataset_version(path)
+    if known and known.get('version') == version:
+        return known
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return {'version': version, 'sha1': digest.hexdigest()}
+
+def waves(artifacts):
+    """Artifact names grouped so each group only depends on earlier groups"""
+    done, groups = set(), []
+    while len(done) < len(artifacts):
+        ready = [name for name, spec in artifacts.items() if name not in done and set(spec[1]) <= done]
+        if not ready:
+            raise ValueError("Artifact dependencies form a cycle")
+        groups.append(ready)
+        done.update(ready)
+    return groups
+
+def run_builder(name):
+    """Worker entry point: (name, output bytes, seconds)"""
+    started = time.perf_counter()
+    sources, _, build, _ = ARTIFACTS[name]
+    return name, build(datastore.dataset_version(*sources)), time.perf_counter() - started
+
+class Materializer:
+    def __init__(self, workers=None, force=False):
+        self.workers = workers or os.cpu_count() or 1
+        self.force = force
+        self.manifest_path = datastore.cache_path('materialized', 'manifest.json')
+        try:
+            with open(self.manifest_path, 'r') as f:
+                self.manifest = json.load(f)
+            if self.manifest.get('build_version') != BUILD_VERSION:
+                raise ValueError
+        except (OSError, ValueError):
+            self.manifest = {'build_version': BUILD_VERSION, 'sources': {}, 'artifacts': {}}
+
+    def input_hash(self, name):
+        sources, upstream, _, _ = ARTIFACTS[name]
+        digest = hashlib.sha1(f'{BUILD_VERSION}:{name}'.encode())
+        for path in sources:
+            self.manifest['sources'][path] = file_hash(path, self.manifest['sources'].get(path))
+            digest.update(self.manifest['sources'][path]['sha1'].encode())
+        for dependency in upstream:
+            digest.update(self.manifest['artifacts'][dependency]['output'].encode())
+        return digest.hexdigest()
+
+    def plan(self, names):
+        """(to build, to relink, to skip) for one wave"""
+        build, relink, skip = [], [], []
+        for name in names:
+            sources, _, _, suffix = ARTIFACTS[name]
+            entry = self.manifest['artifacts'].get(name, {})
+            path = artifact_path(name, datastore.dataset_version(*sources), suffix)
+            unchanged = entry.get('input') == self.input_hash(name) and not self.force
+            if unchanged and path.is_file():
+                skip.append(name)
+            elif unchanged and name in SELF_CONTAINED and entry.get('path') and os.path.isfile(entry['path']):
+                # Same content under a new file stat (e.g. a fresh checkout): reuse the output
+                relink.append(name)
+            else:
+                build.append(name)
+        return build, relink, skip
+
+    def retire(self, name, path):
+        """Remove the artifact file a newer version replaced"""
+        previous = self.manifest['artifacts'].get(name, {}).get('path')
+        if previous and previous != str(path) and os.path.isfile(previous):
+            # Readers that already mapped the old file keep their view of it
+            os.remove(previous)
+
+    def publish(self, name, body):
+        sources, _, _, suffix = ARTIFACTS[name]
+        path = artifact_path(name, datastore.dataset_version(*sources), suffix)
+        output = hashlib.sha1(body).hexdigest()
+        entry = self.manifest['artifacts'].get(name, {})
+        if entry.get('output') != output or not path.is_file():
+            datastore.write_atomic(path, body)
+        self.retire(name, path)
+        self.manifest['artifacts'][name] = {'input': self.input_hash(name), 'output': output, 'path': str(path)}
+        return entry.get('output') != output
+
+    def relink(self, name):
+        sources, _, _, suffix = ARTIFACTS[name]
+        version = datastore.dataset_version(*sources)
+        path = artifact_path(name, version, suffix)
+        previous = self.manifest['artifacts'][name]['path']
+        shutil.copyfile(previous, path)
+        if name in REPORTS:
+            # Dashboards only use a table that has its validation report
+            relink_report(REPORTS[name], Path(previous).stem[len(name) + 1:], version)
+        self.retire(name, path)
+        self.manifest['artifacts'][name]['path'] = str(path)
+
+    def run(self):
+        """Build whatever is stale; returns {name: 'built' | 'unchanged' | 'relinked' | 'skipped' | 'missing ...'}"""
+        status = {}
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            unavailable = set()
+            for names in waves(ARTIFACTS):
+                for name in names:
+                    missing = missing_inputs(name, unavailable)
+                    if missing:
+                        unavailable.add(name)
+                        status[name] = 'no source' if name in OPTIONAL else f"missing {', '.join(missing)}"
+                build, relink, skip = self.plan([name for name in names if name not in unavailable])
+                status.update({name: 'skipped' for name in skip})
+                for name in relink:
+                    self.relink(name)
+                    status[name] = 'relinked'
+
+                results = pool.map(run_builder, build) if len(build) > 1 and self.workers > 1 else map(run_builder, build)
+                for name, body, seconds in results:
+                    changed = self.publish(name, body)
+                    status[name] = f"{'built' if changed else 'unchanged'} in {seconds:.2f}s"
+
+                datastore.write_atomic(self.manifest_path, json.dumps(self.manifest, indent=1))
+        return status
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--force', action='store_true', help='rebuild even when inputs are unchanged')
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    status = Materializer(args.workers, args.force).run()
+    for name, state in status.items():
+        print(f"{name:<18} {state}")
+    print(f"Done in {time.perf_counter() - started:.1f}s")
+    return 1 if any(state.startswith('missing') for state in status.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
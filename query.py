@@ -0,0 +1,167 @@
+"""Bitmap-indexed drill-down queries over accident dimensions.
+
+Every dimension is factorized once into small integer codes. A packed
+bitmap per (dimension, level) is built on first use; a filter ORs the
+bitmaps of the selected levels within a dimension and ANDs across
+dimensions, so a conjunctive query touches rows/8 bytes per bitmap instead
+of re-masking the frame. Results are cached per filter signature.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import cohort
+
+DIMENSIONS = [
+    'ACCIDENT_YEAR',
+    'ZONE',
+    'HOUR',
+    'ACCIDENT_SEVERITY',
+    'ACCIDENT_NATURE',
+    'ACCIDENT_REASON',
+    'NATIONALITY_GROUP_OF_ACCIDENT_',
+    'AGE_BAND',
+]
+# Dimensions that also accept an inclusive (low, high) range
+ORDERED_DIMENSIONS = {'ACCIDENT_YEAR', 'HOUR'}
+VALUE_COLUMNS = ['DEATH_COUNT']
+
+# Results kept per filter signature
+CACHE_SIZE = 256
+
+# Set bits per byte value, for counting packed bitmaps
+_POPCOUNT = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+def dimension_values(df):
+    """The raw value array behind each indexed dimension"""
+    values = {}
+    for dimension in DIMENSIONS:
+        if dimension == 'AGE_BAND':
+            if {'ACCIDENT_YEAR', 'BIRTH_YEAR_OF_ACCIDENT_PERPETR'} <= set(df.columns):
+                ages = df['ACCIDENT_YEAR'] - pd.to_numeric(df['BIRTH_YEAR_OF_ACCIDENT_PERPETR'], errors='coerce')
+                # Categorical, so the levels sort youngest to oldest rather than as text
+                values[dimension] = cohort.age_band(ages).array
+        elif dimension == 'HOUR':
+            if 'HOUR' in df.columns:
+                values[dimension] = pd.to_numeric(df['HOUR'], errors='coerce').to_numpy()
+        elif dimension in df.columns:
+            values[dimension] = df[dimension].to_numpy()
+    return values
+
+class AccidentIndex:
+    def __init__(self, df):
+        self.rows = len(df)
+        self.codes = {}
+        self.levels = {}
+        for dimension, values in dimension_values(df).items():
+            codes, levels = pd.factorize(values, sort=True)
+            if dimension == 'HOUR':
+                levels = levels.astype(int)
+            self.codes[dimension] = codes.astype(np.int16 if len(levels) < 2 ** 15 else np.int32)
+            self.levels[dimension] = list(levels)
+        self.values = {
+            column: np.nan_to_num(pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=float))
+            for column in VALUE_COLUMNS if column in df.columns
+        }
+
+        self._bitmaps = {}
+        self._results = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def dimensions(self):
+        return list(self.levels)
+
+    def bitmap(self, dimension, code):
+        """Packed bitmap of the rows holding one level of a dimension"""
+        key = (dimension, code)
+        bitmap = self._bitmaps.get(key)
+        if bitmap is None:
+            bitmap = np.packbits(self.codes[dimension] == code)
+            self._bitmaps[key] = bitmap
+        return bitmap
+
+    def level_codes(self, dimension, selection):
+        """Codes matched by a value, a list of values or an ordered (low, high) range"""
+        if dimension not in self.levels:
+            raise KeyError(f"Unknown dimension '{dimension}'")
+        levels = self.levels[dimension]
+        if isinstance(selection, tuple) and dimension in ORDERED_DIMENSIONS:
+            low, high = selection
+            return [code for code, level in enumerate(levels) if low <= level <= high]
+        if not isinstance(selection, (list, set, frozenset, tuple)):
+            selection = [selection]
+        lookup = {level: code for code, level in enumerate(levels)}
+        return sorted(lookup[value] for value in selection if value in lookup)
+
+    @staticmethod
+    def signature(filters):
+        """Hashable, order-independent key for a filter dict"""
+        key = []
+        for dimension, selection in sorted((filters or {}).items()):
+            if isinstance(selection, tuple):
+                key.append((dimension, 'range', selection))
+            elif isinstance(selection, (list, set, frozenset)):
+                key.append((dimension, 'in', tuple(sorted(selection, key=str))))
+            else:
+                key.append((dimension, 'in', (selection,)))
+        return tuple(key)
+
+    def select(self, filters):
+        """Packed bitmap of the rows matching every filter, or None for all rows"""
+        result = None
+        for dimension, selection in (filters or {}).items():
+            codes = self.level_codes(dimension, selection)
+            if not codes:
+                return np.zeros((self.rows + 7) // 8, dtype=np.uint8)
+            bitmap = self.bitmap(dimension, codes[0])
+            if len(codes) > 1:
+                bitmap = bitmap.copy()
+                for code in codes[1:]:
+                    np.bitwise_or(bitmap, self.bitmap(dimension, code), out=bitmap)
+            result = bitmap.copy() if result is None else np.bitwise_and(result, bitmap, out=result)
+        return result
+
+    def _cached(self, key, compute):
+        with self._lock:
+            if key in self._results:
+                self._results.move_to_end(key)
+                return self._results[key]
+        result = compute()
+        with self._lock:
+            self._results[key] = result
+            if len(self._results) > CACHE_SIZE:
+                self._results.popitem(last=False)
+        return result
+
+    def count(self, filters=None):
+        """Number of accidents matching the filters"""
+        def compute():
+            bitmap = self.select(filters)
+            return self.rows if bitmap is None else int(_POPCOUNT[bitmap].sum(dtype=np.int64))
+
+        return self._cached((self.signature(filters), 'count'), compute)
+
+    def groupby(self, by, filters=None):
+        """COUNT and value sums per level of `by` for the matching accidents"""
+        def compute():
+            bitmap = self.select(filters)
+            codes = self.codes[by]
+            values = self.values
+            if bitmap is not None:
+                mask = np.unpackbits(bitmap, count=self.rows).view(bool)
+                codes = codes[mask]
+                values = {column: array[mask] for column, array in values.items()}
+
+            known = codes >= 0
+            codes = codes[known]
+            n = len(self.levels[by])
+            frame = pd.DataFrame({'COUNT': np.bincount(codes, minlength=n)},
+                                 index=pd.Index(self.levels[by], name=by))
+            for column, array in values.items():
+                frame[column] = np.bincount(codes, weights=array[known], minlength=n)
+            return frame[frame['COUNT'] > 0]
+
+        return self._cached((self.signature(filters), 'groupby', by), compute)
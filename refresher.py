@@ -0,0 +1,155 @@
+"""Background refresh of the dashboard datasets with atomic snapshot swaps.
+
+A daemon thread polls the source files of every dataset. Once a new version
+has stayed unchanged for two polls (so a file still being copied is never
+read) the dataset and its derived tables are rebuilt off the request path
+and published as an immutable Snapshot by swapping a single reference.
+Requests read whatever snapshot is current and never wait on a reload;
+only the very first request for a dataset builds it inline.
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+
+import datastore
+
+logger = logging.getLogger('traffiq.refresher')
+
+POLL_SECONDS = 5.0
+
+# A published dataset; treat `value` as read-only once published
+Snapshot = namedtuple('Snapshot', ['dataset', 'version', 'value', 'published_at'])
+
+def build_accidents(version):
+    import acc
+
+    dashboard = acc.QatarAccidentsStreamlit()
+    # Warm the per-version derived tables so the first request after a swap doesn't pay for them
+    dashboard.temporal_cube()
+    dashboard.query_index()
+    if dashboard.current_year is not None:
+        for metric in dashboard.map_metrics:
+            dashboard.choropleth(dashboard.current_year, metric)
+    return dashboard
+
+def build_licenses(version):
+    import liz
+
+    return liz.LicenseDashboard()
+
+def build_violations(version):
+    import viola
+
+    return viola.prepare_data()
+
+def build_cohort(version):
+    import cohort
+
+    return cohort.CohortTables.load()
+
+# name -> (source files, builder taking the version being built)
+DATASETS = {
+    'accidents': (('facc.csv', 'qatar_zones_polygons.json', 'zone_names.json'), build_accidents),
+    'licenses': (('liz.csv',), build_licenses),
+    'violations': (('viola.json',), build_violations),
+    'cohort': (('liz.csv', 'facc.csv', 'viola.json'), build_cohort),
+}
+
+class Refresher:
+    def __init__(self, datasets=DATASETS, poll_seconds=POLL_SECONDS):
+        self.datasets = datasets
+        self.poll_seconds = poll_seconds
+        self._snapshots = {}
+        # Version seen on the previous poll for datasets that are waiting to settle
+        self._pending = {}
+        self._build_locks = {name: threading.Lock() for name in datasets}
+        self._publish_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def version(self, dataset):
+        return datastore.dataset_version(*self.datasets[dataset][0])
+
+    def current(self, dataset):
+        """Latest snapshot of a dataset, building it inline only if none exists yet"""
+        snapshot = self._snapshots.get(dataset)
+        if snapshot is None:
+            self.start()
+            with self._build_locks[dataset]:
+                snapshot = self._snapshots.get(dataset)
+                if snapshot is None:
+                    snapshot = self.rebuild(dataset)
+        return snapshot
+
+    def rebuild(self, dataset):
+        """Build a dataset at its current version and publish it"""
+        version = self.version(dataset)
+        started = time.perf_counter()
+        value = self.datasets[dataset][1](version)
+        if self.version(dataset) != version:
+            # The sources changed while building; keep serving what we have and retry next poll
+            logger.info("%s changed during rebuild, retrying", dataset)
+            return self._snapshots.get(dataset) or Snapshot(dataset, version, value, time.time())
+
+        snapshot = Snapshot(dataset, version, value, time.time())
+        with self._publish_lock:
+            # Readers hold either the old mapping or the new one, never a mix
+            self._snapshots = {**self._snapshots, dataset: snapshot}
+        logger.info("published %s %s in %.2fs", dataset, version, time.perf_counter() - started)
+        return snapshot
+
+    def poll(self):
+        """One pass over every dataset; returns the names that were republished"""
+        published = []
+        for dataset in self.datasets:
+            snapshot = self._snapshots.get(dataset)
+            if snapshot is None:
+                # Never requested in this process; nothing to keep fresh
+                continue
+            version = self.version(dataset)
+            if version == snapshot.version:
+                self._pending.pop(dataset, None)
+                continue
+            if self._pending.get(dataset) != version:
+                self._pending[dataset] = version
+                continue
+
+            with self._build_locks[dataset]:
+                try:
+                    if self.rebuild(dataset).version == version:
+                        published.append(dataset)
+                        self._pending.pop(dataset, None)
+                except Exception:
+                    logger.exception("Rebuilding %s failed; keeping version %s", dataset, snapshot.version)
+        return published
+
+    def run(self):
+        while not self._stop.wait(self.poll_seconds):
+            self.poll()
+
+    def start(self):
+        with self._publish_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self.run, name='traffiq-refresher', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def get():
+    """The process-wide refresher shared by every page and session"""
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = Refresher()
+        return _refresher
+
+def current(dataset):
+    return get().current(dataset).value
@@ -0,0 +1,158 @@
+"""Violation regimes: k-means clusters of monthly fingerprints.
+
+Clusters are fitted once per data version and kept under
+.traffiq_cache/regimes. When the data only gains new months, those months
+are assigned to the nearest existing centroid instead of re-clustering; a
+full refit happens once too many months were assigned that way.
+
+    python regimes.py viola.json
+"""
+import argparse
+import hashlib
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+import datastore
+
+# Bump when the clustering setup changes so cached regimes are refit
+MODEL_VERSION = 1
+
+K_RANGE = range(2, 7)
+# Refit once more than this share of months were assigned incrementally
+MAX_INCREMENTAL_SHARE = 0.25
+
+def month_keys(months):
+    return [month.strftime('%Y-%m') for month in pd.to_datetime(months)]
+
+def fingerprint_hash(keys, fingerprints):
+    digest = hashlib.sha1(f'{MODEL_VERSION}:{",".join(keys)}'.encode())
+    digest.update(np.ascontiguousarray(fingerprints, dtype=np.float64).round(10).tobytes())
+    return digest.hexdigest()[:16]
+
+def fit(fingerprints, seed=0):
+    """k-means over fingerprints, k chosen by silhouette; returns (centroids, labels)"""
+    from sklearn.cluster import KMeans
+    from sklearn.metrics import silhouette_score
+
+    best = None
+    for k in K_RANGE:
+        if k >= len(fingerprints):
+            break
+        model = KMeans(n_clusters=k, n_init=10, random_state=seed).fit(fingerprints)
+        score = silhouette_score(fingerprints, model.labels_)
+        if best is None or score > best[0]:
+            best = (score, model)
+
+    if best is None:
+        return fingerprints.mean(axis=0, keepdims=True), np.zeros(len(fingerprints), dtype=int)
+    centroids, labels = best[1].cluster_centers_, best[1].labels_
+    return relabel(centroids, labels)
+
+def relabel(centroids, labels):
+    """Number regimes by first appearance so labels read left to right on a timeline"""
+    _, first = np.unique(labels, return_index=True)
+    order = labels[np.sort(first)]
+    mapping = np.empty(len(centroids), dtype=int)
+    mapping[order] = np.arange(len(order))
+    return centroids[order], mapping[labels]
+
+def assign(centroids, fingerprints):
+    """Nearest centroid per fingerprint row"""
+    distances = ((np.asarray(fingerprints)[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2)
+    return distances.argmin(axis=1)
+
+def describe(centroids, columns, names=None):
+    """Short label per regime from its two dominant violation types"""
+    names = names or {}
+    labels = []
+    for i, centroid in enumerate(centroids):
+        top = np.argsort(centroid)[::-1][:2]
+        labels.append(f"Regime {i + 1}: " + ' / '.join(names.get(columns[j], columns[j]) for j in top))
+    return labels
+
+def load_regimes(version, months, fingerprints):
+    """Regime model for a data version: cached, extended incrementally, or refit"""
+    keys = month_keys(months)
+    values = np.asarray(fingerprints, dtype=float)
+    path = datastore.cache_path('regimes', f'{version}.json')
+    latest_path = datastore.cache_path('regimes', 'latest.json')
+
+    for candidate in (path, latest_path):
+        try:
+            with open(candidate, 'r') as f:
+                model = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if model.get('model_version') != MODEL_VERSION:
+            continue
+        if model['months'] == keys and model['hash'] == fingerprint_hash(keys, values):
+            return model
+
+        # Same history plus new months: assign only the new ones
+        known = len(model['months'])
+        if (
+            model['months'] == keys[:known]
+            and model['prefix_hash'] == fingerprint_hash(keys[:known], values[:known])
+            and model['incremental'] + len(keys) - known <= MAX_INCREMENTAL_SHARE * len(keys)
+        ):
+            centroids = np.array(model['centroids'])
+            model = dict(model, **{
+                'months': keys,
+                'labels': model['labels'] + assign(centroids, values[known:]).tolist(),
+                'hash': fingerprint_hash(keys, values),
+                'prefix_hash': fingerprint_hash(keys, values),
+                'incremental': model['incremental'] + len(keys) - known,
+            })
+            break
+    else:
+        model = None
+
+    if model is None:
+        centroids, labels = fit(values)
+        model = {
+            'model_version': MODEL_VERSION,
+            'months': keys,
+            'centroids': centroids.tolist(),
+            'labels': labels.tolist(),
+            'hash': fingerprint_hash(keys, values),
+            'prefix_hash': fingerprint_hash(keys, values),
+            'incremental': 0,
+        }
+
+    payload = json.dumps(model)
+    datastore.write_atomic(path, payload)
+    datastore.write_atomic(latest_path, payload)
+    return model
+
+def regime_timeline(model, columns, names=None):
+    """One row per month with its regime number and label"""
+    labels = describe(np.array(model['centroids']), list(columns), names)
+    return pd.DataFrame({
+        'month': pd.to_datetime(model['months']),
+        'regime': model['labels'],
+        'label': [labels[i] for i in model['labels']],
+    })
+
+def main(argv=None):
+    from viola import load_json_data, create_fingerprint, violation_names
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('violations_file', nargs='?', default='viola.json')
+    args = parser.parse_args(argv)
+
+    df = load_json_data(args.violations_file)
+    df['month'] = pd.to_datetime(df['month'])
+    df = df.sort_values('month')
+    fingerprints = create_fingerprint(df)
+
+    model = load_regimes(datastore.dataset_version(args.violations_file), df['month'], fingerprints)
+    timeline = regime_timeline(model, fingerprints.columns, violation_names)
+    for label, group in timeline.groupby('label', sort=False):
+        print(f"{label}: {len(group)} months, {group['month'].min():%Y-%m} to {group['month'].max():%Y-%m}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
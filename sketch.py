@@ -0,0 +1,340 @@
+"""Mergeable streaming sketches for distinct counts and heavy hitters.
+
+HyperLogLog estimates how many distinct keys a stream holds in 2**p one-byte
+registers; SpaceSaving keeps the top categories of a stream in a fixed
+number of counters, each with a bound on how far it may overcount. Both are
+updated one partition (CSV chunk, year, ...) at a time and merged across
+partitions, so answers cost the same however many rows went in.
+
+AccidentSketches keeps distinct perpetrator counts per (year, zone) and the
+top accident reasons and natures per week, fed from the ingest path.
+
+    python sketch.py facc.csv --chunksize 200000 --week 2024-01-01
+"""
+import argparse
+import heapq
+import json
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Register count exponent: 2**12 registers, about 1.6% standard error
+DEFAULT_P = 12
+# Exponents whose remaining hash bits still convert to float exactly
+P_RANGE = (11, 18)
+# Counters per SpaceSaving summary
+DEFAULT_CAPACITY = 32
+
+# The feed has no perpetrator ID; birth year and nationality group are the closest identity
+PERPETRATOR_COLUMNS = ['BIRTH_YEAR_OF_ACCIDENT_PERPETR', 'NATIONALITY_GROUP_OF_ACCIDENT_']
+HEAVY_COLUMNS = ['ACCIDENT_REASON', 'ACCIDENT_NATURE']
+
+def hash_rows(values):
+    """Stable 64-bit hash per row of a Series or DataFrame"""
+    return pd.util.hash_pandas_object(values, index=False).to_numpy()
+
+def register_updates(hashes, p):
+    """(register index, rank) per hash: the top p bits pick the register, the rest give the rank"""
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    index = (hashes >> np.uint64(64 - p)).astype(np.int64)
+    rest = hashes & np.uint64((1 << (64 - p)) - 1)
+    # frexp's exponent is the bit length, so 64 - p minus it counts the leading zeros
+    _, length = np.frexp(rest.astype(float))
+    return index, (64 - p - length + 1).astype(np.uint8)
+
+def estimate(registers):
+    """HyperLogLog cardinality estimate over the last axis of a register array"""
+    registers = np.asarray(registers)
+    m = registers.shape[-1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    raw = alpha * m * m / np.sum(np.exp2(-registers.astype(float)), axis=-1)
+    zeros = np.count_nonzero(registers == 0, axis=-1)
+    # Linear counting is more accurate while many registers are still empty
+    linear = m * np.log(m / np.maximum(zeros, 1))
+    return np.where((raw <= 2.5 * m) & (zeros > 0), linear, raw)
+
+class HyperLogLog:
+    """Distinct count estimate in 2**p registers (standard error 1.04 / sqrt(2**p))"""
+
+    def __init__(self, p=DEFAULT_P, registers=None):
+        if not P_RANGE[0] <= p <= P_RANGE[1]:
+            raise ValueError(f"p must be between {P_RANGE[0]} and {P_RANGE[1]}")
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8) if registers is None else registers
+
+    @property
+    def error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add_hashes(self, hashes):
+        index, rank = register_updates(hashes, self.p)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def update(self, values):
+        return self.add_hashes(hash_rows(values))
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError("Only sketches with the same p can be merged")
+        return HyperLogLog(self.p, np.maximum(self.registers, other.registers))
+
+    def count(self):
+        return float(estimate(self.registers))
+
+def grouped_registers(codes, groups, hashes, p=DEFAULT_P):
+    """(groups, 2**p) registers, one HyperLogLog per group code, filled in one pass"""
+    m = 1 << p
+    index, rank = register_updates(hashes, p)
+    registers = np.zeros(groups * m, dtype=np.uint8)
+    np.maximum.at(registers, np.asarray(codes, dtype=np.int64) * m + index, rank)
+    return registers.reshape(groups, m)
+
+class SpaceSaving:
+    """Top categories in `capacity` counters; a count overestimates by at most its error"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, counts=None, errors=None, total=0):
+        self.capacity = capacity
+        self.counts = dict(counts or {})
+        self.errors = dict(errors or {})
+        self.total = total
+
+    @classmethod
+    def exact(cls, counts):
+        """Summary of exactly counted categories; nothing is untracked, so its floor is 0"""
+        return cls(len(counts) + 1, counts, dict.fromkeys(counts, 0), sum(counts.values()))
+
+    @property
+    def floor(self):
+        """Upper bound on the count of any category not being tracked"""
+        return min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+
+    def merge(self, other):
+        # Parallel SpaceSaving merge: a category one side doesn't track counts as that side's floor
+        floors = (self.floor, other.floor)
+        merged = {}
+        for item in self.counts.keys() | other.counts.keys():
+            merged[item] = (
+                self.counts.get(item, floors[0]) + other.counts.get(item, floors[1]),
+                self.errors.get(item, floors[0]) + other.errors.get(item, floors[1]),
+            )
+        kept = heapq.nlargest(self.capacity, merged.items(), key=lambda entry: (entry[1][0], -entry[1][1]))
+        return SpaceSaving(
+            self.capacity,
+            {item: count for item, (count, _) in kept},
+            {item: error for item, (_, error) in kept},
+            self.total + other.total
+        )
+
+    def update(self, values):
+        """Merge a batch, counted exactly first"""
+        merged = self.merge(SpaceSaving.exact(pd.Series(values).value_counts(dropna=False).to_dict()))
+        self.counts, self.errors, self.total = merged.counts, merged.errors, merged.total
+        return self
+
+    def top(self, k=10):
+        """The k largest as (item, count, error, guaranteed) rows; guaranteed means surely in the true top"""
+        rows = sorted(self.counts.items(), key=lambda entry: (-entry[1], -self.errors[entry[0]]))
+        frame = pd.DataFrame(
+            [(item, count, self.errors[item]) for item, count in rows],
+            columns=['ITEM', 'COUNT', 'ERROR']
+        )
+        # Its guaranteed count beats every count ranked below it, tracked or not
+        below = np.append(frame['COUNT'].to_numpy()[1:], self.floor)
+        frame['GUARANTEED'] = (frame['COUNT'] - frame['ERROR']).to_numpy() >= below
+        return frame.head(k)
+
+def week_starts(dates):
+    """Monday of each date's week as 'YYYY-MM-DD', '' when there is no valid date"""
+    import validate
+
+    def parse(values):
+        parsed = pd.to_datetime(values, errors='coerce')
+        monday = (parsed - pd.to_timedelta(parsed.dt.dayofweek, unit='D')).dt.strftime('%Y-%m-%d')
+        return monday.where(parsed.notna(), '')
+
+    return validate.by_value(dates, parse, missing='')
+
+class AccidentSketches:
+    """Distinct perpetrators per (year, zone) and top reasons/natures per week"""
+
+    def __init__(self, p=DEFAULT_P, capacity=DEFAULT_CAPACITY):
+        self.p = p
+        self.capacity = capacity
+        # (year, zone) -> HyperLogLog
+        self.distinct = {}
+        # column -> week -> SpaceSaving
+        self.heavy = {column: {} for column in HEAVY_COLUMNS}
+        self.rows = 0
+
+    def update(self, df):
+        """Fold in one cleaned partition of accident rows"""
+        year_codes, years = pd.factorize(df['ACCIDENT_YEAR'])
+        zone_codes, zones = pd.factorize(df['ZONE'].astype(str))
+        # Combined (year, zone) codes, renumbered to the pairs that occur
+        codes, pairs = pd.factorize(year_codes * len(zones) + zone_codes)
+        registers = grouped_registers(codes, len(pairs), hash_rows(df[PERPETRATOR_COLUMNS]), self.p)
+        for pair, rows in zip(pairs, registers):
+            key = (int(years[pair // len(zones)]), zones[pair % len(zones)])
+            sketch = HyperLogLog(self.p, rows)
+            self.distinct[key] = self.distinct[key].merge(sketch) if key in self.distinct else sketch
+
+        # Weekly heavy hitters need dates; extracts without them only get the distinct counts
+        if 'ACCIDENT_DATE' in df.columns:
+            weeks = week_starts(df['ACCIDENT_DATE'])
+            for column in HEAVY_COLUMNS:
+                counts = df[column].astype(str).groupby(weeks).value_counts()
+                for week, week_counts in counts.groupby(level=0):
+                    summary = self.heavy[column].get(week, SpaceSaving(self.capacity))
+                    self.heavy[column][week] = summary.merge(SpaceSaving.exact(week_counts.droplevel(0).to_dict()))
+        self.rows += len(df)
+        return self
+
+    def merge(self, other):
+        merged = AccidentSketches(self.p, self.capacity)
+        merged.rows = self.rows + other.rows
+        for key in self.distinct.keys() | other.distinct.keys():
+            sketches = [s.distinct[key] for s in (self, other) if key in s.distinct]
+            merged.distinct[key] = sketches[0].merge(sketches[1]) if len(sketches) == 2 else sketches[0]
+        for column in HEAVY_COLUMNS:
+            for week in self.heavy[column].keys() | other.heavy[column].keys():
+                empty = SpaceSaving(self.capacity)
+                merged.heavy[column][week] = self.heavy[column].get(week, empty).merge(other.heavy[column].get(week, empty))
+        return merged
+
+    @classmethod
+    def from_frame(cls, df, **options):
+        return cls(**options).update(df)
+
+    @classmethod
+    def from_csv(cls, path, zones_data=None, chunksize=200_000, **options):
+        """Stream a raw accidents CSV through validation and cleaning, one chunk at a time"""
+        import acc
+
+        sketches = cls(**options)
+        for chunk in pd.read_csv(path, skipinitialspace=True, chunksize=chunksize):
+            df, _ = acc.ingest_accidents(chunk, zones_data)
+            sketches.update(df)
+        return sketches
+
+    @property
+    def years(self):
+        return sorted({year for year, _ in self.distinct})
+
+    @property
+    def weeks(self):
+        return sorted({week for weeks in self.heavy.values() for week in weeks if week})
+
+    def distinct_by_zone(self, years=None):
+        """Estimated distinct perpetrators per zone, merged over `years` (all when None)"""
+        zones = {}
+        for (year, zone), sketch in self.distinct.items():
+            if years is None or year in years:
+                zones.setdefault(zone, []).append(sketch.registers)
+        if not zones:
+            return pd.Series(dtype=float, name='DISTINCT')
+        registers = np.stack([np.maximum.reduce(rows) for rows in zones.values()])
+        return pd.Series(estimate(registers), index=pd.Index(list(zones), name='ZONE'), name='DISTINCT')
+
+    def distinct_total(self, years=None):
+        rows = [sketch.registers for (year, _), sketch in self.distinct.items() if years is None or year in years]
+        return float(estimate(np.maximum.reduce(rows))) if rows else 0.0
+
+    def top(self, column, weeks=None, k=10):
+        """Top categories of `column` merged over `weeks` (all when None)"""
+        summary = SpaceSaving(self.capacity)
+        for week, week_summary in self.heavy[column].items():
+            if weeks is None or week in weeks:
+                summary = summary.merge(week_summary)
+        return summary.top(k)
+
+    def to_arrays(self):
+        """Plain arrays for np.savez"""
+        keys = sorted(self.distinct)
+        arrays = {
+            'params': np.array([self.p, self.capacity, self.rows]),
+            'distinct_years': np.array([year for year, _ in keys], dtype=np.int64),
+            'distinct_zones': np.array([zone for _, zone in keys], dtype=str),
+            'registers': np.stack([self.distinct[key].registers for key in keys]) if keys
+                         else np.zeros((0, 1 << self.p), dtype=np.uint8),
+        }
+        for column in HEAVY_COLUMNS:
+            rows = [(week, item, count, summary.errors[item], summary.total)
+                    for week, summary in sorted(self.heavy[column].items())
+                    for item, count in summary.counts.items()]
+            weeks, items, counts, errors, totals = zip(*rows) if rows else ([], [], [], [], [])
+            arrays[f'{column}_weeks'] = np.array(weeks, dtype=str)
+            arrays[f'{column}_items'] = np.array(items, dtype=str)
+            arrays[f'{column}_counts'] = np.array(counts, dtype=np.int64)
+            arrays[f'{column}_errors'] = np.array(errors, dtype=np.int64)
+            arrays[f'{column}_totals'] = np.array(totals, dtype=np.int64)
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        p, capacity, rows = (int(value) for value in arrays['params'])
+        sketches = cls(p, capacity)
+        sketches.rows = rows
+        for year, zone, registers in zip(arrays['distinct_years'], arrays['distinct_zones'], arrays['registers']):
+            sketches.distinct[(int(year), str(zone))] = HyperLogLog(p, registers.copy())
+        for column in HEAVY_COLUMNS:
+            entries = pd.DataFrame({
+                'week': arrays[f'{column}_weeks'], 'item': arrays[f'{column}_items'],
+                'count': arrays[f'{column}_counts'], 'error': arrays[f'{column}_errors'],
+                'total': arrays[f'{column}_totals'],
+            })
+            for week, group in entries.groupby('week'):
+                sketches.heavy[column][str(week)] = SpaceSaving(
+                    capacity,
+                    dict(zip(group['item'], group['count'].tolist())),
+                    dict(zip(group['item'], group['error'].tolist())),
+                    int(group['total'].iloc[0])
+                )
+        return sketches
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('accidents', nargs='?', default='facc.csv')
+    parser.add_argument('--polygons', default='qatar_zones_polygons.json')
+    parser.add_argument('--chunksize', type=int, default=200_000)
+    parser.add_argument('--week', default=None, help='week start (YYYY-MM-DD) for the top categories; default latest')
+    parser.add_argument('--check', action='store_true', help='compare against exact counts')
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.polygons, 'r') as f:
+            zones_data = json.load(f)
+    except OSError:
+        zones_data = None
+
+    started = time.perf_counter()
+    sketches = AccidentSketches.from_csv(args.accidents, zones_data, args.chunksize)
+    print(f"Sketched {sketches.rows:,} rows in {time.perf_counter() - started:.2f}s "
+          f"({len(sketches.distinct)} distinct sketches, {sum(map(len, sketches.heavy.values()))} weekly summaries)")
+
+    distinct = sketches.distinct_by_zone().sort_values(ascending=False)
+    print(f"\nDistinct perpetrators: about {sketches.distinct_total():,.0f}; busiest zones:")
+    print(distinct.head(10).round().astype(int).to_string())
+
+    week = args.week or (sketches.weeks[-1] if sketches.weeks else None)
+    for column in HEAVY_COLUMNS if week else ():
+        print(f"\nTop {column} in week of {week}:")
+        print(sketches.top(column, {week}, k=5).to_string(index=False))
+
+    if args.check:
+        import acc
+
+        df, _ = acc.ingest_accidents(pd.read_csv(args.accidents, skipinitialspace=True), zones_data)
+        exact = df.groupby(df['ZONE'].astype(str))[PERPETRATOR_COLUMNS].apply(lambda rows: len(rows.drop_duplicates()))
+        errors = (distinct.reindex(exact.index) - exact).abs() / exact
+        print(f"\nDistinct per zone: median relative error {errors.median():.2%}, max {errors.max():.2%}")
+        weeks = week_starts(df['ACCIDENT_DATE']) if week else None
+        for column in HEAVY_COLUMNS if week else ():
+            truth = df.loc[weeks == week, column].astype(str).value_counts().head(5)
+            print(f"Exact top {column}: {', '.join(f'{item} ({count})' for item, count in truth.items())}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""Ad-hoc SQL over the accident, license and violation tables.
+
+The three validated tables are registered under the names accidents,
+licenses and violations straight from their materialized Arrow files
+(memory-mapped, so nothing is copied). DuckDB (in requirements.txt) runs
+the queries with vectorized execution spread over every core and file
+access switched off. If it is not installed, the tables are copied once
+per data version into an in-memory SQLite database opened read-only.
+Either way, only single SELECT/WITH statements are accepted, a query is
+stopped after QUERY_TIMEOUT seconds, and results come back as Arrow
+tables, cached per data version and query text.
+
+    python sql.py "SELECT ZONE, COUNT(*) AS accidents FROM accidents GROUP BY ZONE ORDER BY 2 DESC LIMIT 5"
+    python sql.py --tables
+"""
+import argparse
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+import datastore
+import materialize
+
+# SQL name -> materialized artifact behind it
+TABLES = {
+    'accidents': 'accidents_table',
+    'licenses': 'licenses_table',
+    'violations': 'violations_table',
+}
+# Rows returned to the query panel; the Python API returns everything by default
+MAX_ROWS = 10000
+# Query results kept in memory
+CACHE_SIZE = 128
+# Seconds a query may run before it is stopped
+QUERY_TIMEOUT = 10
+
+EXAMPLE_QUERY = """SELECT ZONE, ACCIDENT_YEAR, COUNT(*) AS accidents, SUM(DEATH_COUNT) AS deaths
+FROM accidents
+GROUP BY ZONE, ACCIDENT_YEAR
+ORDER BY accidents DESC
+LIMIT 20"""
+
+Result = namedtuple('Result', ['table', 'truncated', 'seconds', 'cached'])
+
+class QueryError(ValueError):
+    """A statement that was rejected or failed to run"""
+
+def table_sources(name):
+    return materialize.ARTIFACTS[TABLES[name]][0]
+
+def data_version():
+    """One version key over every table's sources"""
+    return '-'.join(datastore.dataset_version(*table_sources(name)) for name in TABLES)
+
+def load_arrow(name):
+    """A table as Arrow: the memory-mapped artifact, else built from the raw file"""
+    import pyarrow as pa
+    import pyarrow.feather as feather
+
+    artifact = TABLES[name]
+    table = materialize.load_arrow(artifact, table_sources(name))
+    if table is None:
+        # Same validation and cleaning the materializer applies
+        sources, _, build, _ = materialize.ARTIFACTS[artifact]
+        table = feather.read_table(pa.BufferReader(build(datastore.dataset_version(*sources))))
+    return table
+
+# Leading comments, so the statement check sees the first keyword
+_COMMENTS = re.compile(r'^(\s*(--[^\n]*(\n|$)|/\*.*?\*/))*\s*', re.S)
+
+def check_statement(sql):
+    """The statement without a trailing semicolon; raises QueryError unless it is one SELECT/WITH"""
+    sql = sql.strip().rstrip(';').strip()
+    body = _COMMENTS.sub('', sql)
+    if not body:
+        raise QueryError("Enter a query")
+    if not re.match(r'(select|with)\b', body, re.I):
+        raise QueryError("Only SELECT queries are allowed")
+    return sql
+
+class DuckDBEngine:
+    """Zero-copy Arrow scans, parallel vectorized execution"""
+    name = 'duckdb'
+
+    def __init__(self, tables, timeout=QUERY_TIMEOUT):
+        import duckdb
+
+        self.duckdb = duckdb
+        self.tables = tables
+        self.timeout = timeout
+        self.con = duckdb.connect(':memory:', config={'threads': os.cpu_count() or 1})
+        self.con.execute("SET enable_external_access = false")
+        self.con.execute("SET lock_configuration = true")
+
+    def execute(self, sql, max_rows):
+        import pyarrow as pa
+
+        # A cursor per query, so queries from different sessions run side by side
+        cursor = self.con.cursor()
+        timer = threading.Timer(self.timeout, cursor.interrupt)
+        try:
+            statements = cursor.extract_statements(sql)
+            if len(statements) != 1 or statements[0].type != self.duckdb.StatementType.SELECT:
+                raise QueryError("Only single SELECT queries are allowed")
+            for name, table in self.tables.items():
+                cursor.register(name, table)
+            timer.start()
+            result = cursor.execute(sql)
+            # to_arrow_reader replaced fetch_record_batch in newer DuckDB releases
+            read = getattr(result, 'to_arrow_reader', None) or result.fetch_record_batch
+            reader = read(max_rows + 1 if max_rows else 1 << 20)
+            batches, rows = [], 0
+            for batch in reader:
+                batches.append(batch)
+                rows += batch.num_rows
+                if max_rows is not None and rows > max_rows:
+                    break
+            table = pa.Table.from_batches(batches, schema=reader.schema)
+        except self.duckdb.InterruptException as e:
+            raise QueryError(f"Query stopped after the {self.timeout:g} s time limit") from e
+        except self.duckdb.Error as e:
+            raise QueryError(str(e)) from e
+        finally:
+            timer.cancel()
+            cursor.close()
+        if max_rows is None:
+            return table, False
+        return table.slice(0, max_rows), table.num_rows > max_rows
+
+class SQLiteEngine:
+    """Fallback: tables copied into an in-memory SQLite database, one query at a time"""
+    name = 'sqlite'
+
+    def __init__(self, tables, timeout=QUERY_TIMEOUT):
+        self.timeout = timeout
+        self.deadline = None
+        self.con = sqlite3.connect(':memory:', check_same_thread=False)
+        for name, table in tables.items():
+            table.to_pandas().to_sql(name, self.con, index=False)
+        self.con.execute("PRAGMA query_only = ON")
+        self.con.set_authorizer(self.authorize)
+        # Checked every few thousand VM steps; a non-zero return aborts the statement
+        self.con.set_progress_handler(lambda: time.monotonic() > self.deadline, 10000)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def authorize(action, *args):
+        # Reads only: no ATTACH (other files), PRAGMA or writes
+        allowed = {sqlite3.SQLITE_SELECT, sqlite3.SQLITE_READ, sqlite3.SQLITE_FUNCTION, sqlite3.SQLITE_RECURSIVE}
+        return sqlite3.SQLITE_OK if action in allowed else sqlite3.SQLITE_DENY
+
+    def execute(self, sql, max_rows):
+        import pyarrow as pa
+
+        with self.lock:
+            self.deadline = time.monotonic() + self.timeout
+            try:
+                cursor = self.con.execute(sql)
+                rows = cursor.fetchall() if max_rows is None else cursor.fetchmany(max_rows + 1)
+                names = [column[0] for column in cursor.description or ()]
+            except sqlite3.OperationalError as e:
+                if time.monotonic() > self.deadline:
+                    raise QueryError(f"Query stopped after the {self.timeout:g} s time limit") from e
+                raise QueryError(str(e)) from e
+            except (sqlite3.Error, sqlite3.Warning) as e:
+                raise QueryError(str(e)) from e
+        truncated = max_rows is not None and len(rows) > max_rows
+        rows = rows[:max_rows] if truncated else rows
+        columns = list(zip(*rows)) if rows else [()] * len(names)
+        return pa.table({name: pa.array(values) for name, values in zip(names, columns)}), truncated
+
+def make_engine(tables):
+    try:
+        import duckdb  # noqa: F401
+    except ImportError:
+        return SQLiteEngine(tables)
+    return DuckDBEngine(tables)
+
+class QueryService:
+    """The tables of one data version, an engine over them and a result cache"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.engine = None
+        self.schemas = {}
+        self.results = OrderedDict()
+
+    def current(self):
+        """(version, engine), registering the tables again when any source changed"""
+        version = data_version()
+        with self.lock:
+            if version != self.version:
+                tables = {name: load_arrow(name) for name in TABLES}
+                self.engine = make_engine(tables)
+                self.schemas = {name: table.schema for name, table in tables.items()}
+                self.version = version
+                self.results.clear()
+            return self.version, self.engine
+
+    def execute(self, sql, max_rows=None):
+        """Result(table, truncated, seconds, cached) of one SELECT statement"""
+        sql = check_statement(sql)
+        version, engine = self.current()
+        key = (version, sql, max_rows)
+        with self.lock:
+            if key in self.results:
+                self.results.move_to_end(key)
+                table, truncated = self.results[key]
+                return Result(table, truncated, 0.0, True)
+
+        started = time.perf_counter()
+        table, truncated = engine.execute(sql, max_rows)
+        seconds = time.perf_counter() - started
+        with self.lock:
+            if version == self.version:
+                self.results[key] = (table, truncated)
+                if len(self.results) > CACHE_SIZE:
+                    self.results.popitem(last=False)
+        return Result(table, truncated, seconds, False)
+
+_service = None
+_service_lock = threading.Lock()
+
+def get():
+    """The process-wide query service shared by every page and session"""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = QueryService()
+        return _service
+
+def query(sql, max_rows=None):
+    """Run one SELECT over accidents, licenses and violations; returns a pyarrow.Table"""
+    return get().execute(sql, max_rows).table
+
+def query_df(sql, max_rows=None):
+    """query() as a pandas DataFrame"""
+    return query(sql, max_rows).to_pandas()
+
+def render_panel():
+    """The advanced query panel"""
+    import streamlit as st
+
+    st.title("SQL Query")
+    service = get()
+    try:
+        version, engine = service.current()
+    except Exception as e:
+        st.error(f"Could not load the tables: {e}")
+        return
+
+    with st.expander("Tables"):
+        for name, schema in service.schemas.items():
+            st.markdown(f"**{name}**: " + ", ".join(f"`{field.name}` {field.type}" for field in schema))
+
+    sql = st.text_area("Query", value=EXAMPLE_QUERY, height=180, key='sql_query')
+    if not st.button("Run", key='sql_run'):
+        return
+    try:
+        result = service.execute(sql, MAX_ROWS)
+    except QueryError as e:
+        st.error(str(e))
+        return
+
+    df = result.table.to_pandas()
+    timing = "cached" if result.cached else f"{result.seconds * 1000:.0f} ms"
+    st.caption(f"{len(df):,} rows · {timing} · {engine.name}"
+               + (f" · first {MAX_ROWS:,} rows shown" if result.truncated else ""))
+    st.dataframe(df, hide_index=True, use_container_width=True)
+    st.download_button("Download CSV", df.to_csv(index=False), file_name='query.csv', mime='text/csv',
+                       key='sql_download')
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('sql', nargs='?', help='a SELECT statement over accidents, licenses and violations')
+    parser.add_argument('--tables', action='store_true', help='list the tables and their columns')
+    parser.add_argument('--max-rows', type=int, default=None)
+    parser.add_argument('--output', help='write the result to this CSV file instead of printing it')
+    args = parser.parse_args(argv)
+
+    service = get()
+    if args.tables or not args.sql:
+        service.current()
+        for name, schema in service.schemas.items():
+            print(f"{name}: " + ", ".join(f"{field.name} {field.type}" for field in schema))
+        return 0
+
+    try:
+        result = service.execute(args.sql, args.max_rows)
+    except QueryError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    df = result.table.to_pandas()
+    if args.output:
+        df.to_csv(args.output, index=False)
+    else:
+        print(df.to_string(index=False))
+    print(f"{len(df)} rows in {result.seconds * 1000:.0f} ms ({service.engine.name})", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+"""Synthetic facc.csv / liz.csv / viola.json data for load testing.
+
+Columns follow what acc.py, liz.py, viola.py and violcube.py read. Zones are drawn from
+the real zone IDs in qatar_zones_polygons.json and categories follow the
+distributions documented in info.md. Generation is vectorized and chunked,
+string columns are dictionary-encoded, and output goes through pyarrow, so
+tens of millions of rows take seconds rather than minutes.
+
+    python synth.py accidents --rows 10000000 --output facc.parquet --seed 1
+    python synth.py licenses --rows 1000000 --output liz.csv
+    python synth.py violations --rows 120 --output viola.json
+    python synth.py zone_violations --rows 1825 --output viola_zones.csv
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from viola import violation_names
+
+ROOT = Path(__file__).resolve().parent
+
+# Rows generated per chunk; each chunk gets its own child seed
+CHUNK_ROWS = 2_000_000
+
+# Category values and relative frequencies as they appear in facc.csv / liz.csv
+ACCIDENT_SEVERITIES = {
+    'SIMPLE': 0.62,
+    'LIGHT INJURY': 0.30,
+    'HEAVY INJURY': 0.06,
+    'DEATH INJURY': 0.015,
+    'NON-TRAFFIC ACCIDENT (DEATH/HEAVY INJURY)': 0.005,
+}
+ACCIDENT_NATURES = {
+    'COLLISION WITH VEHICLES': 0.55,
+    'COLLISION WITH ANIMAL': 0.18,
+    'COLLISION WITH FIXED OBJECT': 0.12,
+    'COLLISION WITH PEDESTRIANS': 0.04,
+    'NON-COLLISION': 0.05,
+    'INVERSION': 0.03,
+    'FALL FROM CAR': 0.01,
+    'CLAIM CONVERTED TO ACCIDENT': 0.02,
+}
+ACCIDENT_REASONS = {
+    'OTHER': 0.55,
+    'NEGLIGENCE': 0.18,
+    'SUDDEN DEVIATION': 0.12,
+    'SPEED': 0.08,
+    'RED LIGHT': 0.04,
+    'DRUNK': 0.02,
+    'COST': 0.01,
+}
+NATIONALITY_GROUPS = {
+    'ASIA': 0.47,
+    'ARABI': 0.28,
+    'QATAR': 0.19,
+    'AFRIC': 0.03,
+    'EUROP': 0.02,
+    'AMERI': 0.01,
+}
+GENDERS = {'M': 0.82, 'F': 0.18}
+
+# Relative accident frequency by hour, peaking at 7-9 AM and 4-6 PM
+HOUR_WEIGHTS = np.array([
+    1.0, 0.7, 0.5, 0.4, 0.4, 0.8, 2.0, 4.5, 5.0, 3.5, 2.8, 2.8,
+    3.0, 3.2, 3.4, 3.8, 4.8, 5.0, 4.6, 3.6, 2.8, 2.2, 1.8, 1.4
+])
+
+# Every "HH:MM" value, indexed by minute of day
+TIMES_OF_DAY = np.array([f'{h:02d}:{m:02d}' for h in range(24) for m in range(60)])
+
+DATE_COLUMNS = ['ACCIDENT_DATE', 'FIRST_ISSUEDATE', 'DATE']
+
+def load_zone_ids(polygons_file=ROOT / 'qatar_zones_polygons.json'):
+    """Zone IDs from the polygon file, as integers"""
+    with open(polygons_file, 'r') as f:
+        return np.array(sorted(int(zone) for zone in json.load(f)))
+
+def zone_weights(zones):
+    """Skewed zone frequencies so a handful of zones dominate, as in the real data"""
+    # A fixed ranking keeps the same hot zones across chunks and seeds
+    ranks = np.random.default_rng(len(zones)).permutation(len(zones)) + 1
+    weights = 1.0 / ranks ** 0.9
+    return weights / weights.sum()
+
+def categorical(rng, distribution, rows):
+    """Sample a dictionary-encoded column from a {value: weight} mapping"""
+    values = list(distribution)
+    p = np.array(list(distribution.values()), dtype=float)
+    codes = rng.choice(len(values), rows, p=p / p.sum()).astype(np.int8)
+    return pd.Categorical.from_codes(codes, values)
+
+def random_dates(rng, rows, first_year, last_year):
+    """Uniform calendar dates between two years inclusive"""
+    start = np.datetime64(f'{first_year}-01-01')
+    days = (np.datetime64(f'{last_year + 1}-01-01') - start).astype(int)
+    return start + rng.integers(0, days, rows).astype('timedelta64[D]')
+
+def generate_accidents(rows, seed=0, years=(2020, 2024), zones=None, missing_rate=0.02):
+    """Generate a facc.csv-shaped accidents frame"""
+    rng = np.random.default_rng(seed)
+    zones = load_zone_ids() if zones is None else np.asarray(zones)
+
+    date = random_dates(rng, rows, *years)
+    year = date.astype('datetime64[Y]').astype(np.int16) + 1970
+    hour = rng.choice(24, rows, p=HOUR_WEIGHTS / HOUR_WEIGHTS.sum())
+    minute_of_day = hour * 60 + rng.integers(0, 60, rows)
+
+    # Perpetrator ages concentrate in the 25-45 range
+    age = np.clip(rng.normal(37, 11, rows), 18, 85).astype(np.int16)
+    birth_year = (year - age).astype(float)
+    birth_year[rng.random(rows) < missing_rate] = np.nan
+
+    return pd.DataFrame({
+        'ACCIDENT_YEAR': year,
+        'ACCIDENT_DATE': date,
+        'ACCIDENT_TIME': pd.Categorical.from_codes(minute_of_day, TIMES_OF_DAY),
+        'ZONE': rng.choice(zones, rows, p=zone_weights(zones)).astype(np.int16),
+        'ACCIDENT_SEVERITY': categorical(rng, ACCIDENT_SEVERITIES, rows),
+        'ACCIDENT_NATURE': categorical(rng, ACCIDENT_NATURES, rows),
+        'ACCIDENT_REASON': categorical(rng, ACCIDENT_REASONS, rows),
+        'NATIONALITY_GROUP_OF_ACCIDENT_': categorical(rng, NATIONALITY_GROUPS, rows),
+        'BIRTH_YEAR_OF_ACCIDENT_PERPETR': birth_year,
+        'DEATH_COUNT': rng.poisson(0.001, rows).astype(np.int16)
+    })
+
+def generate_licenses(rows, seed=0, years=(2020, 2024)):
+    """Generate a liz.csv-shaped license frame"""
+    rng = np.random.default_rng(seed)
+    issue_date = random_dates(rng, rows, *years)
+    issue_year = issue_date.astype('datetime64[Y]').astype(np.int16) + 1970
+
+    # Most first licenses are issued between 18 and 30
+    age = np.clip(rng.gamma(2.0, 4.0, rows) + 18, 18, 70).astype(np.int16)
+
+    return pd.DataFrame({
+        'FIRST_ISSUEDATE': issue_date,
+        'BIRTHYEAR': issue_year - age,
+        'GENDER': categorical(rng, GENDERS, rows),
+        'NATIONALITY_GROUP': categorical(rng, NATIONALITY_GROUPS, rows)
+    })
+
+def violation_profile(violations_file=ROOT / 'viola.json'):
+    """Mean violation shares and monthly total from viola.json, or a flat profile"""
+    try:
+        with open(violations_file, 'r') as f:
+            df = pd.DataFrame(json.load(f))
+        shares = df[list(violation_names)].fillna(0).sum()
+        return (shares / shares.sum()).to_numpy(), df['mjmw_lmkhlft_lmrwry_total_traffic_violations'].mean()
+    except (OSError, KeyError, ValueError):
+        return np.full(len(violation_names), 1 / len(violation_names)), 200_000.0
+
+def generate_violations(rows, seed=0, start='2018-01'):
+    """Generate viola.json-shaped monthly violation records"""
+    rng = np.random.default_rng(seed)
+    months = pd.period_range(start, periods=rows, freq='M')
+    shares, mean_total = violation_profile()
+
+    # Month-to-month variation around the observed mix, with mild seasonality
+    seasonal = 1 + 0.15 * np.sin(2 * np.pi * (months.month.to_numpy() - 3) / 12)
+    totals = rng.poisson(mean_total * seasonal)
+    mix = rng.dirichlet(shares * 200, rows)
+    counts = np.floor(mix * totals[:, None])
+
+    df = pd.DataFrame(counts, columns=list(violation_names))
+    df.insert(0, 'month', months.strftime('%Y-%m'))
+    df['mjmw_lmkhlft_lmrwry_total_traffic_violations'] = counts.sum(axis=1)
+    return df
+
+def generate_zone_violations(rows, seed=0, start='2018-01-01', zones=None):
+    """Generate viola_zones.csv-shaped records: `rows` days of non-zero zone x type counts"""
+    rng = np.random.default_rng(seed)
+    zones = load_zone_ids() if zones is None else np.asarray(zones)
+    days = pd.date_range(start, periods=rows, freq='D')
+    shares, mean_total = violation_profile()
+
+    # Each zone has its own mix around the national one; volume follows the skewed zone weights
+    seasonal = 1 + 0.15 * np.sin(2 * np.pi * (days.month.to_numpy() - 3) / 12)
+    daily = mean_total * 12 / 365 * seasonal
+    mix = rng.dirichlet(shares * 50, len(zones))
+    expected = daily[:, None, None] * zone_weights(zones)[None, :, None] * mix[None, :, :]
+    counts = rng.poisson(expected)
+
+    day, zone, kind = np.nonzero(counts)
+    return pd.DataFrame({
+        'DATE': days.to_numpy()[day],
+        'ZONE': zones[zone].astype(np.int16),
+        'VIOLATION': pd.Categorical.from_codes(kind, list(violation_names)),
+        'COUNT': counts[day, zone, kind].astype(np.int32)
+    })
+
+GENERATORS = {
+    'accidents': generate_accidents,
+    'licenses': generate_licenses,
+    'violations': generate_violations,
+    'zone_violations': generate_zone_violations,
+}
+
+def to_arrow(df):
+    """Convert a generated frame to an Arrow table with calendar-date columns"""
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    for name in DATE_COLUMNS:
+        if name in table.column_names:
+            index = table.column_names.index(name)
+            table = table.set_column(index, name, table.column(name).cast(pa.date32()))
+    return table
+
+def write_dataset(dataset, rows, output, seed=0, chunk_rows=CHUNK_ROWS):
+    """Generate a dataset in chunks and stream it to CSV, Parquet or JSON"""
+    output = Path(output)
+    generate = GENERATORS[dataset]
+
+    # Monthly violations are small and go to viola.json-style records in one piece
+    if dataset == 'violations' or output.suffix == '.json':
+        generate(rows, seed=seed).to_json(output, orient='records')
+        return output
+
+    # Zone-day cells come from one draw over the whole day range; rows counts days here
+    if dataset == 'zone_violations':
+        import pyarrow.csv as pa_csv
+        import pyarrow.parquet as pq
+
+        table = to_arrow(generate(rows, seed=seed))
+        if output.suffix == '.parquet':
+            pq.write_table(table, output)
+        else:
+            pa_csv.write_csv(table, output)
+        return output
+
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+
+    writer = None
+    child_seeds = np.random.SeedSequence(seed).spawn(-(-rows // chunk_rows))
+    try:
+        for child, start in zip(child_seeds, range(0, rows, chunk_rows)):
+            table = to_arrow(generate(min(chunk_rows, rows - start), seed=child))
+            if writer is None:
+                if output.suffix == '.parquet':
+                    writer = pq.ParquetWriter(output, table.schema)
+                else:
+                    writer = pa_csv.CSVWriter(output, table.schema)
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+    return output
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('dataset', choices=list(GENERATORS))
+    parser.add_argument('--rows', type=int, required=True, help='rows to generate; days for zone_violations')
+    parser.add_argument('--output', required=True, help='.csv, .parquet or .json')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    write_dataset(args.dataset, args.rows, args.output, seed=args.seed)
+    print(f"Wrote {args.rows:,} {args.dataset} rows to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+import numpy as np
+import pandas as pd
+
+WEEKDAYS = ['Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat', 'Sun']
+HOURS = list(range(24))
+
+class TemporalCube:
+    """Accident counts over year x zone x weekday x hour"""
+
+    def __init__(self, years, zones, weekdays, counts):
+        self.years = list(years)
+        self.zones = list(zones)
+        self.weekdays = list(weekdays)
+        self.counts = counts
+        self.year_index = {year: i for i, year in enumerate(self.years)}
+        self.zone_index = {zone: i for i, zone in enumerate(self.zones)}
+
+        # Marginals so the common heatmap queries are a single lookup
+        self.by_year = counts.sum(axis=1)
+        self.by_zone = counts.sum(axis=0)
+        self.total = self.by_year.sum(axis=0)
+
+    @classmethod
+    def from_accidents(cls, df):
+        """Build the cube from a loaded accidents frame in one bincount pass"""
+        hours = pd.to_numeric(df['HOUR'], errors='coerce').to_numpy()
+        valid = ~np.isnan(hours) & (hours >= 0) & (hours <= 23)
+
+        year_codes, years = pd.factorize(df['ACCIDENT_YEAR'].to_numpy()[valid], sort=True)
+        zone_codes, zones = pd.factorize(df['ZONE'].to_numpy()[valid], sort=True)
+        hour_codes = hours[valid].astype(np.int64)
+
+        if 'ACCIDENT_DATE' in df.columns:
+            dates = pd.to_datetime(df['ACCIDENT_DATE'].to_numpy()[valid], errors='coerce')
+            weekday_codes = np.asarray(dates.dayofweek, dtype=float)
+            known = ~np.isnan(weekday_codes)
+            year_codes, zone_codes, hour_codes = year_codes[known], zone_codes[known], hour_codes[known]
+            weekday_codes = weekday_codes[known].astype(np.int64)
+            weekdays = WEEKDAYS
+        else:
+            # Without a date column the weekday axis collapses to a single bucket
+            weekday_codes = np.zeros(len(hour_codes), dtype=np.int64)
+            weekdays = ['All']
+
+        shape = (len(years), len(zones), len(weekdays), len(HOURS))
+        flat = np.ravel_multi_index((year_codes, zone_codes, weekday_codes, hour_codes), shape)
+        counts = np.bincount(flat, minlength=int(np.prod(shape))).astype(np.int32).reshape(shape)
+        return cls(years, zones, weekdays, counts)
+
+    def to_arrays(self):
+        """Axis labels and counts as plain arrays, e.g. for np.savez"""
+        return {
+            'years': np.asarray(self.years),
+            'zones': np.asarray(self.zones, dtype=str),
+            'weekdays': np.asarray(self.weekdays, dtype=str),
+            'counts': self.counts,
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            arrays['years'].tolist(),
+            arrays['zones'].tolist(),
+            arrays['weekdays'].tolist(),
+            arrays['counts']
+        )
+
+    @property
+    def has_weekdays(self):
+        return len(self.weekdays) > 1
+
+    def heatmap(self, year=None, zone=None):
+        """Weekday x hour counts, optionally restricted to a year and/or zone"""
+        if year is not None and year not in self.year_index:
+            return np.zeros((len(self.weekdays), len(HOURS)), dtype=np.int32)
+        if zone is not None and zone not in self.zone_index:
+            return np.zeros((len(self.weekdays), len(HOURS)), dtype=np.int32)
+
+        if year is None and zone is None:
+            return self.total
+        if zone is None:
+            return self.by_year[self.year_index[year]]
+        if year is None:
+            return self.by_zone[self.zone_index[zone]]
+        return self.counts[self.year_index[year], self.zone_index[zone]]
+
+    def hourly_profile(self, year=None, zone=None):
+        """Counts per hour of day"""
+        return self.heatmap(year, zone).sum(axis=0)
+
+    def peak_hours(self, zone=None, year=None, k=3):
+        """The k busiest hours as [(hour, count), ...]"""
+        profile = self.hourly_profile(year, zone)
+        order = np.argsort(profile, kind='stable')[::-1][:k]
+        return [(int(hour), int(profile[hour])) for hour in order]
+
+    def zone_peak_ranking(self, year=None):
+        """Per-zone peak hour and the share of that zone's accidents falling in it"""
+        if year is None:
+            per_zone = self.counts.sum(axis=(0, 2))
+        elif year in self.year_index:
+            per_zone = self.counts[self.year_index[year]].sum(axis=1)
+        else:
+            per_zone = np.zeros((len(self.zones), len(HOURS)), dtype=np.int32)
+
+        totals = per_zone.sum(axis=1)
+        peak_hour = per_zone.argmax(axis=1)
+        peak_count = per_zone[np.arange(len(self.zones)), peak_hour]
+        ranking = pd.DataFrame({
+            'ZONE': self.zones,
+            'PEAK_HOUR': peak_hour,
+            'PEAK_COUNT': peak_count,
+            'TOTAL': totals,
+            'PEAK_SHARE': np.divide(peak_count, totals, out=np.zeros(len(totals)), where=totals > 0)
+        })
+        return ranking[ranking['TOTAL'] > 0].sort_values('PEAK_COUNT', ascending=False, ignore_index=True)
@@ -0,0 +1,62 @@
+"""TraffiQ as one multi-page app: home, accident, violation and license dashboards, plus SQL.
+
+All pages run in a single process and share the cached datasets and derived
+artifacts, so switching pages never reloads data. The per-dashboard scripts
+(app.py, acc.py, viola.py, liz.py) still run standalone.
+
+    streamlit run traffiq.py
+"""
+import streamlit as st
+
+st.set_page_config(
+    page_title="TraffiQ",
+    page_icon="🚦",
+    layout="wide"
+)
+
+# url_path of each dashboard page, used by the home page cards
+PAGE_PATHS = {
+    'accidents': 'accidents',
+    'violations': 'violations',
+    'licenses': 'licenses'
+}
+
+def home_page():
+    import app
+
+    app.main(dashboard_urls={key: f'/{path}' for key, path in PAGE_PATHS.items()}, link_target='_self')
+
+def accidents_page():
+    import acc
+    import instrument
+
+    instrument.start_run('accidents')
+    acc.shared_dashboard().run_dashboard(standalone=False)
+
+def violations_page():
+    import viola
+
+    viola.main(standalone=False)
+
+def licenses_page():
+    import instrument
+    import liz
+
+    instrument.start_run('licenses')
+    liz.shared_dashboard().run_dashboard(standalone=False)
+
+def sql_page():
+    import instrument
+    import sql
+
+    instrument.start_run('sql')
+    sql.render_panel()
+
+page = st.navigation([
+    st.Page(home_page, title="Home", icon="🏠", default=True),
+    st.Page(accidents_page, title="Accidents", icon="🚑", url_path=PAGE_PATHS['accidents']),
+    st.Page(violations_page, title="Violations", icon="🚔", url_path=PAGE_PATHS['violations']),
+    st.Page(licenses_page, title="Licenses", icon="📇", url_path=PAGE_PATHS['licenses']),
+    st.Page(sql_page, title="SQL", icon="🧮", url_path='sql'),
+])
+page.run()
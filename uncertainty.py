@@ -0,0 +1,138 @@
+"""Confidence intervals for dashboard numbers, resampled from aggregate counts.
+
+Counts are treated as Poisson: a replicate redraws every aggregate cell
+(e.g. accidents per zone, or per death count) as Poisson(observed), which
+is the Poisson bootstrap of the underlying rows without touching them.
+Replicates are drawn in fixed-size batches with their own seeds, on a
+thread pool, so results do not depend on the worker count. Plain counts
+also get exact (Garwood) intervals. Results are cached per data version in
+memory and under .traffiq_cache/uncertainty.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import datastore
+
+LEVEL = 0.95
+REPLICATES = 1000
+# Replicates per batch; each batch has its own seed, so batches can run anywhere
+BATCH = 250
+SEED = 20240101
+# Cached results kept in memory
+CACHE_SIZE = 256
+
+def poisson_interval(counts, level=LEVEL):
+    """Exact (Garwood) interval for Poisson counts, as (low, high) arrays"""
+    # Gamma quantiles, i.e. chi2.ppf(q, 2k) / 2, without importing scipy.stats
+    from scipy.special import gammaincinv
+
+    counts = np.asarray(counts, dtype=float)
+    alpha = 1 - level
+    low = np.where(counts > 0, gammaincinv(np.maximum(counts, 1), alpha / 2), 0.0)
+    high = gammaincinv(counts + 1, 1 - alpha / 2)
+    return low, high
+
+def bootstrap(counts, statistic, replicates=REPLICATES, seed=SEED, workers=None):
+    """statistic() of Poisson-resampled counts, stacked as (replicates, ...)
+
+    statistic takes a (batch, *counts.shape) array of resampled counts and returns
+    one row per replicate.
+    """
+    counts = np.asarray(counts, dtype=float)
+    sizes = [min(BATCH, replicates - start) for start in range(0, replicates, BATCH)]
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+
+    def run(task):
+        size, batch_seed = task
+        rng = np.random.default_rng(batch_seed)
+        return statistic(rng.poisson(counts, size=(size, *counts.shape)))
+
+    workers = workers or min(len(sizes), os.cpu_count() or 1)
+    if workers > 1 and len(sizes) > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            return np.concatenate(list(pool.map(run, zip(sizes, seeds))))
+    return np.concatenate([run(task) for task in zip(sizes, seeds)])
+
+def percentile_interval(samples, level=LEVEL):
+    """(low, high) percentiles over the replicate axis"""
+    alpha = (1 - level) / 2 * 100
+    low, high = np.percentile(samples, [alpha, 100 - alpha], axis=0)
+    return low, high
+
+def linear_intervals(cells, weights, level=LEVEL, **options):
+    """Intervals of statistics that are weighted sums of cell counts
+
+    cells: (n,) counts; weights: (n, k), one column per statistic. Returns (low, high), each (k,).
+    """
+    cells = np.asarray(cells, dtype=float)
+    weights = np.asarray(weights, dtype=float)
+    return percentile_interval(bootstrap(cells, lambda sample: sample @ weights, **options), level)
+
+def rank_intervals(counts, top=8, level=LEVEL, **options):
+    """Rank range and chance of making the top `top` for each of a set of competing counts
+
+    Returns a dict of arrays aligned with `counts`: rank_low, rank_high (1 = largest) and p_top.
+    """
+    counts = np.asarray(counts, dtype=float)
+
+    def ranks(sample):
+        order = np.argsort(-sample, axis=1, kind='stable')
+        result = np.empty_like(order)
+        np.put_along_axis(result, order, np.arange(1, counts.size + 1)[None, :], axis=1)
+        return result
+
+    sampled = bootstrap(counts, ranks, **options)
+    low, high = percentile_interval(sampled, level)
+    return {
+        'rank_low': np.floor(low).astype(int),
+        'rank_high': np.ceil(high).astype(int),
+        'p_top': (sampled <= top).mean(axis=0),
+    }
+
+def similarity_intervals(counts, row, level=LEVEL, **options):
+    """Cosine similarity of one row of a count matrix to every row, as (low, high) arrays
+
+    Cosine similarity ignores each row's scale, so proportions (fingerprints) built from
+    these counts have the same similarity as the counts themselves.
+    """
+    counts = np.asarray(counts, dtype=float)
+
+    def similarity(sample):
+        norms = np.linalg.norm(sample, axis=2)
+        norms[norms == 0] = 1.0
+        unit = sample / norms[:, :, None]
+        return np.einsum('bk,bmk->bm', unit[:, row], unit)
+
+    return percentile_interval(bootstrap(counts, similarity, **options), level)
+
+_results = OrderedDict()
+_results_lock = threading.Lock()
+
+def cached(name, version, params, compute):
+    """JSON-serializable result of compute() for (name, params, data version), kept in memory and on disk"""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()[:12]
+    key = f'{version}-{name}-{digest}'
+    with _results_lock:
+        if key in _results:
+            _results.move_to_end(key)
+            return _results[key]
+
+    path = datastore.cache_path('uncertainty', f'{key}.json')
+    try:
+        with open(path, 'r') as f:
+            result = json.load(f)
+    except (OSError, ValueError):
+        result = compute()
+        datastore.write_atomic(path, json.dumps(result, default=float))
+
+    with _results_lock:
+        _results[key] = result
+        if len(_results) > CACHE_SIZE:
+            _results.popitem(last=False)
+    return result
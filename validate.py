@@ -0,0 +1,319 @@
+"""Vectorized schema, range and referential checks for the raw datasets.
+
+Every rule is a single pass over one column that yields a boolean mask of
+failing rows. String columns are parsed once per distinct value and the
+result broadcast back through the factorized codes, so a ten-million-row
+file costs a few thousand parses. Rows failing an error rule are moved to
+quarantine in bulk; warning rules are only counted. The Report summarizing
+every rule is saved with the quarantined rows under .traffiq_cache/quality.
+
+    python validate.py accidents facc.csv
+    python validate.py licenses liz.csv --quarantine rejected.csv
+"""
+import argparse
+import json
+import sys
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import datastore
+
+ERROR = 'error'
+WARNING = 'warning'
+
+# Plausible ranges for the raw values
+MIN_YEAR = 1990
+PERPETRATOR_AGES = (0, 100)
+LICENSE_AGES = (16, 100)
+# Largest allowed gap between a month's total and the sum of its categories
+TOTAL_TOLERANCE = 0.5
+
+ACCIDENT_COLUMNS = ['ACCIDENT_YEAR', 'ACCIDENT_TIME', 'ZONE', 'DEATH_COUNT']
+ACCIDENT_CATEGORIES = ['ACCIDENT_SEVERITY', 'ACCIDENT_NATURE', 'ACCIDENT_REASON', 'NATIONALITY_GROUP_OF_ACCIDENT_']
+LICENSE_COLUMNS = ['FIRST_ISSUEDATE', 'BIRTHYEAR']
+GENDERS = ['M', 'F']
+VIOLATIONS_TOTAL = 'mjmw_lmkhlft_lmrwry_total_traffic_violations'
+
+class SchemaError(ValueError):
+    """A dataset lacks columns the dashboards cannot do without"""
+
+def by_value(series, parse, missing=np.nan):
+    """parse() run once per distinct value of a column, broadcast back to every row"""
+    codes, uniques = pd.factorize(series)
+    parsed = np.asarray(parse(pd.Series(uniques, dtype=object)))
+    # Missing values get code -1, which picks `missing` appended at the end
+    return np.append(parsed, missing)[codes]
+
+def parse_number(values):
+    return pd.to_numeric(values.astype(str).str.strip(), errors='coerce').astype(float)
+
+def parse_year(values):
+    return pd.to_datetime(values, errors='coerce').dt.year.astype(float)
+
+def parse_hour(values):
+    """Hour of an 'HH:MM' time, NaN when it isn't a valid time of day"""
+    parts = values.astype(str).str.extract(r'^\s*(\d{1,2})(?::(\d{2}))?')
+    hour = pd.to_numeric(parts[0], errors='coerce')
+    minute = pd.to_numeric(parts[1], errors='coerce').fillna(0)
+    return hour.where((hour <= 23) & (minute <= 59)).astype(float)
+
+def zone_ids(zones_data):
+    """Integer zone IDs of a polygons file"""
+    ids = pd.to_numeric(pd.Series(list(zones_data or {}), dtype=object), errors='coerce')
+    return np.unique(ids.dropna().to_numpy(dtype=float))
+
+def polygon_issues(zones_data):
+    """Zones whose polygon cannot be drawn"""
+    issues = []
+    for zone, zone_data in (zones_data or {}).items():
+        try:
+            points = np.array([[p['lng'], p['lat']] for p in zone_data['coordinates']], dtype=float)
+        except (KeyError, TypeError, ValueError):
+            issues.append(f"Zone {zone}: polygon coordinates are malformed")
+            continue
+        if len(points) < 3:
+            issues.append(f"Zone {zone}: polygon has fewer than 3 points")
+        elif not np.isfinite(points).all():
+            issues.append(f"Zone {zone}: polygon has non-numeric coordinates")
+    return issues
+
+class Report:
+    """Data-quality summary of one validation run"""
+
+    def __init__(self, dataset, rows, rules, issues=(), quarantine=None, quarantined=0, version=None):
+        self.dataset = dataset
+        self.rows = rows
+        # [{'rule', 'severity', 'description', 'rows'}] in check order
+        self.rules = list(rules)
+        self.issues = list(issues)
+        # The quarantined rows themselves are only held in memory by a fresh run
+        self.quarantine = quarantine
+        self.quarantined = len(quarantine) if quarantine is not None else quarantined
+        self.version = version
+
+    @property
+    def warnings(self):
+        return sum(rule['rows'] for rule in self.rules if rule['severity'] == WARNING)
+
+    @property
+    def ok(self):
+        return not self.issues and not any(rule['rows'] for rule in self.rules)
+
+    def table(self):
+        frame = pd.DataFrame(self.rules, columns=['rule', 'severity', 'description', 'rows'])
+        frame['share'] = frame['rows'] / max(self.rows, 1)
+        return frame
+
+    @staticmethod
+    def path(dataset, version, suffix='json'):
+        name = f'{dataset}-{version}-quarantine.csv' if suffix == 'csv' else f'{dataset}-{version}.json'
+        return datastore.cache_path('quality', name)
+
+    def to_dict(self):
+        return {
+            'dataset': self.dataset,
+            'rows': self.rows,
+            'quarantined': self.quarantined,
+            'issues': self.issues,
+            'rules': self.rules,
+        }
+
+    def save(self, version):
+        """Write the summary and the quarantined rows for a data version"""
+        self.version = version
+        if self.quarantined:
+            datastore.write_atomic(self.path(self.dataset, version, 'csv'),
+                                   self.quarantine.to_csv(index=False).encode())
+        datastore.write_atomic(self.path(self.dataset, version), json.dumps(self.to_dict(), indent=1))
+
+    @classmethod
+    def load(cls, dataset, version):
+        """The saved report for a data version, or None"""
+        try:
+            with open(cls.path(dataset, version), 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return cls(dataset, data['rows'], data['rules'], data['issues'],
+                   quarantined=data['quarantined'], version=version)
+
+    def quarantine_csv(self):
+        """Quarantined rows as CSV bytes"""
+        if self.quarantine is not None:
+            return self.quarantine.to_csv(index=False).encode()
+        path = self.path(self.dataset, self.version, 'csv')
+        return path.read_bytes() if path.is_file() else b''
+
+class Checks:
+    """Collects one failure mask per rule, then splits a frame into clean and quarantined rows"""
+
+    def __init__(self, dataset, df):
+        self.dataset = dataset
+        self.df = df
+        self.rules = []
+        self.masks = []
+        self.issues = []
+
+    def require(self, columns, severity=ERROR, note=''):
+        """The columns present; missing error columns raise, missing warning columns become issues"""
+        missing = [column for column in columns if column not in self.df.columns]
+        if missing and severity == ERROR:
+            raise SchemaError(f"{self.dataset} data is missing required columns: {', '.join(missing)}")
+        self.issues.extend(f"Column '{column}' is missing{note}" for column in missing)
+        return [column for column in columns if column in self.df.columns]
+
+    def add(self, rule, severity, description, failed):
+        failed = np.asarray(failed, dtype=bool)
+        self.rules.append({'rule': rule, 'severity': severity, 'description': description,
+                           'rows': int(failed.sum())})
+        self.masks.append((rule, severity, failed))
+
+    def split(self):
+        """(clean rows, Report) with every row failing an error rule quarantined"""
+        failing = np.zeros(len(self.df), dtype=bool)
+        reasons = np.full(len(self.df), '', dtype=object)
+        for rule, severity, failed in self.masks:
+            if severity != ERROR or not failed.any():
+                continue
+            failing |= failed
+            reasons[failed] = reasons[failed] + rule + ' '
+
+        quarantine = self.df[failing].assign(REASON=[reason.strip() for reason in reasons[failing]])
+        clean = self.df[~failing].reset_index(drop=True) if failing.any() else self.df
+        return clean, Report(self.dataset, len(self.df), self.rules, self.issues, quarantine)
+
+def accidents(df, zones_data=None):
+    """Validate raw facc.csv rows against the zone polygons"""
+    checks = Checks('accidents', df)
+    checks.require(ACCIDENT_COLUMNS)
+    this_year = date.today().year
+
+    year = pd.to_numeric(df['ACCIDENT_YEAR'], errors='coerce').to_numpy(dtype=float)
+    checks.add('year_range', ERROR, f'ACCIDENT_YEAR missing or outside {MIN_YEAR}-{this_year}',
+               ~((year >= MIN_YEAR) & (year <= this_year) & (year == np.floor(year))))
+
+    # Older extracts have no dates; the date-based views are skipped for them
+    if checks.require(['ACCIDENT_DATE'], WARNING):
+        date_year = by_value(df['ACCIDENT_DATE'], parse_year)
+        checks.add('date_invalid', ERROR, 'ACCIDENT_DATE is not a date', np.isnan(date_year))
+        checks.add('date_year_mismatch', ERROR, 'ACCIDENT_DATE falls outside ACCIDENT_YEAR',
+                   ~np.isnan(date_year) & ~np.isnan(year) & (date_year != year))
+
+    # Rows with a bad time or zone still count towards the totals; only the hour and zone views skip them
+    hour = by_value(df['ACCIDENT_TIME'], parse_hour)
+    checks.add('hour_range', WARNING, 'ACCIDENT_TIME is not a time between 00:00 and 23:59', np.isnan(hour))
+
+    zone = by_value(df['ZONE'], parse_number)
+    valid_zone = (zone >= 0) & (zone == np.floor(zone))
+    checks.add('zone_invalid', WARNING, 'ZONE is not a zone number', ~valid_zone)
+    if zones_data is not None:
+        checks.add('zone_unknown', WARNING, 'ZONE has no polygon in the zones file',
+                   valid_zone & ~np.isin(zone, zone_ids(zones_data)))
+        checks.issues.extend(polygon_issues(zones_data))
+
+    deaths = pd.to_numeric(df['DEATH_COUNT'], errors='coerce').to_numpy(dtype=float)
+    checks.add('death_count', ERROR, 'DEATH_COUNT missing, negative or fractional',
+               ~((deaths >= 0) & (deaths == np.floor(deaths))))
+
+    if checks.require(['BIRTH_YEAR_OF_ACCIDENT_PERPETR'], WARNING):
+        birth = pd.to_numeric(df['BIRTH_YEAR_OF_ACCIDENT_PERPETR'], errors='coerce').to_numpy(dtype=float)
+        age = year - birth
+        checks.add('birth_year_missing', WARNING, 'BIRTH_YEAR_OF_ACCIDENT_PERPETR is empty', np.isnan(birth))
+        checks.add('birth_year_range', ERROR,
+                   f'Perpetrator age outside {PERPETRATOR_AGES[0]}-{PERPETRATOR_AGES[1]}',
+                   ~np.isnan(age) & ((age < PERPETRATOR_AGES[0]) | (age > PERPETRATOR_AGES[1])))
+
+    for column in checks.require(ACCIDENT_CATEGORIES, WARNING):
+        checks.add(f"{column.lower().rstrip('_')}_missing", WARNING, f'{column} is empty', df[column].isna().to_numpy())
+    return checks.split()
+
+def licenses(df):
+    """Validate raw liz.csv rows"""
+    checks = Checks('licenses', df)
+    checks.require(LICENSE_COLUMNS)
+
+    issue_year = by_value(df['FIRST_ISSUEDATE'], parse_year)
+    checks.add('issue_date_invalid', ERROR, 'FIRST_ISSUEDATE is not a date', np.isnan(issue_year))
+
+    birth = pd.to_numeric(df['BIRTHYEAR'], errors='coerce').to_numpy(dtype=float)
+    age = issue_year - birth
+    checks.add('birth_year_invalid', ERROR, 'BIRTHYEAR missing or not a number', np.isnan(birth))
+    checks.add('age_range', ERROR, f'Age at first issue outside {LICENSE_AGES[0]}-{LICENSE_AGES[1]}',
+               ~np.isnan(age) & ((age < LICENSE_AGES[0]) | (age > LICENSE_AGES[1])))
+
+    if checks.require(['GENDER'], WARNING):
+        checks.add('gender_unknown', WARNING, f"GENDER is not one of {', '.join(GENDERS)}",
+                   ~df['GENDER'].isin(GENDERS).to_numpy())
+    if checks.require(['NATIONALITY_GROUP'], WARNING):
+        checks.add('nationality_missing', WARNING, 'NATIONALITY_GROUP is empty', df['NATIONALITY_GROUP'].isna().to_numpy())
+    return checks.split()
+
+def violations(df, columns):
+    """Validate raw viola.json months; `columns` are the violation categories"""
+    checks = Checks('violations', df)
+    checks.require(['month', VIOLATIONS_TOTAL])
+    present = checks.require(columns, WARNING, note=' and counted as zero')
+
+    month = pd.to_datetime(df['month'], errors='coerce')
+    checks.add('month_invalid', ERROR, 'month is not a date', month.isna().to_numpy())
+    checks.add('month_duplicate', ERROR, 'month appears more than once',
+               (month.duplicated(keep=False) & month.notna()).to_numpy())
+
+    counts = df[present + [VIOLATIONS_TOTAL]].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+    checks.add('count_missing', WARNING, 'Violation count is empty and counted as zero',
+               np.isnan(counts).any(axis=1))
+    checks.add('count_negative', ERROR, 'Violation count is negative', (counts < 0).any(axis=1))
+    if len(present) == len(columns):
+        gap = np.abs(np.nansum(counts[:, :-1], axis=1) - np.nan_to_num(counts[:, -1]))
+        checks.add('total_mismatch', WARNING, 'Total differs from the sum of the categories', gap > TOTAL_TOLERANCE)
+    return checks.split()
+
+def show(report, label):
+    """Data-quality banner and expander for a dashboard page"""
+    import streamlit as st
+
+    if report is None or report.ok:
+        return
+    if report.quarantined:
+        st.warning(f"{report.quarantined:,} of {report.rows:,} {label} rows failed validation and were left out.")
+    for issue in report.issues:
+        st.warning(issue)
+    with st.expander("Data Quality"):
+        table = report.table()
+        st.dataframe(table[table['rows'] > 0], hide_index=True, use_container_width=True)
+        if report.quarantined:
+            st.download_button("Download quarantined rows", report.quarantine_csv(),
+                               file_name=f"{report.dataset}-quarantine.csv", mime="text/csv")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('dataset', choices=['accidents', 'licenses', 'violations'])
+    parser.add_argument('file')
+    parser.add_argument('--polygons', default='qatar_zones_polygons.json')
+    parser.add_argument('--quarantine', help='write the quarantined rows to this CSV')
+    args = parser.parse_args(argv)
+
+    if args.dataset == 'violations':
+        from viola import violation_names
+
+        with open(args.file, 'r') as f:
+            _, report = violations(pd.DataFrame(json.load(f)), list(violation_names))
+    elif args.dataset == 'licenses':
+        _, report = licenses(pd.read_csv(args.file, skipinitialspace=True))
+    else:
+        with open(args.polygons, 'r') as f:
+            zones_data = json.load(f)
+        _, report = accidents(pd.read_csv(args.file, skipinitialspace=True), zones_data)
+
+    print(f"{report.rows:,} rows, {report.quarantined:,} quarantined")
+    for issue in report.issues:
+        print(f"  ! {issue}")
+    print(report.table().to_string(index=False))
+    if args.quarantine:
+        report.quarantine.to_csv(args.quarantine, index=False)
+    return 1 if report.quarantined or report.issues else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,71 +1,44 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-import plotly.graph_objects as go
-import plotly.express as px
-from sklearn.metrics.pairwise import cosine_similarity
 import json
-
-# Set page config
-st.set_page_config(
-    page_title="Qatar Traffic Violation Analysis",
-    page_icon="🚗",
-    layout="wide"
-)
-
-# Custom CSS
-st.markdown("""
-    <style>
-    .stApp {
-        background-color: black;
-        color: white;
-    }
-    .stSelectbox label, .stSlider label {
-        color: #FF00FF !important;
-    }
-    .home-button {
-        color: white;
-        padding: 5px 10px;
-        border-radius: 5px;
-        text-decoration: none;
-        font-weight: bold;
-        display: flex;
-        align-items: center;
-    }
-    .home-button:hover {
-        color: #00FFFF;
-    }
-    .home-button-icon {
-        margin-right: 5px;
-    }
-    </style>
-    """, unsafe_allow_html=True)
-
-# Home button
-st.markdown("""
-    <a href="https://traffiq.streamlit.app/" class="home-button">
-        <span class="home-button-icon">🏠</span>
-        <span>Home</span>
-    </a>
-    """, unsafe_allow_html=True)
+from pathlib import Path
+import anomaly
+import datastore
+import instrument
+import materialize
+import refresher
+import regimes
+import uncertainty
+import validate
 
 # Helper functions
-def load_json_data(filename):
-    """Load data from JSON file and clean it"""
+def read_json_data(filename):
+    """Load the raw monthly records from a JSON file"""
     with open(filename, 'r') as f:
         data = json.load(f)
     
     # Convert to DataFrame
-    df = pd.DataFrame(data)
-    
-    # Fill NaN values with 0 for numeric columns
+    return pd.DataFrame(data)
+
+def fill_missing_counts(df):
+    """Fill NaN values with 0 for numeric columns"""
     numeric_columns = df.select_dtypes(include=[np.number]).columns
     df[numeric_columns] = df[numeric_columns].fillna(0)
-    
     return df
 
+def load_json_data(filename):
+    """Load data from JSON file and clean it"""
+    return fill_missing_counts(read_json_data(filename))
+
 def create_fingerprint(df):
-    """Create violation fingerprints"""
+    """Create violation fingerprints
+
+    A sparse count matrix (a violcube rollup at any level) gives sparse row shares instead.
+    """
+    if hasattr(df, 'tocsr'):
+        return sparse_shares(df)
+
     violation_cols = [
         'lsr_lzy_d_lrdr_over_speed_radar',
         'mkhlft_qt_lshr_ldwy_y_passing_traffic_signal_violations',
@@ -96,6 +69,48 @@ def create_fingerprint(df):
     
     return fingerprints
 
+def sparse_shares(counts):
+    """Each row of a sparse count matrix divided by its total, still sparse"""
+    from scipy import sparse
+
+    counts = sparse.csr_matrix(counts, dtype=float)
+    totals = np.asarray(counts.sum(axis=1)).ravel()
+    scale = np.divide(1.0, totals, out=np.zeros_like(totals), where=totals != 0)
+    return sparse.diags(scale) @ counts
+
+def unit_rows(fingerprints):
+    """Rows scaled to unit length (zero rows stay zero), sparse in, sparse out"""
+    if hasattr(fingerprints, 'tocsr'):
+        from scipy import sparse
+
+        values = sparse.csr_matrix(fingerprints, dtype=float)
+        norms = np.sqrt(np.asarray(values.multiply(values).sum(axis=1)).ravel())
+        norms[norms == 0] = 1.0
+        return sparse.diags(1.0 / norms) @ values
+    values = np.asarray(fingerprints, dtype=float)
+    norms = np.linalg.norm(values, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return values / norms
+
+def most_similar(fingerprints, row, top=4):
+    """(row indices, cosine similarities) of the `top` rows closest to `row`, best first
+
+    Only the one row of similarities is computed, so this works on sparse rollups too
+    large for a full similarity matrix. The row itself is included.
+    """
+    normalized = unit_rows(fingerprints)
+    similarities = normalized @ normalized[row].T
+    similarities = similarities.toarray().ravel() if hasattr(similarities, 'toarray') else np.ravel(similarities)
+    top = min(top, len(similarities))
+    best = np.argpartition(-similarities, top - 1)[:top] if top else np.array([], dtype=int)
+    best = best[np.lexsort((best, -similarities[best]))]
+    return best, similarities[best]
+
+def cosine_similarity(fingerprints):
+    """Pairwise cosine similarity between fingerprint rows; sparse when the fingerprints are"""
+    normalized = unit_rows(fingerprints)
+    return normalized @ normalized.T
+
 # Friendly names mapping
 violation_names = {
     'lsr_lzy_d_lrdr_over_speed_radar': 'Over Speed (Radar)',
@@ -110,122 +125,363 @@ violation_names = {
     'khr_other': 'Other'
 }
 
-# App title
-st.title("🚗 Qatar Traffic Violation Pattern Analysis")
+def clean_violations(df):
+    """Parse months and sort chronologically"""
+    df['month'] = pd.to_datetime(df['month'])
+    return df.sort_values('month', ignore_index=True)
 
-try:
-    # Load and prepare data
-    with st.spinner('Loading data...'):
-        df = load_json_data('viola.json')
-        df['month'] = pd.to_datetime(df['month'])
-        df = df.sort_values('month')
+def ingest_violations(df):
+    """Quarantine invalid raw months, then fill and sort the rest; returns (df, validate.Report)"""
+    df, report = validate.violations(df, list(violation_names))
+    return clean_violations(fill_missing_counts(df)), report
+
+def prepare_data(filename='viola.json'):
+    """Load, validate, sort, fingerprint and score the monthly data"""
+    with instrument.stage('load_json_data', 'load'):
+        # Materialized table and similarity index when they match the file
+        version = datastore.dataset_version(filename)
+        df = materialize.load_table('violations_table', (filename,))
+        quality = validate.Report.load('violations', version)
+        if df is None or quality is None:
+            df, quality = ingest_violations(read_json_data(filename))
+            quality.save(version)
+    with instrument.stage('fingerprints', 'aggregate'):
         fingerprints = create_fingerprint(df)
-        similarity_matrix = cosine_similarity(fingerprints)
+        index = materialize.load_arrays('violation_index', (filename,))
+        if index is not None and len(index['similarity']) == len(df):
+            similarity_matrix = index['similarity']
+        else:
+            similarity_matrix = cosine_similarity(fingerprints)
+    with instrument.stage('anomaly_scores', 'aggregate'):
+        anomaly_scores = anomaly.score_months(df, fingerprints)
+    return df, fingerprints, similarity_matrix, anomaly_scores, quality
+
+def similarity_intervals(version, df, month_idx):
+    """95% intervals of one month's similarity to every month, as [low, high] lists"""
+    def compute():
+        # Resampled from the violation counts; their cosine similarity equals the fingerprints'
+        counts = df[list(violation_names)].clip(lower=0).to_numpy(dtype=float)
+        low, high = uncertainty.similarity_intervals(counts, month_idx)
+        return [low.tolist(), high.tolist()]
+
+    return uncertainty.cached('violation_similarity', version, {'month': int(month_idx)}, compute)
+
+# Zone-day violation counts, shown when the file is present
+ZONE_VIOLATIONS_FILE = 'viola_zones.csv'
+# Rollup levels offered for the zone pattern search
+ZONE_LEVELS = {
+    'zone': 'Zone',
+    'zone_month': 'Zone and month',
+    'month': 'Month',
+}
+
+@st.cache_resource
+def load_zone_cube(version, filename=ZONE_VIOLATIONS_FILE):
+    """The sparse zone-day cube: the materialized one for this version, else streamed from the CSV"""
+    import violcube
+
+    arrays = materialize.load_arrays('violation_cube', (filename, 'qatar_zones_polygons.json'))
+    if arrays is not None:
+        return violcube.ViolationCube.from_arrays(arrays)
+    return violcube.ViolationCube.from_csv(filename)
+
+def label_text(column, value):
+    if column == 'zone':
+        return f'Zone {value}'
+    if column == 'month':
+        return value.strftime('%B %Y')
+    return str(value)
+
+def render_zone_patterns(selected_violation, filename=ZONE_VIOLATIONS_FILE):
+    """Where violations cluster and which zones or months share a pattern, from the zone-day feed"""
+    if not Path(filename).is_file():
+        return
+    import plotly.express as px
+
+    st.subheader('📍 Violations by Zone')
+    with instrument.stage('zone_cube', 'load'):
+        cube = load_zone_cube(datastore.dataset_version(filename, 'qatar_zones_polygons.json'), filename)
+    st.caption(f"{len(cube.zones)} zones × {len(cube.dates):,} days × {len(cube.types)} types · "
+               f"{cube.counts.nnz:,} non-zero cells ({cube.density:.1%})")
+
+    col5, col6 = st.columns(2)
+
+    with col5:
+        with instrument.stage('zone_totals', 'aggregate'):
+            by_zone = cube.frame('zone').nlargest(15, selected_violation)
+        fig_zones = px.bar(
+            x=[f'Zone {zone}' for zone in by_zone['zone']],
+            y=by_zone[selected_violation],
+            title=f'Zones with the Most {violation_names[selected_violation]} Violations'
+        )
+        fig_zones.update_traces(marker_color='#00FFFF')
+        fig_zones.update_layout(
+            xaxis_title='Zone',
+            yaxis_title='Number of Violations',
+            plot_bgcolor='black',
+            paper_bgcolor='black',
+            font_color='white'
+        )
+        st.plotly_chart(fig_zones, use_container_width=True)
 
-    # Create two columns for the dropdowns
-    col1, col2 = st.columns(2)
+    with col6:
+        level = st.selectbox('Compare Patterns By:', options=list(ZONE_LEVELS), format_func=lambda x: ZONE_LEVELS[x])
+        labels, counts = cube.rollup(level)
 
-    with col1:
-        # Violation type selector for line chart
-        selected_violation = st.selectbox(
-            'Select Violation Type for Line Chart:',
-            options=list(violation_names.keys()),
-            format_func=lambda x: violation_names[x]
+        # One selector per label column; together they pick a row of the rollup
+        selected = np.ones(len(labels), dtype=bool)
+        for column in labels.columns:
+            values = labels[column].unique()
+            choice = st.selectbox(f'Select {column.title()}:', options=range(len(values)),
+                                  format_func=lambda i, column=column, values=values: label_text(column, values[i]))
+            selected &= (labels[column] == values[choice]).to_numpy()
+        row = int(np.flatnonzero(selected)[0])
+
+        totals = cube.totals(level)
+        if totals[row] == 0:
+            st.write("No violations recorded here.")
+        else:
+            with instrument.stage('zone_similarity', 'aggregate'):
+                fingerprints = create_fingerprint(counts)
+                matches, scores = most_similar(fingerprints, row, top=6)
+            shares = fingerprints[matches].toarray()
+            st.dataframe(pd.DataFrame({
+                'Match': [' · '.join(label_text(column, labels[column].iloc[match]) for column in labels.columns)
+                          for match in matches],
+                'Similarity (%)': (scores * 100).round(2),
+                'Violations': totals[matches].astype(int),
+                'Top Type': [violation_names[cube.types[i]] for i in shares.argmax(axis=1)]
+            })[matches != row].head(5), hide_index=True, use_container_width=True)
+
+def main(standalone=True):
+    instrument.start_run('violations')
+
+    # Page config and the home link belong to the standalone app; traffiq.py owns both when mounted as a page
+    if standalone:
+        st.set_page_config(
+            page_title="Qatar Traffic Violation Analysis",
+            page_icon="🚗",
+            layout="wide"
         )
 
-    with col2:
-        # Month selector for Pareto chart
-        month_options = [date.strftime('%B %Y') for date in df['month']]
-        selected_month_idx = st.selectbox(
-            'Select Month for Pattern Analysis:',
-            options=range(len(month_options)),
-            format_func=lambda x: month_options[x]
+    # Custom CSS
+    st.markdown("""
+        <style>
+        .stApp {
+            background-color: black;
+            color: white;
+        }
+        .stSelectbox label, .stSlider label {
+            color: #FF00FF !important;
+        }
+        .home-button {
+            color: white;
+            padding: 5px 10px;
+            border-radius: 5px;
+            text-decoration: none;
+            font-weight: bold;
+            display: flex;
+            align-items: center;
+        }
+        .home-button:hover {
+            color: #00FFFF;
+        }
+        .home-button-icon {
+            margin-right: 5px;
+        }
+        </style>
+        """, unsafe_allow_html=True)
+
+    # Home button
+    if standalone:
+        st.markdown("""
+            <a href="https://traffiq.streamlit.app/" class="home-button">
+                <span class="home-button-icon">🏠</span>
+                <span>Home</span>
+            </a>
+            """, unsafe_allow_html=True)
+
+    # App title
+    st.title("🚗 Qatar Traffic Violation Pattern Analysis")
+
+    try:
+        # Load and prepare data
+        with st.spinner('Loading data...'):
+            # Prepared once per data version by the background refresher, shared by every session
+            snapshot = refresher.get().current('violations')
+            df, fingerprints, similarity_matrix, anomaly_scores, quality = snapshot.value
+            with instrument.stage('regimes', 'aggregate'):
+                regime_model = regimes.load_regimes(snapshot.version, df['month'], fingerprints)
+                timeline = regimes.regime_timeline(regime_model, fingerprints.columns, violation_names)
+
+        # Months left out at ingest and violation columns counted as zero
+        validate.show(quality, 'month')
+
+        # Plotting libraries are imported after the page shell has rendered
+        import plotly.graph_objects as go
+        import plotly.express as px
+
+        # Create two columns for the dropdowns
+        col1, col2 = st.columns(2)
+
+        with col1:
+            # Violation type selector for line chart
+            selected_violation = st.selectbox(
+                'Select Violation Type for Line Chart:',
+                options=list(violation_names.keys()),
+                format_func=lambda x: violation_names[x]
+            )
+
+        with col2:
+            # Month selector for Pareto chart
+            month_options = [date.strftime('%B %Y') for date in df['month']]
+            selected_month_idx = st.selectbox(
+                'Select Month for Pattern Analysis:',
+                options=range(len(month_options)),
+                format_func=lambda x: month_options[x]
+            )
+
+        # Monthly Violation Line Chart
+        st.subheader('Monthly Violation Line Chart')
+        with instrument.stage('monthly_totals', 'aggregate'):
+            monthly_data = df.groupby([df['month'].dt.year, df['month'].dt.month])[selected_violation].sum().unstack(level=0)
+        fig_line = px.line(monthly_data, title=f'Monthly {violation_names[selected_violation]} Violations')
+        fig_line.update_traces(line=dict(width=4, shape='spline'))
+        fig_line.update_layout(
+            xaxis=dict(
+                title='Month',
+                tickmode='array',
+                tickvals=list(range(1, 13)),
+                ticktext=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+            ),
+            yaxis_title='Number of Violations',
+            plot_bgcolor='black',
+            paper_bgcolor='black',
+            font_color='white'
         )
+        st.plotly_chart(fig_line, use_container_width=True)
+
+        # Create two columns for Pareto chart and similarity results
+        col3, col4 = st.columns(2)
 
-    # Monthly Violation Line Chart
-    st.subheader('Monthly Violation Line Chart')
-    monthly_data = df.groupby([df['month'].dt.year, df['month'].dt.month])[selected_violation].sum().unstack(level=0)
-    fig_line = px.line(monthly_data, title=f'Monthly {violation_names[selected_violation]} Violations')
-    fig_line.update_traces(line=dict(width=4, shape='spline'))
-    fig_line.update_layout(
-        xaxis=dict(
-            title='Month',
-            tickmode='array',
-            tickvals=list(range(1, 13)),
-            ticktext=['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
-        ),
-        yaxis_title='Number of Violations',
-        plot_bgcolor='black',
-        paper_bgcolor='black',
-        font_color='white'
-    )
-    st.plotly_chart(fig_line, use_container_width=True)
-
-    # Create two columns for Pareto chart and similarity results
-    col3, col4 = st.columns(2)
-
-    with col3:
-        # Pareto Chart
-        st.subheader('Violation Pattern Pareto Chart')
-        selected_fingerprint = fingerprints.iloc[selected_month_idx]
-        sorted_fingerprint = selected_fingerprint.sort_values(ascending=False)
-        
-        fig_pareto = go.Figure()
-        fig_pareto.add_trace(go.Bar(
-            x=[violation_names[col] for col in sorted_fingerprint.index],
-            y=sorted_fingerprint.values * 100,
-            marker_color='#FF00FF'
-        ))
-        
-        fig_pareto.update_layout(
-            title=f"Violation Pattern for {month_options[selected_month_idx]}",
-            xaxis_title='Violation Type',
-            yaxis_title='Percentage (%)',
+        with col3:
+            # Pareto Chart
+            st.subheader('Violation Pattern Pareto Chart')
+            selected_fingerprint = fingerprints.iloc[selected_month_idx]
+            sorted_fingerprint = selected_fingerprint.sort_values(ascending=False)
+
+            fig_pareto = go.Figure()
+            fig_pareto.add_trace(go.Bar(
+                x=[violation_names[col] for col in sorted_fingerprint.index],
+                y=sorted_fingerprint.values * 100,
+                marker_color='#FF00FF'
+            ))
+
+            fig_pareto.update_layout(
+                title=f"Violation Pattern for {month_options[selected_month_idx]}",
+                xaxis_title='Violation Type',
+                yaxis_title='Percentage (%)',
+                plot_bgcolor='black',
+                paper_bgcolor='black',
+                font_color='white'
+            )
+            st.plotly_chart(fig_pareto, use_container_width=True)
+
+        with col4:
+            # Similarity Results
+            st.subheader('Pattern Similarity Results')
+            similarities = similarity_matrix[selected_month_idx]
+            low, high = similarity_intervals(snapshot.version, df, selected_month_idx)
+            similarity_df = pd.DataFrame({
+                'Month': df['month'].dt.strftime('%B %Y'),
+                'Similarity': similarities * 100,
+                'Low': np.asarray(low) * 100,
+                'High': np.asarray(high) * 100
+            })
+            similarity_df = similarity_df.sort_values('Similarity', ascending=False).head(4)  # Display only top 4
+
+            st.markdown(f"**Regime:** {timeline['label'].iloc[selected_month_idx]}")
+
+            selected_scores = anomaly_scores.iloc[selected_month_idx]
+            if selected_scores['anomaly']:
+                st.warning(f"⚠️ {month_options[selected_month_idx]} is anomalous: {selected_scores['reason']}")
+
+            for _, row in similarity_df.iterrows():
+                st.markdown(f"""
+                    <div style='
+                        background-color: #111111;
+                        padding: 10px;
+                        border-radius: 5px;
+                        border: 1px solid #333;
+                        margin-bottom: 5px;
+                    '>
+                        <h4 style='margin: 0; color: white;'>{row['Month']}</h4>
+                        <p style='margin: 0; color: white;'>Similarity: {row['Similarity']:.2f}%
+                            <span style='color: #888;'>(95% CI {row['Low']:.2f}–{row['High']:.2f}%)</span></p>
+                    </div>
+                """, unsafe_allow_html=True)
+
+        # Regime timeline
+        st.subheader('🧭 Violation Regimes')
+        fig_regimes = px.scatter(
+            timeline, x='month', y='label', color='label',
+            color_discrete_sequence=['#FF00FF', '#00FFFF', '#FF0000', '#FFFF00', '#00FF00', '#FF8800'],
+            title='Monthly Violation Regimes'
+        )
+        fig_regimes.update_traces(marker=dict(size=14, symbol='square'))
+        fig_regimes.update_layout(
+            xaxis_title='Month',
+            yaxis_title='',
+            showlegend=False,
             plot_bgcolor='black',
             paper_bgcolor='black',
             font_color='white'
         )
-        st.plotly_chart(fig_pareto, use_container_width=True)
-
-    with col4:
-        # Similarity Results
-        st.subheader('Pattern Similarity Results')
-        similarities = similarity_matrix[selected_month_idx]
-        similarity_df = pd.DataFrame({
-            'Month': df['month'].dt.strftime('%B %Y'),
-            'Similarity': similarities * 100
-        })
-        similarity_df = similarity_df.sort_values('Similarity', ascending=False).head(4)  # Display only top 4
-        
-        for _, row in similarity_df.iterrows():
-            st.markdown(f"""
-                <div style='
-                    background-color: #111111;
-                    padding: 10px;
-                    border-radius: 5px;
-                    border: 1px solid #333;
-                    margin-bottom: 5px;
-                '>
-                    <h4 style='margin: 0; color: white;'>{row['Month']}</h4>
-                    <p style='margin: 0; color: white;'>Similarity: {row['Similarity']:.2f}%</p>
-                </div>
-            """, unsafe_allow_html=True)
+        st.plotly_chart(fig_regimes, use_container_width=True)
 
-    # Insights section
-    st.subheader('📊 Insights')
-    st.write("""
-        This visualization reveals the 'fingerprint' of traffic violations for each month. 
-        The Pareto chart shows the proportion of each violation type, while the similarity results 
-        help identify months with similar violation patterns, regardless of total volume.
-    """)
-    
-    st.markdown("""
-        **Key features to look for:**
-        - Dominant violation types (longer bars in the Pareto chart)
-        - Seasonal patterns (similar months across years)
-        - Unusual months (low similarity with others)
-        - Long-term changes in violation patterns
-    """)
-
-except Exception as e:
-    st.error(f"An error occurred: {str(e)}")
\ No newline at end of file
+        # Anomalous months against each month's seasonal and recent baseline
+        st.subheader('🚨 Anomalous Months')
+        flagged = anomaly_scores[anomaly_scores['anomaly']]
+        if flagged.empty:
+            st.write("No month deviates strongly from its seasonal baseline.")
+        else:
+            st.dataframe(pd.DataFrame({
+                'Month': flagged['month'].dt.strftime('%B %Y'),
+                'Total Violations': flagged['total'].astype(int),
+                'Pattern z': flagged['pattern_z'].round(2),
+                'Volume z': flagged['volume_z'].round(2),
+                'Reason': flagged['reason']
+            }), hide_index=True, use_container_width=True)
+            st.download_button(
+                'Download anomaly report (CSV)',
+                anomaly.anomaly_report(anomaly_scores),
+                file_name='violation_anomalies.csv',
+                mime='text/csv'
+            )
+
+        # Zone-day feed, when one has been delivered
+        render_zone_patterns(selected_violation)
+
+        # Insights section
+        st.subheader('📊 Insights')
+        st.write("""
+            This visualization reveals the 'fingerprint' of traffic violations for each month. 
+            The Pareto chart shows the proportion of each violation type, while the similarity results 
+            help identify months with similar violation patterns, regardless of total volume.
+        """)
+
+        st.markdown("""
+            **Key features to look for:**
+            - Dominant violation types (longer bars in the Pareto chart)
+            - Seasonal patterns (similar months across years)
+            - Unusual months (low similarity with others)
+            - Long-term changes in violation patterns
+        """)
+
+    except Exception as e:
+        st.error(f"An error occurred: {str(e)}")
+
+    instrument.render_debug_panel()
+
+if __name__ == "__main__":
+    main()
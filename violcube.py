@@ -0,0 +1,202 @@
+"""Violation counts over zone x day x type, stored sparse.
+
+viola_zones.csv lists one (DATE, ZONE, VIOLATION, COUNT) row per non-zero
+cell, with VIOLATION one of the viola.json columns or its friendly name.
+The cube keeps those cells in a CSR matrix with one row per (zone, day)
+and one column per violation type, so the mostly empty grid only costs
+memory for cells that occurred. Rollups to zone-month, zone, day, month or
+national totals re-key the non-zero entries and sum duplicates, without
+densifying the grid, and viola.create_fingerprint / viola.most_similar
+take a rollup's counts at any level.
+
+    python violcube.py viola_zones.csv --level zone_month
+"""
+import argparse
+import json
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from viola import violation_names
+
+ZONE_VIOLATIONS_FILE = 'viola_zones.csv'
+COLUMNS = ['DATE', 'ZONE', 'VIOLATION', 'COUNT']
+# Raw rows parsed per chunk
+CHUNK_ROWS = 1_000_000
+
+# Rollup level -> axes it keeps
+LEVELS = {
+    'zone_day': ('zone', 'day'),
+    'zone_month': ('zone', 'month'),
+    'zone': ('zone',),
+    'day': ('day',),
+    'month': ('month',),
+    'national': (),
+}
+
+# One row of labels per row of counts (a scipy CSR matrix, one column per violation type)
+Rollup = namedtuple('Rollup', ['labels', 'counts'])
+
+def load_zone_ids(polygons_file='qatar_zones_polygons.json'):
+    """Zone IDs from the polygon file, as sorted integers"""
+    with open(polygons_file, 'r') as f:
+        return np.array(sorted(int(zone) for zone in json.load(f)))
+
+def type_codes(values):
+    """Column index of each violation type, by key or friendly name; -1 if unknown"""
+    lookup = {key: i for i, key in enumerate(violation_names)}
+    lookup.update({name: i for i, name in enumerate(violation_names.values())})
+    return pd.Series(values).astype(str).str.strip().map(lookup).fillna(-1).to_numpy(dtype=np.int64)
+
+def parse_cells(df, zones):
+    """(zone code, day, type code, count) arrays of the valid non-zero rows, plus the rejected row count"""
+    days = pd.to_datetime(df['DATE'], errors='coerce').to_numpy(dtype='datetime64[D]')
+    zone_values = pd.to_numeric(df['ZONE'], errors='coerce').to_numpy(dtype=float)
+    counts = pd.to_numeric(df['COUNT'], errors='coerce').to_numpy(dtype=float)
+    types = type_codes(df['VIOLATION'].to_numpy())
+
+    zone_codes = np.searchsorted(zones, zone_values).clip(max=len(zones) - 1)
+    valid = (~np.isnat(days) & (zones[zone_codes] == zone_values) & (types >= 0)
+             & np.isfinite(counts) & (counts >= 0))
+    kept = valid & (counts > 0)
+    return (zone_codes[kept], days[kept].astype(np.int64), types[kept], counts[kept].astype(np.int64),
+            int((~valid).sum()))
+
+class ViolationCube:
+    def __init__(self, zones, start, days, counts, dropped=0):
+        from scipy import sparse
+
+        self.zones = np.asarray(zones)
+        self.dates = pd.date_range(start, periods=days, freq='D')
+        self.types = list(violation_names)
+        self.counts = sparse.csr_matrix(counts)
+        # Raw rows rejected at ingest (unknown zone or type, bad date or count)
+        self.dropped = dropped
+        self._rollups = {}
+
+    @classmethod
+    def from_cells(cls, zones, zone_codes, days, types, counts, dropped=0):
+        from scipy import sparse
+
+        if len(days):
+            start, span = days.min(), int(days.max() - days.min()) + 1
+        else:
+            start, span = 0, 0
+        rows = zone_codes * span + (days - start)
+        # Duplicate (zone, day, type) cells are summed on construction
+        matrix = sparse.csr_matrix((counts, (rows, types)), shape=(len(zones) * span, len(violation_names)))
+        matrix.sum_duplicates()
+        return cls(zones, np.datetime64(int(start), 'D'), span, matrix, dropped)
+
+    @classmethod
+    def from_frame(cls, df, zones=None):
+        zones = np.unique(pd.to_numeric(df['ZONE'], errors='coerce').dropna()) if zones is None else np.asarray(zones)
+        *cells, dropped = parse_cells(df, np.asarray(zones, dtype=float))
+        return cls.from_cells(zones, *cells, dropped=dropped)
+
+    @classmethod
+    def from_csv(cls, path=ZONE_VIOLATIONS_FILE, zones=None, chunk_rows=CHUNK_ROWS):
+        """Stream a zone-day file chunk by chunk; zones default to the polygon file's"""
+        zones = load_zone_ids() if zones is None else np.asarray(zones)
+        parts, dropped = [], 0
+        for chunk in pd.read_csv(path, usecols=COLUMNS, skipinitialspace=True, chunksize=chunk_rows):
+            *cells, rejected = parse_cells(chunk, zones.astype(float))
+            parts.append(cells)
+            dropped += rejected
+        cells = [np.concatenate(arrays) for arrays in zip(*parts)] if parts else [np.array([], dtype=np.int64)] * 4
+        return cls.from_cells(zones, *cells, dropped=dropped)
+
+    def to_arrays(self):
+        """Sparse components and axis labels as plain arrays, e.g. for np.savez"""
+        return {
+            'data': self.counts.data,
+            'indices': self.counts.indices,
+            'indptr': self.counts.indptr,
+            'shape': np.asarray(self.counts.shape),
+            'zones': self.zones,
+            'start': np.asarray(self.dates[0] if len(self.dates) else pd.Timestamp(0), dtype='datetime64[D]'),
+            'days': np.asarray(len(self.dates)),
+            'dropped': np.asarray(self.dropped),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        from scipy import sparse
+
+        matrix = sparse.csr_matrix((arrays['data'], arrays['indices'], arrays['indptr']),
+                                   shape=tuple(arrays['shape']))
+        return cls(arrays['zones'], arrays['start'][()], int(arrays['days']), matrix, int(arrays['dropped']))
+
+    @property
+    def density(self):
+        cells = self.counts.shape[0] * self.counts.shape[1]
+        return self.counts.nnz / cells if cells else 0.0
+
+    def rollup(self, level):
+        """Rollup of the counts to a level in LEVELS, computed once"""
+        if level not in self._rollups:
+            self._rollups[level] = self._rollup(LEVELS[level])
+        return self._rollups[level]
+
+    def _rollup(self, keep):
+        from scipy import sparse
+
+        cells = self.counts.tocoo()
+        zone, day = np.divmod(cells.row, max(len(self.dates), 1))
+        month_codes, months = pd.factorize(self.dates.to_period('M'), sort=True)
+        axes = {
+            'zone': (zone, pd.Index(self.zones, name='zone')),
+            'day': (day, pd.Index(self.dates, name='day')),
+            'month': (month_codes[day], pd.Index(months, name='month')),
+        }
+
+        if keep:
+            codes, levels = zip(*(axes[axis] for axis in keep))
+            groups = np.ravel_multi_index(codes, tuple(len(level) for level in levels))
+            labels = pd.MultiIndex.from_product(levels).to_frame(index=False)
+        else:
+            groups = np.zeros(cells.nnz, dtype=np.int64)
+            labels = pd.DataFrame({'level': ['national']})
+        counts = sparse.csr_matrix((cells.data, (groups, cells.col)), shape=(len(labels), len(self.types)))
+        counts.sum_duplicates()
+        return Rollup(labels, counts)
+
+    def totals(self, level):
+        """Total violations of each row of a rollup"""
+        return np.asarray(self.rollup(level).counts.sum(axis=1)).ravel()
+
+    def frame(self, level):
+        """A rollup as labels plus one dense column per violation type; meant for the coarse levels"""
+        labels, counts = self.rollup(level)
+        dense = pd.DataFrame(counts.toarray(), columns=self.types)
+        return pd.concat([labels, dense], axis=1)
+
+def main(argv=None):
+    import viola
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', nargs='?', default=ZONE_VIOLATIONS_FILE)
+    parser.add_argument('--level', choices=list(LEVELS), default='zone')
+    parser.add_argument('--top', type=int, default=10, help='rows with the most violations to list')
+    args = parser.parse_args(argv)
+
+    cube = ViolationCube.from_csv(args.path)
+    print(f"{len(cube.zones)} zones x {len(cube.dates)} days x {len(cube.types)} types: "
+          f"{cube.counts.nnz:,} non-zero cells ({cube.density:.1%}), {cube.dropped:,} rows rejected")
+
+    labels, counts = cube.rollup(args.level)
+    totals = cube.totals(args.level)
+    fingerprints = viola.create_fingerprint(counts)
+    for row in np.argsort(-totals, kind='stable')[:args.top]:
+        label = ' '.join(str(value) for value in labels.iloc[row])
+        mix = fingerprints.getrow(row).toarray().ravel()
+        dominant = violation_names[cube.types[int(mix.argmax())]]
+        neighbours = [other for other in viola.most_similar(fingerprints, row, top=2)[0] if other != row]
+        closest = ' '.join(str(value) for value in labels.iloc[neighbours[0]]) if neighbours else '-'
+        print(f"{label:<20} {int(totals[row]):>10,}  {dominant} {mix.max():.0%}  closest: {closest}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())